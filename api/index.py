@@ -1,33 +1,39 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.server_api import ServerApi
 import sys
 import os
 import logging
 from http.server import BaseHTTPRequestHandler
-from mangum import Mangum
 import asyncio
+import atexit
+import queue
+import select
+import socket
+import threading
 import traceback
 from datetime import datetime
-from contextlib import asynccontextmanager
-from backend.app.routes import auth, users, photos, generated_images, subscriptions, training, canvas_inference, credits
+from contextlib import asynccontextmanager, AsyncExitStack
+from urllib.parse import unquote
+from backend.app.routes import auth, users, photos, generated_images, subscriptions, training, canvas_inference, credits, jobs, events
 from backend.app.config.config import settings
 from starlette.middleware.sessions import SessionMiddleware
 import secrets
-from backend.app.utils.db import get_background_db_client, close_background_client
-
-# Set up file logging
-log_file = '/tmp/api.log'
-os.makedirs(os.path.dirname(log_file), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, mode='a'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from backend.app.utils.asgi_bridge import bridge_asgi_request
+from backend.app.utils.db import get_db_client, init_db_client, close_db_client, get_db_pool_stats
+from backend.app.utils.auth import require_admin_token
+from backend.app.utils.user_cache import get_user_cache_stats
+from backend.app.utils.replicate_gateway import get_replicate_gateway_stats
+from backend.app.utils.feed_cache import get_feed_cache_stats
+from backend.app.utils.url_signing import get_url_signing_stats
+from backend.app.utils.job_queue import run_worker
+from backend.app.models.indexes import ensure_indexes
+from backend.app.utils.image_processing import shutdown_process_pool
+from backend.app.utils.s3_transfer import close_http_client
+from backend.app.utils.logging_config import configure_logging, get_logging_stats
+
+# Queue-based logging; file and stdout writes happen on the listener thread
+configure_logging()
+log_file = settings.LOG_FILE
 logger = logging.getLogger(__name__)
 
 def log_exception(e: Exception, context: str = ""):
@@ -39,12 +45,9 @@ def log_exception(e: Exception, context: str = ""):
 
 # Log startup information
 try:
-    logger.info("="*50)
     logger.info(f"Starting application at {datetime.now()}")
-    logger.info(f"Python version: {sys.version}")
-    logger.info(f"Current working directory: {os.getcwd()}")
-    logger.info(f"Directory contents: {os.listdir('.')}")
-    logger.info(f"Environment variables: {dict(os.environ)}")
+    logger.debug(f"Python version: {sys.version}")
+    logger.debug(f"Current working directory: {os.getcwd()}")
 except Exception as e:
     log_exception(e, "startup logging")
 
@@ -52,11 +55,10 @@ try:
     # Add the backend directory to Python path
     backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.append(backend_dir)
-    logger.info(f"Added {backend_dir} to Python path")
-    logger.info(f"Current Python path: {sys.path}")
+    logger.debug(f"Added {backend_dir} to Python path")
     
     from backend.app.config import settings
-    logger.info("Successfully imported backend modules")
+    logger.debug("Successfully imported backend modules")
 except Exception as e:
     log_exception(e, "backend imports")
     raise
@@ -64,10 +66,28 @@ except Exception as e:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle manager for the FastAPI app"""
-    # Startup: nothing special needed as background client is created on demand
+    # Startup: create the shared MongoDB client pool once per process
+    client = init_db_client()
+    # Index builds are idempotent; run them in the background so cold starts are not blocked
+    index_task = asyncio.create_task(ensure_indexes(client[settings.DB_NAME]))
+    worker_stop = asyncio.Event()
+    worker_task = None
+    if settings.JOB_WORKER_IN_PROCESS:
+        worker_task = asyncio.create_task(run_worker(
+            client[settings.DB_NAME],
+            concurrency=settings.JOB_WORKER_CONCURRENCY,
+            stop_event=worker_stop
+        ))
     yield
-    # Shutdown: close the background client
-    close_background_client()
+    # Shutdown: stop the in-process worker and close the shared client
+    if not index_task.done():
+        index_task.cancel()
+    if worker_task is not None:
+        worker_stop.set()
+        await worker_task
+    shutdown_process_pool()
+    await close_http_client()
+    close_db_client()
 
 # Initialize FastAPI with lifespan manager
 app = FastAPI(
@@ -102,29 +122,9 @@ app.add_middleware(
 # Dependency to inject MongoDB into requests
 @app.middleware("http")
 async def db_session_middleware(request: Request, call_next):
-    client = AsyncIOMotorClient(
-        settings.MONGODB_URI,
-        server_api=ServerApi('1'),
-        tlsAllowInvalidCertificates=True,
-        serverSelectionTimeoutMS=50000,
-        connectTimeoutMS=50000,
-        socketTimeoutMS=50000
-    )
-    
-    try:
-        # Verify the connection
-        await client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB!")
-        
-        request.state.mongodb = client[settings.DB_NAME]
-        response = await call_next(request)
-        return response
-    except Exception as e:
-        logger.error(f"MongoDB connection error: {str(e)}")
-        raise
-    finally:
-        client.close()
-        logger.info("Closed request-scoped MongoDB connection")
+    # Reuse the process-wide pooled client; connections are checked out per operation
+    request.state.mongodb = get_db_client()[settings.DB_NAME]
+    return await call_next(request)
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -135,18 +135,20 @@ app.include_router(subscriptions.router, prefix="/subscriptions", tags=["subscri
 app.include_router(training.router, prefix="/training", tags=["training"])
 app.include_router(canvas_inference.router, prefix="/canvasinference", tags=["canvasinference"])
 app.include_router(credits.router, prefix="/credits", tags=["credits"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+app.include_router(events.router, prefix="/events", tags=["events"])
 
 @app.get("/")
 async def root():
-    logger.info("Handling root request")
+    logger.debug("Handling root request")
     return {"message": "Welcome to WhatIf API"}
 
-@app.get("/debug/logs")
+@app.get("/debug/logs", dependencies=[Depends(require_admin_token)])
 async def get_logs():
     """Endpoint to retrieve application logs"""
     logger.info("Retrieving application logs")
     try:
-        if os.path.exists(log_file):
+        if log_file and os.path.exists(log_file):
             with open(log_file, 'r') as f:
                 logs = f.read()
             logger.info(f"Successfully read logs, size: {len(logs)} bytes")
@@ -158,13 +160,79 @@ async def get_logs():
         log_exception(e, "retrieving logs")
         return {"error": str(e), "traceback": traceback.format_exc()}
 
-# Create Mangum handler with custom settings
-try:
-    mangum_handler = Mangum(app, lifespan="off")
-    logger.info("Created Mangum handler successfully")
-except Exception as e:
-    log_exception(e, "creating Mangum handler")
-    raise
+@app.get("/debug/db-pool", dependencies=[Depends(require_admin_token)])
+async def get_db_pool():
+    """Endpoint to retrieve MongoDB connection pool metrics"""
+    return get_db_pool_stats()
+
+@app.get("/debug/user-cache", dependencies=[Depends(require_admin_token)])
+async def get_user_cache():
+    """Endpoint to retrieve authenticated user cache hit/miss counters"""
+    return get_user_cache_stats()
+
+@app.get("/debug/replicate", dependencies=[Depends(require_admin_token)])
+async def get_replicate_stats():
+    """Endpoint to retrieve Replicate gateway request and throttling counters"""
+    return get_replicate_gateway_stats()
+
+@app.get("/debug/feed-cache", dependencies=[Depends(require_admin_token)])
+async def get_feed_cache_debug_stats():
+    """Endpoint to retrieve public feed cache hit/miss counters"""
+    return get_feed_cache_stats()
+
+@app.get("/debug/url-signing", dependencies=[Depends(require_admin_token)])
+async def get_url_signing_debug_stats():
+    """Endpoint to retrieve signed URL cache counters"""
+    return get_url_signing_stats()
+
+@app.get("/debug/logging", dependencies=[Depends(require_admin_token)])
+async def get_logging_debug_stats():
+    """Endpoint to retrieve logging pipeline configuration and queue depth"""
+    return get_logging_stats()
+
+# Persistent event loop shared by warm invocations. Loop-bound resources
+# (Motor/httpx pools, OAuth metadata, caches) survive between requests.
+_persistent_loop = None
+_persistent_loop_lock = threading.Lock()
+_lifespan_stack = None
+
+async def _start_lifespan():
+    global _lifespan_stack
+    _lifespan_stack = AsyncExitStack()
+    await _lifespan_stack.enter_async_context(app.router.lifespan_context(app))
+
+async def _stop_lifespan():
+    if _lifespan_stack is not None:
+        await _lifespan_stack.aclose()
+
+def get_persistent_loop() -> asyncio.AbstractEventLoop:
+    """Get the module-owned event loop, starting its thread on first use"""
+    global _persistent_loop
+    if _persistent_loop is None:
+        with _persistent_loop_lock:
+            if _persistent_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="asgi-event-loop", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(_start_lifespan(), loop).result()
+                _persistent_loop = loop
+                logger.info("Started persistent event loop thread")
+    return _persistent_loop
+
+@atexit.register
+def _shutdown_persistent_loop():
+    if _persistent_loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_stop_lifespan(), _persistent_loop).result(timeout=10)
+    except Exception as e:
+        log_exception(e, "stopping persistent event loop")
+    _persistent_loop.call_soon_threadsafe(_persistent_loop.stop)
+
+# At most this many response messages are buffered between the event loop and the socket
+RESPONSE_QUEUE_SIZE = 8
+# How often the handler checks an otherwise idle connection for a client disconnect
+DISCONNECT_POLL_SECONDS = 1.0
 
 # Create Vercel handler
 class Handler(BaseHTTPRequestHandler):
@@ -177,14 +245,15 @@ class Handler(BaseHTTPRequestHandler):
             log_exception(e, "handler initialization")
             raise
 
-    def _send_cors_headers(self):
+    def _send_cors_headers(self, include_content_type: bool = True):
         try:
             logger.debug("Sending CORS headers")
             self.send_header("Access-Control-Allow-Origin", "*")
             self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
             self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
             self.send_header("Access-Control-Max-Age", "600")
-            self.send_header("Content-Type", "application/json")
+            if include_content_type:
+                self.send_header("Content-Type", "application/json")
             logger.debug("CORS headers sent successfully")
         except Exception as e:
             log_exception(e, "sending CORS headers")
@@ -192,18 +261,18 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_OPTIONS(self):
         try:
-            logger.info(f"Handling OPTIONS request to {self.path}")
+            logger.debug(f"Handling OPTIONS request to {self.path}")
             self.send_response(200)
             self._send_cors_headers()
             self.end_headers()
-            logger.info("OPTIONS request handled successfully")
+            logger.debug("OPTIONS request handled successfully")
         except Exception as e:
             log_exception(e, "handling OPTIONS request")
             raise
 
     def do_GET(self):
         try:
-            logger.info(f"Handling GET request to {self.path}")
+            logger.debug(f"Handling GET request to {self.path}")
             self._handle_request()
         except Exception as e:
             log_exception(e, "handling GET request")
@@ -211,7 +280,7 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         try:
-            logger.info(f"Handling POST request to {self.path}")
+            logger.debug(f"Handling POST request to {self.path}")
             self._handle_request()
         except Exception as e:
             log_exception(e, "handling POST request")
@@ -219,7 +288,7 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_PUT(self):
         try:
-            logger.info(f"Handling PUT request to {self.path}")
+            logger.debug(f"Handling PUT request to {self.path}")
             self._handle_request()
         except Exception as e:
             log_exception(e, "handling PUT request")
@@ -227,94 +296,123 @@ class Handler(BaseHTTPRequestHandler):
 
     def do_DELETE(self):
         try:
-            logger.info(f"Handling DELETE request to {self.path}")
+            logger.debug(f"Handling DELETE request to {self.path}")
             self._handle_request()
         except Exception as e:
             log_exception(e, "handling DELETE request")
             raise
 
+    def _write_response_message(self, message: dict):
+        """Write one ASGI response message to the client socket"""
+        if message["type"] == "http.response.start":
+            self.send_response(message["status"])
+            headers = message.get("headers", [])
+            for key, value in headers:
+                self.send_header(key.decode("latin-1"), value.decode("latin-1"))
+            has_content_type = any(key.lower() == b"content-type" for key, _ in headers)
+            self._send_cors_headers(include_content_type=not has_content_type)
+            self.end_headers()
+            self._response_started = True
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            if body:
+                self.wfile.write(body)
+
+    def _client_disconnected(self) -> bool:
+        """True once the client has closed its end of the connection"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            # A readable socket with nothing to read is at EOF
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+
+    def _run_asgi_persistent(self, scope: dict, content_length: int):
+        """Run the app on the persistent loop, writing response chunks from this thread"""
+        loop = get_persistent_loop()
+        messages = queue.Queue(maxsize=RESPONSE_QUEUE_SIZE)
+        disconnected = asyncio.Event()
+
+        async def emit(message):
+            # Blocking put in an executor gives backpressure when the client is slow
+            await asyncio.get_running_loop().run_in_executor(None, messages.put, message)
+
+        future = asyncio.run_coroutine_threadsafe(
+            bridge_asgi_request(app, scope, self.rfile.read, content_length, emit, disconnected),
+            loop
+        )
+        future.add_done_callback(lambda _: messages.put(None))
+
+        client_gone = False
+
+        def signal_disconnect():
+            nonlocal client_gone
+            client_gone = True
+            loop.call_soon_threadsafe(disconnected.set)
+
+        while True:
+            try:
+                message = messages.get(timeout=DISCONNECT_POLL_SECONDS)
+            except queue.Empty:
+                # Idle streams (SSE between events) learn about a closed socket here
+                if not client_gone and self._client_disconnected():
+                    logger.info("Client closed the connection; signalling disconnect")
+                    signal_disconnect()
+                continue
+            if message is None:
+                break
+            if client_gone:
+                # Keep draining so the app side never blocks on a full queue
+                continue
+            try:
+                self._write_response_message(message)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                logger.warning(f"Client disconnected while streaming response: {str(e)}")
+                signal_disconnect()
+        future.result()
+
     def _handle_request(self):
         request_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
-        logger.info(f"[{request_id}] ===== Starting {self.command} request to {self.path} =====")
+        logger.debug(f"[{request_id}] Starting {self.command} request to {self.path}")
         try:
             # Read request details
             content_length = int(self.headers.get("content-length", 0))
             content_type = self.headers.get("content-type", "")
             
-            # Handle multipart form data differently
-            if content_type.startswith("multipart/form-data"):
-                # For multipart/form-data, don't try to decode the body
-                body = self.rfile.read(content_length) if content_length > 0 else b""
-                is_binary = True
-                # Convert binary data to base64
-                import base64
-                body = base64.b64encode(body).decode('utf-8')
-            else:
-                # For regular requests, decode as UTF-8
-                body = self.rfile.read(content_length).decode() if content_length > 0 else ""
-                is_binary = False
-            
             path_parts = self.path.split('?', 1)
             path = path_parts[0]
             query_string = path_parts[1] if len(path_parts) > 1 else ""
             
             # Log request details
-            logger.info(f"[{request_id}] Path: {path}")
-            if not is_binary:
-                logger.info(f"[{request_id}] Body: {body}")
-            else:
-                logger.info(f"[{request_id}] Body: <binary data>")
+            logger.debug(f"[{request_id}] Body: <streamed {content_length} bytes of {content_type or 'unknown type'}>")
 
-            # Construct event for Mangum
+            # Construct ASGI scope
             raw_path = path[4:] if path.startswith('/api') else path
-            event = {
-                "version": "2.0",
-                "routeKey": f"{self.command} {raw_path}",
-                "rawPath": raw_path,
-                "rawQueryString": query_string,
-                "headers": dict(self.headers),
-                "requestContext": {
-                    "http": {
-                        "method": self.command,
-                        "path": raw_path,
-                        "protocol": "HTTP/1.1",
-                        "sourceIp": self.headers.get("x-forwarded-for", "").split(",")[0].strip(),
-                        "userAgent": self.headers.get("user-agent", "")
-                    }
-                },
-                "body": body,
-                "isBase64Encoded": is_binary
+            host, _, port = self.headers.get("host", "localhost").partition(":")
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0", "spec_version": "2.3"},
+                "http_version": "1.1",
+                "method": self.command,
+                "scheme": self.headers.get("x-forwarded-proto", "https"),
+                "path": unquote(raw_path),
+                "raw_path": raw_path.encode(),
+                "root_path": "",
+                "query_string": query_string.encode(),
+                "headers": [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in self.headers.items()],
+                "client": (self.headers.get("x-forwarded-for", "").split(",")[0].strip(), 0),
+                "server": (host, int(port) if port.isdigit() else 443)
             }
 
-            # Call the Mangum handler
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                response = mangum_handler(event, {})
-                if asyncio.iscoroutine(response):
-                    response = loop.run_until_complete(response)
-            finally:
-                loop.close()
-                asyncio.set_event_loop(None)
-
-            # Send response
-            self.send_response(response.get("statusCode", 200))
-            
-            # Send headers
-            for key, value in response.get("headers", {}).items():
-                self.send_header(key, value)
-            self._send_cors_headers()
-            self.end_headers()
-
-            # Send body
-            if "body" in response:
-                self.wfile.write(response["body"].encode())
+            # Stream the request through the ASGI app
+            self._response_started = False
+            self._run_asgi_persistent(scope, content_length)
 
         except Exception as e:
-            logger.error(f"Error handling request: {str(e)}")
-            logger.error(traceback.format_exc())
-            self.send_error(500, str(e))
+            logger.error(f"Error handling request: {str(e)}", exc_info=True)
+            # Headers may already be on the wire for a streamed response
+            if not getattr(self, "_response_started", False):
+                self.send_error(500, str(e))
 
 # Create the handler instance
 handler = Handler 
\ No newline at end of file
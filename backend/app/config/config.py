@@ -16,6 +16,13 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     MONGODB_URI: str
     DB_NAME: str = "whatif"
+
+    # MongoDB connection pool
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    MONGODB_MIN_POOL_SIZE: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
@@ -24,6 +31,43 @@ class Settings(BaseSettings):
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD", "")
+
+    # Authenticated user cache ("memory" or "redis"). Memory invalidation only reaches the
+    # instance that made the write, so others serve stale users for up to the TTL;
+    # redis is the default whenever REDIS_HOST is configured
+    USER_CACHE_BACKEND: str = os.getenv("USER_CACHE_BACKEND", "redis" if os.getenv("REDIS_HOST") else "memory")
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+
+    # Logging: LOG_LEVELS and LOG_SAMPLE_RATES take "logger.name=value" pairs separated by commas
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "WARNING" if os.getenv("ENVIRONMENT") == "production" else "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+    LOG_FILE: str = os.getenv("LOG_FILE", "/tmp/api.log")  # Empty disables the file handler
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "httpx=WARNING,pymongo=WARNING")
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+    # Records waiting for the writer thread; beyond this new records are dropped and counted
+    LOG_QUEUE_MAX_SIZE: int = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+
+    # Object URLs handed to clients: "public" (raw bucket URLs), "presigned" or "cloudfront"
+    URL_SIGNING_MODE: str = os.getenv("URL_SIGNING_MODE", "public")
+    URL_SIGNING_TTL_SECONDS: int = int(os.getenv("URL_SIGNING_TTL_SECONDS", "3600"))
+    # Cached signatures are reissued once less than this much validity remains
+    URL_SIGNING_REFRESH_MARGIN_SECONDS: int = int(os.getenv("URL_SIGNING_REFRESH_MARGIN_SECONDS", "600"))
+    URL_SIGNING_CACHE_MAX_SIZE: int = int(os.getenv("URL_SIGNING_CACHE_MAX_SIZE", "50000"))
+    # Training zips must stay readable until Replicate fetches them
+    TRAINING_INPUT_URL_TTL_SECONDS: int = int(os.getenv("TRAINING_INPUT_URL_TTL_SECONDS", "86400"))
+    CLOUDFRONT_DOMAIN: str = os.getenv("CLOUDFRONT_DOMAIN", "")
+    CLOUDFRONT_KEY_PAIR_ID: str = os.getenv("CLOUDFRONT_KEY_PAIR_ID", "")
+    CLOUDFRONT_PRIVATE_KEY: str = os.getenv("CLOUDFRONT_PRIVATE_KEY", "")
+
+    # GridFS chunk size for photo uploads (MongoDB's default is 255 KiB)
+    GRIDFS_CHUNK_SIZE_BYTES: int = int(os.getenv("GRIDFS_CHUNK_SIZE_BYTES", str(255 * 1024)))
+
+    # Precomputed public feed pages ("memory" or "redis")
+    FEED_CACHE_BACKEND: str = os.getenv("FEED_CACHE_BACKEND", "memory")
+    FEED_CACHE_TTL_SECONDS: int = int(os.getenv("FEED_CACHE_TTL_SECONDS", "300"))
+    FEED_CACHE_PAGES: int = int(os.getenv("FEED_CACHE_PAGES", "5"))
+    FEED_CACHE_PAGE_SIZE: int = int(os.getenv("FEED_CACHE_PAGE_SIZE", "20"))
     
     # API Keys and Credentials
     REPLICATE_API_TOKEN: str = ""
@@ -36,6 +80,15 @@ class Settings(BaseSettings):
     NEXT_PUBLIC_API_URL: str = os.getenv("NEXT_PUBLIC_API_URL", "http://localhost:8000")
     PORT: str = "5000"
     DEBUG: bool = False
+    # Shared secret for scheduled endpoints (sent as "Authorization: Bearer <secret>")
+    CRON_SECRET: str = os.getenv("CRON_SECRET", "")
+    # Token for stats and debug endpoints (sent as "X-Admin-Token"); they are hidden when unset
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "")
+    # Background job queue workers
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+    JOB_WORKER_IN_PROCESS: bool = os.getenv("JOB_WORKER_IN_PROCESS", "false").lower() == "true"
+    # Start draining right after enqueue; the /jobs/drain cron in vercel.json picks up anything left behind
+    JOB_DRAIN_ON_ENQUEUE: bool = os.getenv("JOB_DRAIN_ON_ENQUEUE", "true").lower() == "true"
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
 
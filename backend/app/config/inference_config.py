@@ -17,6 +17,13 @@ DEFAULT_INFERENCE_PARAMS = {
     "output_quality": 100
 }
 
+# Automated post-training inference fan-out
+AUTOMATED_INFERENCE_CONFIG = {
+    "concurrency": 4,  # Prompts processed in parallel
+    "max_attempts": 3,  # Prediction attempts per prompt
+    "base_backoff_seconds": 2  # Backoff base for retries (full jitter)
+}
+
 # Database Collections
 COLLECTION_AUTOMATED_INFERENCES = "automated_inferences"
 COLLECTION_TRAINING_RUNS = "training_runs"
@@ -47,4 +54,73 @@ S3_CONFIG = {
     "connect_timeout": 900,
     "read_timeout": 900,
     "max_pool_connections": 50
-} 
\ No newline at end of file
+}
+
+# Async S3 transfer pipeline for generated images
+S3_TRANSFER_CONFIG = {
+    "concurrency": 8,  # Images transferred in parallel per inference
+    "max_connections": 50,  # Shared HTTP pool for downloads
+    "part_size": 8 * 1024 * 1024,  # Multipart part size (S3 minimum is 5 MB)
+    "download_timeout": 60,
+    # Set on objects whose key never gets new content (outputs, variants, content-addressed datasets)
+    "immutable_cache_control": "public, max-age=31536000, immutable"
+}
+
+# Streaming training dataset zip
+TRAINING_ZIP_CONFIG = {
+    "read_chunk_size": 1024 * 1024,  # Bytes read from each upload per step
+    "compresslevel": 6,
+    # Compression per MIME type; already-compressed images are stored as-is
+    "compression": {
+        "image/jpeg": "stored",
+        "image/png": "stored",
+        "image/webp": "stored",
+        "image/heic": "stored",
+        "image/heif": "stored"
+    },
+    "default_compression": "deflated"
+}
+
+# Training image preprocessing (decode, EXIF-orient, downsize, re-encode)
+TRAINING_PREPROCESS_CONFIG = {
+    "enabled": True,
+    # Longest side after downsizing; the trainer's largest bucket
+    "max_resolution": max(int(size) for size in TRAINING_PARAMS["resolution"].split(",")),
+    "jpeg_quality": 92,
+    "workers": 2  # Processes in the preprocessing pool
+}
+
+# Gallery thumbnails and responsive widths derived from stored originals
+IMAGE_VARIANT_CONFIG = {
+    "enabled": True,
+    "widths": [320, 640, 1024],  # Never upscaled; narrower originals are re-encoded at their own width
+    "format": "WEBP",
+    "extension": "webp",
+    "content_type": "image/webp",
+    "quality": 80,
+    # On-demand renders through /canvasinference/variant and /photos/{id}?width=, per process
+    "lazy_renders_per_second": 2,
+    "lazy_render_burst": 10,
+    # A photo variant render claim older than this is assumed abandoned and can be taken over
+    "render_claim_seconds": 120
+}
+
+# Shared Replicate gateway
+REPLICATE_GATEWAY_CONFIG = {
+    "requests_per_second": 10,  # Token bucket refill rate across all Replicate calls
+    "burst": 20,  # Token bucket capacity
+    "max_connections": 20,  # Pooled HTTP connections to the Replicate API
+    "max_throttle_retries": 5,  # Retries of a 429 response before giving up
+    "throttle_backoff_seconds": 1,  # Backoff base when no Retry-After header is sent
+    "max_throttle_backoff_seconds": 30,
+    "per_model_concurrency": 4,  # Predictions in flight per model
+    "poll_interval_seconds": 1.0  # Prediction status polling while waiting for output
+}
+
+# Async (webhook-completed) canvas inference
+ASYNC_INFERENCE_CONFIG = {
+    # Status checks ask Replicate directly once a submission is older than this
+    "webhook_grace_seconds": 60,
+    # A finalizing claim older than this is assumed dead (e.g. the invocation was killed) and can be re-claimed
+    "finalizing_lease_seconds": 300
+}
@@ -0,0 +1,178 @@
+"""
+Benchmark the memory high-water mark of the Vercel handler's ASGI bridge.
+
+    python -m backend.app.dev.bridge_bench [size_mb]
+
+Sends a multipart upload of size_mb through an in-process FastAPI app, then
+downloads a body of the same size, and reports the tracemalloc peak for each:
+  - base64:    whole body read, base64-encoded into an event and decoded again,
+               response collected and base64-encoded (the original Mangum path)
+  - buffered:  whole body read and sent as one message, response collected in a
+               bytearray before writing
+  - streaming: bridge_asgi_request, as Handler uses it now
+The upload endpoint spools the body to a SpooledTemporaryFile, as the multipart
+parser does for UploadFile, and the download endpoint streams 64 KiB chunks, as
+iter_grid_out does. Request bytes are generated on read, so the client side
+holds only what the handler asks for.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from tempfile import SpooledTemporaryFile
+from ..utils.asgi_bridge import bridge_asgi_request
+import asyncio
+import base64
+import sys
+import time
+import tracemalloc
+
+BOUNDARY = b"benchboundary"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+class MultipartBody:
+    """File-like request body: one file part of `size` zero bytes, produced as it is read"""
+
+    def __init__(self, size: int):
+        self.head = (
+            b"--" + BOUNDARY + b"\r\n"
+            b'Content-Disposition: form-data; name="files"; filename="dataset.zip"\r\n'
+            b"Content-Type: application/zip\r\n\r\n"
+        )
+        self.tail = b"\r\n--" + BOUNDARY + b"--\r\n"
+        self.length = len(self.head) + size + len(self.tail)
+        self.position = 0
+
+    def read(self, size: int) -> bytearray:
+        size = min(size, self.length - self.position)
+        chunk = bytearray(size)
+        head_end = len(self.head)
+        tail_start = self.length - len(self.tail)
+        start, end = self.position, self.position + size
+        if start < head_end:
+            chunk[:min(end, head_end) - start] = self.head[start:min(end, head_end)]
+        if end > tail_start:
+            offset = max(start, tail_start)
+            chunk[offset - start:] = self.tail[offset - tail_start:]
+        self.position = end
+        return chunk
+
+def build_app(download_size: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/training/upload")
+    async def upload(request: Request):
+        received = 0
+        with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+            async for chunk in request.stream():
+                spool.write(chunk)
+                received += len(chunk)
+        return {"received": received}
+
+    @app.get("/photos/file")
+    async def download():
+        async def chunks():
+            for offset in range(0, download_size, DOWNLOAD_CHUNK_SIZE):
+                yield bytes(min(DOWNLOAD_CHUNK_SIZE, download_size - offset))
+        return StreamingResponse(chunks(), media_type="image/png")
+
+    return app
+
+def make_scope(method: str, path: str, content_length: int) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"multipart/form-data; boundary=" + BOUNDARY),
+            (b"content-length", str(content_length).encode())
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 443)
+    }
+
+class Sink:
+    """Stands in for wfile"""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+async def run_buffered(app: FastAPI, scope: dict, body: MultipartBody, sink: Sink, encode: bool):
+    data = body.read(body.length)
+    if encode:
+        # API Gateway event built by the old handler, decoded again by Mangum
+        event_body = base64.b64encode(data)
+        del data
+        data = base64.b64decode(event_body)
+        del event_body
+    sent = False
+    response = bytearray()
+
+    async def receive():
+        nonlocal sent, data
+        if not sent:
+            sent = True
+            message = {"type": "http.request", "body": data, "more_body": False}
+            data = None
+            return message
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            response.extend(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if encode:
+        # Mangum returns binary responses base64-encoded
+        sink.write(base64.b64decode(base64.b64encode(response)))
+    else:
+        sink.write(response)
+
+async def run_streaming(app: FastAPI, scope: dict, body: MultipartBody, sink: Sink):
+    async def emit(message):
+        if message["type"] == "http.response.body":
+            sink.write(message.get("body", b""))
+
+    await bridge_asgi_request(app, scope, body.read, body.length, emit)
+
+def measure(mode: str, app: FastAPI, method: str, path: str, size: int) -> tuple:
+    body = MultipartBody(size)
+    if method == "GET":
+        body.length = 0  # No request body
+    scope = make_scope(method, path, body.length)
+    sink = Sink()
+    if mode == "streaming":
+        run = run_streaming(app, scope, body, sink)
+    else:
+        run = run_buffered(app, scope, body, sink, encode=mode == "base64")
+    tracemalloc.start()
+    started = time.perf_counter()
+    asyncio.run(run)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, sink.written
+
+def bench(size_mb: int):
+    size = size_mb * 1024 * 1024
+    app = build_app(size)
+    print(f"{size_mb} MB multipart upload and {size_mb} MB streamed download, tracemalloc peak")
+    for mode in ("base64", "buffered", "streaming"):
+        for label, method, path in (("upload", "POST", "/training/upload"), ("download", "GET", "/photos/file")):
+            peak, elapsed, written = measure(mode, app, method, path, size)
+            print(
+                f"{mode:<10} {label:<9} peak {peak / 1024 / 1024:8.1f} MB  "
+                f"({peak / size:5.2f}x body)  {elapsed:6.2f} s"
+            )
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
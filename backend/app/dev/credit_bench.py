@@ -0,0 +1,118 @@
+"""
+Benchmark credit deductions as a user's ledger grows, and under contention.
+
+Run it against a local Mongo with:
+    MONGODB_URI=mongodb://localhost:27017 python -m backend.app.dev.credit_bench [deductions] [concurrency]
+
+Uses a scratch database (BENCH_DB_NAME, default whatif_credit_bench) that is
+dropped afterwards. For ledgers of 10 to 100k transactions it times:
+  - reconcile+deduct: the $group aggregation over the user's ledger before each
+                      spend, as deduct_credits did before
+  - deduct:           deduct_credits alone, the conditional $inc
+Then `concurrency` deductions race for a balance that covers half of them and
+the outcome is checked: exactly that many succeed, the rest get 402, and the
+balance matches the ledger.
+"""
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClient
+from ..models.indexes import ensure_indexes
+from ..utils.credits import calculate_balance_from_transactions, deduct_credits, reconcile_credit_balance
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+HISTORY_SIZES = [10, 100, 1000, 10000, 100000]
+INSERT_BATCH_SIZE = 10000
+
+async def create_user(db, history: int, balance: int) -> str:
+    """A user whose ledger has `history` rows summing to `balance`"""
+    user_id = ObjectId()
+    await db.users.insert_one({
+        "_id": user_id,
+        "email": f"bench-{user_id}@example.com",
+        "credits_balance": balance,
+        "last_balance_update": datetime.utcnow()
+    })
+    amounts = [1] * (history - 1) + [balance - (history - 1)]
+    for start in range(0, history, INSERT_BATCH_SIZE):
+        await db.credit_transactions.insert_many([
+            {
+                "user_id": str(user_id),
+                "amount": amount,
+                "transaction_type": "bonus",
+                "description": "credit_bench seed",
+                "created_at": datetime.utcnow()
+            }
+            for amount in amounts[start:start + INSERT_BATCH_SIZE]
+        ])
+    return str(user_id)
+
+async def time_deductions(db, user_id: str, deductions: int, reconcile: bool) -> list:
+    latencies = []
+    for _ in range(deductions):
+        started = time.perf_counter()
+        if reconcile:
+            await reconcile_credit_balance(db, user_id)
+        await deduct_credits(db, user_id, 1, "credit_bench")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+def report(name: str, history: int, latencies: list):
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    print(f"{name:<17} history {history:>6}  p50 {statistics.median(latencies):7.2f} ms  p99 {p99:7.2f} ms")
+
+async def contend(db, concurrency: int):
+    """Race `concurrency` single-credit deductions against a balance covering half of them"""
+    balance = concurrency // 2
+    user_id = await create_user(db, 1, balance)
+    outcomes = {"ok": 0, "insufficient": 0}
+
+    async def one():
+        try:
+            await deduct_credits(db, user_id, 1, "credit_bench contention")
+            outcomes["ok"] += 1
+        except HTTPException as e:
+            if e.status_code != 402:
+                raise
+            outcomes["insufficient"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"credits_balance": 1})
+    ledger = await calculate_balance_from_transactions(db, user_id)
+    consistent = outcomes["ok"] == balance and user["credits_balance"] == 0 and ledger == 0
+    print(
+        f"contention        {concurrency} deductions for {balance} credits in {elapsed * 1000:.0f} ms: "
+        f"{outcomes['ok']} ok, {outcomes['insufficient']} x 402, balance {user['credits_balance']}, "
+        f"ledger {ledger} -> {'consistent' if consistent else 'INCONSISTENT'}"
+    )
+    return consistent
+
+async def bench(uri: str, db_name: str, deductions: int, concurrency: int) -> bool:
+    client = AsyncIOMotorClient(uri)
+    db = client[db_name]
+    try:
+        await ensure_indexes(db)
+        for history in HISTORY_SIZES:
+            user_id = await create_user(db, history, history + 2 * deductions)
+            await deduct_credits(db, user_id, 1, "credit_bench warm up")
+            report("reconcile+deduct", history, await time_deductions(db, user_id, deductions, True))
+            report("deduct", history, await time_deductions(db, user_id, deductions, False))
+        return await contend(db, concurrency)
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+if __name__ == "__main__":
+    consistent = asyncio.run(bench(
+        os.getenv("MONGODB_URI", "mongodb://localhost:27017"),
+        os.getenv("BENCH_DB_NAME", "whatif_credit_bench"),
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    ))
+    sys.exit(0 if consistent else 1)
@@ -0,0 +1,141 @@
+"""
+Local fake of the Replicate HTTP API for exercising the Replicate gateway.
+
+Run it with:
+    FAKE_REPLICATE_LATENCY=5 FAKE_REPLICATE_RATE_LIMIT=20 python -m backend.app.dev.fake_replicate
+
+and point the backend at it with REPLICATE_BASE_URL=http://127.0.0.1:8765.
+
+    python -m backend.app.dev.fake_replicate bench [predictions]
+
+runs that many predictions concurrently through the gateway against a running
+fake server and prints latency percentiles and gateway stats.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from datetime import datetime
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+FAKE_LATENCY_SECONDS = float(os.getenv("FAKE_REPLICATE_LATENCY", "2"))
+FAKE_RATE_LIMIT = float(os.getenv("FAKE_REPLICATE_RATE_LIMIT", "0"))  # Requests per second, 0 disables
+FAKE_FAILURE_RATE = float(os.getenv("FAKE_REPLICATE_FAILURE_RATE", "0"))
+FAKE_PORT = int(os.getenv("FAKE_REPLICATE_PORT", "8765"))
+
+app = FastAPI(title="Fake Replicate")
+
+_jobs = {}
+_window = {"started": time.monotonic(), "count": 0}
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    if FAKE_RATE_LIMIT:
+        now = time.monotonic()
+        if now - _window["started"] >= 1:
+            _window["started"] = now
+            _window["count"] = 0
+        _window["count"] += 1
+        if _window["count"] > FAKE_RATE_LIMIT:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Request was throttled."},
+                headers={"Retry-After": "1"}
+            )
+    return await call_next(request)
+
+def _job(kind: str, model: str, version: str, body: dict) -> dict:
+    job_id = uuid.uuid4().hex
+    _jobs[job_id] = {
+        "id": job_id,
+        "model": model,
+        "version": version,
+        "input": body.get("input"),
+        "destination": body.get("destination"),
+        "created_at": datetime.utcnow().isoformat(),
+        "_kind": kind,
+        "_ready_at": time.monotonic() + FAKE_LATENCY_SECONDS,
+        "_fails": (hash(job_id) % 1000) / 1000 < FAKE_FAILURE_RATE
+    }
+    return _render(_jobs[job_id])
+
+def _render(job: dict) -> dict:
+    done = time.monotonic() >= job["_ready_at"]
+    status = "starting"
+    output = None
+    error = None
+    if done and job["_fails"]:
+        status, error = "failed", "Fake failure"
+    elif done and job["_kind"] == "prediction":
+        num_outputs = (job["input"] or {}).get("num_outputs", 1)
+        status, output = "succeeded", [f"https://example.com/{job['id']}/{i}.png" for i in range(num_outputs)]
+    elif done:
+        status, output = "succeeded", {"version": uuid.uuid4().hex, "weights": f"https://example.com/{job['id']}.tar"}
+    return {
+        **{k: v for k, v in job.items() if not k.startswith("_")},
+        "status": status,
+        "output": output,
+        "error": error,
+        "logs": "",
+        "metrics": {},
+        "urls": {}
+    }
+
+@app.post("/v1/predictions")
+async def create_prediction(request: Request):
+    body = await request.json()
+    return JSONResponse(status_code=201, content=_job("prediction", "", body["version"], body))
+
+@app.post("/v1/models/{owner}/{name}/predictions")
+async def create_model_prediction(owner: str, name: str, request: Request):
+    body = await request.json()
+    return JSONResponse(status_code=201, content=_job("prediction", f"{owner}/{name}", "", body))
+
+@app.get("/v1/predictions/{prediction_id}")
+async def get_prediction(prediction_id: str):
+    return _render(_jobs[prediction_id])
+
+@app.post("/v1/models/{owner}/{name}/versions/{version}/trainings")
+async def create_training(owner: str, name: str, version: str, request: Request):
+    body = await request.json()
+    return JSONResponse(status_code=201, content=_job("training", f"{owner}/{name}", version, body))
+
+@app.get("/v1/trainings/{training_id}")
+async def get_training(training_id: str):
+    return _render(_jobs[training_id])
+
+@app.post("/v1/models")
+async def create_model(request: Request):
+    body = await request.json()
+    return JSONResponse(status_code=201, content={
+        "url": f"https://replicate.com/{body['owner']}/{body['name']}",
+        "owner": body["owner"],
+        "name": body["name"],
+        "visibility": body.get("visibility", "private"),
+        "run_count": 0
+    })
+
+async def bench(predictions: int):
+    from ..utils.replicate_gateway import get_replicate_gateway, get_replicate_gateway_stats
+
+    async def one(i: int) -> float:
+        started = time.monotonic()
+        await get_replicate_gateway().run("fake/model", {"prompt": f"bench {i}", "num_outputs": 1})
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    latencies = sorted(await asyncio.gather(*(one(i) for i in range(predictions))))
+    wall = time.monotonic() - started
+    print(f"{predictions} predictions in {wall:.2f}s")
+    for pct in (50, 90, 99):
+        print(f"p{pct}: {latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]:.2f}s")
+    print(get_replicate_gateway_stats())
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        asyncio.run(bench(int(sys.argv[2]) if len(sys.argv) > 2 else 50))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="127.0.0.1", port=FAKE_PORT)
@@ -0,0 +1,112 @@
+"""
+Index advisor: explains the query shapes used by the routes and flags collection scans.
+
+Run it against a local Mongo with:
+    MONGODB_URI=mongodb://localhost:27017 python -m backend.app.dev.index_advisor [--apply]
+
+--apply creates the indexes from models/indexes.py first, which is how to check
+that INDEX_SPECS covers every query. Exits non-zero when any query scans a collection.
+"""
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import MongoClient
+import asyncio
+import os
+import sys
+
+SAMPLE_USER_ID = "000000000000000000000000"
+SAMPLE_CREATED_AT = datetime.utcnow() - timedelta(days=1)
+SAMPLE_CURSOR = {"$or": [
+    {"created_at": {"$lt": SAMPLE_CREATED_AT}},
+    {"created_at": SAMPLE_CREATED_AT, "_id": {"$lt": ObjectId()}}
+]}
+
+# (route or caller, collection, filter, sort)
+ROUTE_QUERIES = [
+    ("auth: get_current_user", "users", {"email": "user@example.com"}, None),
+    ("credits: get_user_credits", "users", {"_id": ObjectId()}, None),
+    ("training: training-status/{id}", "training_runs", {"training_id": "sample"}, None),
+    ("training: poll-training-runs", "training_runs", {"status": "training", "_id": {"$gt": ObjectId()}}, [("_id", 1)]),
+    ("training: training-runs", "training_runs", {"user_id": SAMPLE_USER_ID}, [("created_at", -1)]),
+    ("events: active_runs_snapshot", "training_runs",
+     {"user_id": {"$in": [SAMPLE_USER_ID, ObjectId(SAMPLE_USER_ID)]}, "status": {"$nin": ["completed", "failed"]}},
+     [("created_at", -1)]),
+    ("canvasinference: inferences", "inference_runs",
+     {"$and": [{"user_id": {"$in": [SAMPLE_USER_ID, ObjectId(SAMPLE_USER_ID)]}}, SAMPLE_CURSOR]},
+     [("created_at", -1), ("_id", -1)]),
+    ("events: active_runs_snapshot", "inference_runs",
+     {"user_id": {"$in": [SAMPLE_USER_ID, ObjectId(SAMPLE_USER_ID)]}, "status": {"$nin": ["completed", "failed"]}},
+     [("created_at", -1)]),
+    ("prompt_inferences: resume", "inference_runs", {"training_id": "sample", "status": "completed"}, None),
+    ("canvasinference: feed", "feed", {}, [("created_at", -1), ("_id", -1)]),
+    ("canvasinference: feed (next page)", "feed", SAMPLE_CURSOR, [("created_at", -1), ("_id", -1)]),
+    ("credits: transactions", "credit_transactions", {"user_id": SAMPLE_USER_ID}, [("created_at", -1)]),
+    ("credits: payments", "payments", {"user_id": SAMPLE_USER_ID}, [("created_at", -1)]),
+    ("credits: verify-payment", "payments", {"transaction_id": "order_sample"}, None),
+    ("jobs: claim_job", "jobs", {"status": "queued", "run_after": {"$lte": datetime.utcnow()}}, [("run_after", 1)]),
+    ("jobs: claim_job (expired lease)", "jobs", {"status": "running", "lease_expires_at": {"$lte": datetime.utcnow()}}, None),
+    ("training: dataset overlap", "training_datasets", {"user_id": SAMPLE_USER_ID, "image_hashes": {"$in": ["sample"]}}, None),
+    ("photos: list", "photos", {"user_id": SAMPLE_USER_ID}, None),
+    ("generated-images: list", "user_images", {"user_id": SAMPLE_USER_ID}, None)
+]
+
+def plan_stages(plan: dict) -> list:
+    """Flatten an explain plan tree into its stage names"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return [stage for stage in stages if stage]
+
+def plan_indexes(plan: dict) -> list:
+    names = [plan["indexName"]] if "indexName" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            names.extend(plan_indexes(plan[key]))
+    for child in plan.get("inputStages", []):
+        names.extend(plan_indexes(child))
+    return names
+
+def advise(db) -> int:
+    """Explain every route query and print its plan; returns the number of collection scans"""
+    scans = 0
+    for route, collection, query, sort in ROUTE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = plan_stages(plan)
+        if "COLLSCAN" in stages:
+            scans += 1
+            verdict = "COLLSCAN"
+        elif "SORT" in stages:
+            verdict = "IN-MEMORY SORT"
+        else:
+            verdict = "ok"
+        indexes = ", ".join(plan_indexes(plan)) or "-"
+        print(f"{verdict:<15} {collection:<20} {route:<40} index: {indexes}")
+    return scans
+
+async def apply_indexes(uri: str, db_name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from ..models.indexes import ensure_indexes
+    client = AsyncIOMotorClient(uri)
+    try:
+        await ensure_indexes(client[db_name])
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+    db_name = os.getenv("DB_NAME", "whatif")
+    if "--apply" in sys.argv:
+        asyncio.run(apply_indexes(uri, db_name))
+    client = MongoClient(uri)
+    try:
+        scans = advise(client[db_name])
+    finally:
+        client.close()
+    print(f"{scans} of {len(ROUTE_QUERIES)} queries scan a collection")
+    sys.exit(1 if scans else 0)
@@ -0,0 +1,130 @@
+"""
+Benchmark per-request latency overhead of logging.
+
+    python -m backend.app.dev.logging_bench [requests] [concurrency]
+
+Drives an in-process FastAPI app whose endpoint logs like create_inference did
+(a header, every request field, every model parameter). It compares:
+  - sync:    FileHandler + StreamHandler on the event loop (the old setup)
+  - queue:   the same handlers behind NonBlockingQueueHandler/QueueListener,
+             on a queue bounded like configure_logging's (LOG_QUEUE_MAX_SIZE)
+  - queue+debug: the queue pipeline with request bodies demoted to debug
+Handlers write to files under /tmp so the terminal is not flooded. Queue modes
+also report how many records were dropped because the queue was full.
+"""
+from logging.handlers import QueueListener
+from fastapi import FastAPI, Request
+from ..config.config import settings
+from ..utils.logging_config import JsonFormatter, NonBlockingQueueHandler
+import asyncio
+import httpx
+import logging
+import queue
+import statistics
+import sys
+import time
+
+REQUEST_BODY = {
+    "prompt": "a watercolor painting of a lighthouse at dusk, " * 4,
+    "model_id": "user/model:version",
+    "num_outputs": 4,
+    "guidance_scale": 3.0,
+    "prompt_strength": 0.96,
+    "num_inference_steps": 41,
+    "output_quality": 100,
+    "aspect_ratio": "1:1",
+    "extra_lora_scale": 0.8,
+    "go_fast": False
+}
+
+logger = logging.getLogger("logging_bench")
+
+def build_app(verbose: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/inference")
+    async def inference(request: Request):
+        data = await request.json()
+        if verbose:
+            logger.info("=== Frontend Request Data ===")
+            for key, value in data.items():
+                logger.info(f"  {key}: {value}")
+            logger.info("=== Parameters Being Sent to Model ===")
+            for key, value in data.items():
+                logger.info(f"  {key}: {value}")
+        else:
+            logger.debug(f"Inference request data: {data}")
+        logger.info(f"Inference requested with model {data['model_id']}")
+        await asyncio.sleep(0)
+        logger.info("Created inference record")
+        return {"status": "success"}
+
+    return app
+
+def file_handlers() -> list:
+    handlers = [
+        logging.FileHandler("/tmp/logging_bench_file.log", mode="w"),
+        logging.StreamHandler(open("/tmp/logging_bench_stdout.log", "w"))
+    ]
+    for handler in handlers:
+        handler.setFormatter(JsonFormatter())
+    return handlers
+
+def install(mode: str):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    if mode == "sync":
+        for handler in file_handlers():
+            root.addHandler(handler)
+        return None, None
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    root.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *file_handlers())
+    listener.start()
+    return listener, queue_handler
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/inference", json=REQUEST_BODY)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+def report(name: str, latencies: list, elapsed: float, queue_handler):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    dropped = f"  dropped {queue_handler.dropped}" if queue_handler is not None else ""
+    print(
+        f"{name:<12} p50 {statistics.median(latencies):6.2f} ms  p99 {p99:6.2f} ms  "
+        f"throughput {len(latencies) / elapsed:7.0f} req/s{dropped}"
+    )
+
+def bench(requests: int, concurrency: int):
+    for name, mode, verbose in [("none", None, True), ("sync", "sync", True), ("queue", "queue", True), ("queue+debug", "queue", False)]:
+        listener, queue_handler = install(mode) if mode else (None, None)
+        if mode is None:
+            logging.getLogger().setLevel(logging.CRITICAL)
+        app = build_app(verbose)
+        asyncio.run(run(app, 50, concurrency))  # Warm up
+        started = time.perf_counter()
+        latencies = asyncio.run(run(app, requests, concurrency))
+        elapsed = time.perf_counter() - started
+        if listener is not None:
+            listener.stop()
+        report(name, latencies, elapsed, queue_handler)
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    )
@@ -0,0 +1,174 @@
+"""
+Benchmark warm Vercel invocations with a fresh event loop per request vs the persistent loop.
+
+    MONGODB_URI=mongodb://localhost:27017 python -m backend.app.dev.loop_bench [requests] [handshake_ms]
+
+Serves the real app through api.index.Handler on a local HTTPServer and sends
+requests one after another, as on a warm instance. Two bench routes are added
+to the app:
+  - /dev/loop-bench/fetch:  one GET through s3_transfer.get_http_client() to a
+                            local origin that charges handshake_ms per new
+                            connection (TLS to a remote host) and QUERY_MS per
+                            request; the pooled client is bound to its loop
+  - /dev/loop-bench/stream: STREAM_CHUNKS chunks of 64 KB, more than the
+                            handler's RESPONSE_QUEUE_SIZE, so the queue handoff
+                            to the socket thread applies backpressure
+Modes:
+  - fresh loop:  bridge_asgi_request on a new loop per request with no lifespan,
+                 as Handler did before
+  - persistent:  the unmodified Handler; its first request starts the loop
+                 thread and runs lifespan startup, reported as "cold"
+Mongo is not queried by the bench routes, but lifespan startup builds the client.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from fastapi.responses import StreamingResponse
+import asyncio
+import http.client
+import logging
+import statistics
+import sys
+import threading
+import time
+
+QUERY_MS = 1.0
+STREAM_CHUNKS = 32
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def start_origin(handshake_ms: float) -> tuple:
+    """Keep-alive HTTP origin; returns its URL and a dict counting connections opened"""
+    counters = {"connections": 0}
+
+    class OriginHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; don't let Nagle hold the body for an ACK
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            counters["connections"] += 1
+            self.handshake_pending = True
+
+        def do_GET(self):
+            if self.handshake_pending:
+                time.sleep(handshake_ms / 1000)
+                self.handshake_pending = False
+            time.sleep(QUERY_MS / 1000)
+            body = b'{"_id": "bench_user", "credits": 10}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="origin", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/users/bench_user", counters
+
+def add_bench_routes(app, origin_url: str):
+    from backend.app.utils.s3_transfer import get_http_client
+
+    @app.get("/dev/loop-bench/fetch")
+    async def fetch():
+        response = await get_http_client().get(origin_url)
+        response.raise_for_status()
+        return {"status": "success"}
+
+    @app.get("/dev/loop-bench/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(STREAM_CHUNKS):
+                yield b"x" * STREAM_CHUNK_SIZE
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+def build_handlers():
+    from api.index import Handler, app
+    from backend.app.utils.asgi_bridge import bridge_asgi_request
+
+    class QuietHandler(Handler):
+        def log_message(self, *args):
+            pass
+
+    class FreshLoopHandler(QuietHandler):
+        """The old dispatch: a new loop per request, no lifespan, writes straight from the loop"""
+
+        def _run_asgi_persistent(self, scope: dict, content_length: int):
+            async def emit(message):
+                self._write_response_message(message)
+
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(bridge_asgi_request(app, scope, self.rfile.read, content_length, emit))
+            finally:
+                loop.close()
+
+    return app, QuietHandler, FreshLoopHandler
+
+def start_server(handler_class) -> HTTPServer:
+    server = HTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, name="handler", daemon=True).start()
+    return server
+
+def get(server: HTTPServer, path: str) -> float:
+    """One request on a new connection, as Vercel forwards them; returns milliseconds"""
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+    try:
+        connection.request("GET", f"/api{path}")
+        response = connection.getresponse()
+        body = response.read()
+        assert response.status == 200, (response.status, body[:200])
+    finally:
+        connection.close()
+    return (time.perf_counter() - started) * 1000
+
+def report(name: str, latencies: list, elapsed: float, connections: int = None):
+    latencies = sorted(latencies)
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    opened = f"  origin connections {connections}" if connections is not None else ""
+    print(
+        f"{name:<20} {len(latencies) / elapsed:7.0f} req/s  p50 {statistics.median(latencies):6.2f} ms  "
+        f"p99 {p99:6.2f} ms{opened}"
+    )
+
+def measure(name: str, server: HTTPServer, path: str, requests: int, counters: dict = None):
+    connections = counters["connections"] if counters else None
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        latencies.append(get(server, path))
+    elapsed = time.perf_counter() - started
+    report(name, latencies, elapsed, counters["connections"] - connections if counters else None)
+
+def bench(requests: int, handshake_ms: float):
+    origin_url, counters = start_origin(handshake_ms)
+    app, handler, fresh_loop_handler = build_handlers()
+    add_bench_routes(app, origin_url)
+    # The handler logs every request at info; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+    print(
+        f"{requests} sequential requests, handshake {handshake_ms:.0f} ms, query {QUERY_MS:.0f} ms, "
+        f"stream {STREAM_CHUNKS} x {STREAM_CHUNK_SIZE // 1024} KB"
+    )
+
+    fresh = start_server(fresh_loop_handler)
+    get(fresh, "/dev/loop-bench/fetch")  # Warm up imports and route compilation
+    measure("fresh loop  fetch", fresh, "/dev/loop-bench/fetch", requests, counters)
+    measure("fresh loop  stream", fresh, "/dev/loop-bench/stream", requests)
+    fresh.shutdown()
+
+    persistent = start_server(handler)
+    cold = get(persistent, "/dev/loop-bench/fetch")
+    print(f"{'persistent  cold':<20} first request {cold:6.2f} ms (loop thread, lifespan startup, first connection)")
+    measure("persistent  fetch", persistent, "/dev/loop-bench/fetch", requests, counters)
+    measure("persistent  stream", persistent, "/dev/loop-bench/stream", requests)
+    persistent.shutdown()
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    )
@@ -0,0 +1,125 @@
+"""
+Benchmark persisting one inference's generated images to S3.
+
+    python -m backend.app.dev.s3_bench [num_outputs] [image_kb] [download_ms]
+
+Needs moto (pip install "moto[server]"), which runs a local S3 stand-in; a
+local HTTP server stands in for Replicate's output CDN and waits download_ms
+before each response. It compares:
+  - sequential: blocking requests.get + upload_fileobj per image, as
+                store_images_to_s3 did before
+  - pipeline:   s3_transfer.store_images_to_s3
+and reports the total time and the longest event loop stall while it ran.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import asyncio
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_s3_stand_in() -> str:
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = free_port()
+    ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False).start()
+    return f"http://127.0.0.1:{port}"
+
+def start_origin(image_size: int, download_ms: float) -> str:
+    """Serve `image_size` bytes per GET after `download_ms`, like a Replicate output URL"""
+    body = os.urandom(image_size)
+
+    class OriginHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(download_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            for offset in range(0, len(body), 64 * 1024):
+                self.wfile.write(body[offset:offset + 64 * 1024])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    threading.Thread(target=server.serve_forever, name="origin", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+async def store_sequentially(urls: list, user_id: str, inference_id: str) -> list:
+    """The old store_images_to_s3: blocking calls, one image at a time, on the event loop"""
+    import requests
+    from ..config.inference_config import S3_BUCKET_NAME
+    from ..utils.s3_transfer import s3_client, s3_url_for_key
+    s3_urls = []
+    for i, url in enumerate(urls):
+        response = requests.get(url)
+        response.raise_for_status()
+        key = f"inference_data/{user_id}/{inference_id}/image_{i}.png"
+        s3_client.upload_fileobj(BytesIO(response.content), S3_BUCKET_NAME, key, ExtraArgs={"ContentType": "image/png"})
+        s3_urls.append(s3_url_for_key(key))
+    return s3_urls
+
+async def measure(name: str, store, urls: list):
+    """Run one persistence pass while a ticker records the longest event loop stall"""
+    longest_stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal longest_stall
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            longest_stall = max(longest_stall, time.perf_counter() - started - 0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)  # Let the ticker start its first sleep
+    started = time.perf_counter()
+    stored = await store(urls, "bench_user", f"{name}_{time.time_ns()}")
+    elapsed = time.perf_counter() - started
+    running = False
+    await ticker_task
+    print(
+        f"{name:<11} {len(stored)}/{len(urls)} stored in {elapsed * 1000:7.0f} ms  "
+        f"longest loop stall {longest_stall * 1000:6.0f} ms"
+    )
+    return elapsed
+
+def bench(num_outputs: int, image_kb: int, download_ms: float):
+    os.environ["AWS_ENDPOINT_URL_S3"] = start_s3_stand_in()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    # Imported after the endpoint is set, since the shared client is built at import time
+    from ..config.inference_config import S3_BUCKET_NAME, S3_TRANSFER_CONFIG
+    from ..utils.s3_transfer import s3_client, store_images_to_s3
+    s3_client.create_bucket(Bucket=S3_BUCKET_NAME)
+
+    origin = start_origin(image_kb * 1024, download_ms)
+    urls = [f"{origin}/output_{index}.png" for index in range(num_outputs)]
+    print(
+        f"{num_outputs} outputs of {image_kb} KB, {download_ms:.0f} ms per download, "
+        f"pipeline concurrency {S3_TRANSFER_CONFIG['concurrency']}"
+    )
+
+    async def run():
+        await store_images_to_s3(urls[:1], "bench_user", "warm_up")
+        sequential = await measure("sequential", store_sequentially, urls)
+        pipeline = await measure("pipeline", store_images_to_s3, urls)
+        print(f"speedup {sequential / pipeline:.1f}x")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1536,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 200.0
+    )
@@ -0,0 +1,47 @@
+"""
+Benchmark URL signing for a gallery page load.
+
+    URL_SIGNING_MODE=presigned python -m backend.app.dev.signing_bench [pages]
+
+Signs the output URLs of a page of 20 inferences x 10 images, first cold and
+then as repeated page loads served from the signature cache.
+"""
+from ..config import settings
+from ..utils.s3_transfer import s3_url_for_key
+from ..utils import url_signing
+import sys
+import time
+
+INFERENCES_PER_PAGE = 20
+IMAGES_PER_INFERENCE = 10
+
+def page_urls() -> list:
+    return [
+        s3_url_for_key(f"inference_data/bench_user/inference_{run}/image_{index}.png")
+        for run in range(INFERENCES_PER_PAGE)
+        for index in range(IMAGES_PER_INFERENCE)
+    ]
+
+def bench(pages: int):
+    if settings.URL_SIGNING_MODE == "public":
+        print("URL_SIGNING_MODE is public; set it to presigned or cloudfront to benchmark signing")
+        return
+    urls = page_urls()
+
+    started = time.perf_counter()
+    for url in urls:
+        url_signing.sign_key(url_signing.s3_key_for_url(url))
+    cold = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(pages):
+        url_signing.sign_urls(urls)
+    warm = time.perf_counter() - started
+
+    print(f"Mode: {settings.URL_SIGNING_MODE}")
+    print(f"Cold page ({len(urls)} signatures): {cold * 1000:.1f} ms, {len(urls) / cold:,.0f} signatures/s")
+    print(f"Cached pages: {warm / pages * 1000:.2f} ms/page over {pages} pages, {len(urls) * pages / warm:,.0f} URLs/s")
+    print(url_signing.get_url_signing_stats())
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,138 @@
+"""
+Benchmark a chunked training upload through the real upload routes.
+
+Run it against a local Mongo with:
+    MONGODB_URI=mongodb://localhost:27017 python -m backend.app.dev.upload_bench [files] [total_mb]
+
+Needs moto (pip install "moto[server]") for a local S3 stand-in. Session state
+goes to a scratch database (BENCH_DB_NAME, default whatif_upload_bench) that is
+dropped afterwards. The client sends 2 MB chunks, 4 in flight, as chunkUpload.ts
+does, and drops every tenth chunk on the first pass. It then resumes from
+/training/upload-status, which also measures the resume path. The training step
+is replaced by building the dataset zip from the stored chunks, so Replicate is
+never called. Reports chunks/sec for ingest, the resume and zip times, and the total.
+"""
+from fastapi import FastAPI
+from motor.motor_asyncio import AsyncIOMotorClient
+from .s3_bench import start_s3_stand_in
+import asyncio
+import httpx
+import os
+import sys
+import time
+
+CHUNK_SIZE = 2048 * 1024
+UPLOAD_CONCURRENCY = 4
+DROP_EVERY = 10
+BENCH_USER = {"_id": "bench_user", "email": "bench@example.com"}
+
+async def upload_chunks(client: httpx.AsyncClient, upload_id: str, chunks: list, file_data: bytes) -> int:
+    """Send (file_index, chunk_index, total_chunks) chunks with bounded concurrency; returns bytes sent"""
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def send(file_index: int, chunk_index: int, total_chunks: int):
+        start = chunk_index * CHUNK_SIZE
+        async with semaphore:
+            response = await client.post(
+                f"/training/upload-chunk/{upload_id}",
+                params={
+                    "chunk_index": chunk_index,
+                    "total_chunks": total_chunks,
+                    "file_index": file_index,
+                    "filename": f"image_{file_index}.jpg"
+                },
+                files={"file": ("blob", file_data[start:start + CHUNK_SIZE], "application/octet-stream")}
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*(send(*chunk) for chunk in chunks))
+    return sum(len(file_data[chunk_index * CHUNK_SIZE:(chunk_index + 1) * CHUNK_SIZE]) for _, chunk_index, _ in chunks)
+
+def bench(file_count: int, total_mb: int):
+    os.environ["AWS_ENDPOINT_URL_S3"] = start_s3_stand_in()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    # Imported after the endpoint is set, since the shared S3 client is built at import time
+    from ..config.inference_config import S3_BUCKET_NAME
+    from ..dependencies import get_db
+    from ..routes import training
+    from ..utils.auth import get_current_user
+    from ..utils.s3_transfer import s3_client
+    from ..utils.training_data import stream_zip_to_s3
+    s3_client.create_bucket(Bucket=S3_BUCKET_NAME)
+
+    file_size = total_mb * 1024 * 1024 // file_count
+    file_data = os.urandom(file_size)
+    total_chunks = -(-file_size // CHUNK_SIZE)
+    all_chunks = [(file_index, chunk_index, total_chunks) for file_index in range(file_count) for chunk_index in range(total_chunks)]
+    first_pass = [chunk for position, chunk in enumerate(all_chunks) if position % DROP_EVERY != DROP_EVERY - 1]
+
+    async def run():
+        mongo = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+        db = mongo[os.getenv("BENCH_DB_NAME", "whatif_upload_bench")]
+        assembled = asyncio.get_running_loop().create_future()
+
+        async def assemble_dataset(upload_id, model_name, current_user, db, background_tasks):
+            # Stands in for process_completed_upload: build the zip, skip training
+            try:
+                session = await db[training.UPLOAD_SESSIONS_COLLECTION].find_one({"_id": upload_id})
+                dataset_files = training.upload_session_dataset(session)
+                assembled.set_result(await stream_zip_to_s3(dataset_files, f"training_data/bench/{upload_id}.zip"))
+            except Exception as e:
+                assembled.set_exception(e)
+
+        training.process_completed_upload = assemble_dataset
+        app = FastAPI()
+        app.include_router(training.router, prefix="/training")
+        app.dependency_overrides[get_current_user] = lambda: BENCH_USER
+        app.dependency_overrides[get_db] = lambda: db
+
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                started = time.perf_counter()
+                response = await client.post("/training/init-upload", params={
+                    "file_count": file_count,
+                    "total_size": file_size * file_count,
+                    "model_name": "bench"
+                })
+                response.raise_for_status()
+                upload_id = response.json()["upload_id"]
+
+                ingest_started = time.perf_counter()
+                sent_bytes = await upload_chunks(client, upload_id, first_pass, file_data)
+                ingest = time.perf_counter() - ingest_started
+
+                resume_started = time.perf_counter()
+                status = (await client.get(f"/training/upload-status/{upload_id}")).json()
+                received = {
+                    (int(file_index), chunk_index)
+                    for file_index, file_state in status["files"].items()
+                    for chunk_index in file_state["received_chunks"]
+                }
+                missing = [chunk for chunk in all_chunks if chunk[:2] not in received]
+                await upload_chunks(client, upload_id, missing, file_data)
+                resume = time.perf_counter() - resume_started
+
+                stats = await assembled
+                total = time.perf_counter() - started
+        finally:
+            await mongo.drop_database(db.name)
+            mongo.close()
+
+        print(f"{file_count} files, {file_size * file_count / 1024 / 1024:.0f} MB, {len(all_chunks)} chunks of 2 MB")
+        print(
+            f"ingest   {len(first_pass)} chunks in {ingest:6.2f} s  {len(first_pass) / ingest:6.1f} chunks/s  "
+            f"{sent_bytes / ingest / 1024 / 1024:6.1f} MB/s"
+        )
+        print(f"resume   status + {len(missing)} missing chunks in {resume:6.2f} s")
+        print(f"zip      {stats['num_files']} files, {stats['zip_bytes'] / 1024 / 1024:.0f} MB in {stats['seconds']:6.2f} s")
+        print(f"total    {total:6.2f} s")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    )
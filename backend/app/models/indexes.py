@@ -1,38 +1,75 @@
-from typing import List, Dict, Any
+from typing import List, Dict
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+import logging
 
-async def ensure_indexes(db: AsyncIOMotorDatabase):
-    """Ensures all required indexes exist in the database"""
-    
-    # Payments indexes
-    await db.payments.create_index([
-        ("user_id", 1),
-        ("created_at", -1)
-    ])
-    await db.payments.create_index([
-        ("transaction_id", 1)
-    ], unique=True)
-    await db.payments.create_index([
-        ("status", 1),
-        ("created_at", -1)
-    ])
+logger = logging.getLogger(__name__)
 
-    # Credit transactions indexes
-    await db.credit_transactions.create_index([
-        ("user_id", 1),
-        ("created_at", -1)
-    ])
-    await db.credit_transactions.create_index([
-        ("run_id", 1)
-    ])
-    await db.credit_transactions.create_index([
-        ("transaction_type", 1),
-        ("created_at", -1)
-    ])
+# Declarative index specs per collection, created at application startup
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    # Every authenticated request resolves the user by email
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True)
+    ],
+    "payments": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("transaction_id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)])
+    ],
+    "credit_transactions": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("run_id", ASCENDING)]),
+        IndexModel([("transaction_type", ASCENDING), ("created_at", DESCENDING)]),
+        # Compound index for credit balance calculation
+        IndexModel([("user_id", ASCENDING), ("transaction_type", ASCENDING), ("created_at", DESCENDING)])
+    ],
+    # Background job queue
+    "jobs": [
+        IndexModel([("idempotency_key", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("run_after", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    ],
+    # Chunked upload sessions expire once abandoned
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    ],
+    # Content-addressed training datasets
+    "training_datasets": [
+        IndexModel([("user_id", ASCENDING), ("image_hashes", ASCENDING)])
+    ],
+    # Status lookups by Replicate id, the polling sweep and per-user listings
+    "training_runs": [
+        IndexModel([("training_id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    ],
+    # Keyset pagination of galleries, and resuming automated inferences for a training
+    "inference_runs": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("training_id", ASCENDING), ("status", ASCENDING)])
+    ],
+    "feed": [
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])
+    ],
+    "photos": [
+        IndexModel([("user_id", ASCENDING)])
+    ],
+    "user_images": [
+        IndexModel([("user_id", ASCENDING)])
+    ]
+}
 
-    # Compound index for credit balance calculation
-    await db.credit_transactions.create_index([
-        ("user_id", 1),
-        ("transaction_type", 1),
-        ("created_at", -1)
-    ]) 
\ No newline at end of file
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict[str, List[str]]:
+    """
+    Ensures all required indexes exist in the database.
+    A failure on one collection (e.g. duplicate emails blocking a unique index)
+    is logged and does not stop the others. Returns index names per collection.
+    """
+    created = {}
+    for collection, indexes in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except Exception as e:
+            logger.error(f"Failed to ensure indexes on {collection}: {str(e)}")
+    logger.info(f"Ensured indexes on {len(created)}/{len(INDEX_SPECS)} collections")
+    return created
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel, Field
 from bson import ObjectId
 from typing_extensions import Annotated
@@ -21,8 +21,12 @@ class PhotoInDB(PhotoBase):
 
     id: PyObjectId = Field(default_factory=ObjectId, alias="_id")
     file_id: PyObjectId
+    sha256: Optional[str] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
 
 class PhotoResponse(PhotoBase):
     id: str = Field(alias="_id")
-    uploaded_at: datetime 
\ No newline at end of file
+    sha256: Optional[str] = None
+    uploaded_at: datetime
+    # Width -> URL of a resized WebP, generated on first request
+    variant_urls: Dict[str, str] = {} 
\ No newline at end of file
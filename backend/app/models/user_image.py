@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel, Field
 from bson import ObjectId
 from typing_extensions import Annotated
@@ -24,4 +24,6 @@ class UserImageInDB(UserImageBase):
 
 class UserImageResponse(UserImageBase):
     id: str = Field(alias="_id")
-    created_at: datetime 
\ No newline at end of file
+    created_at: datetime
+    # Width -> URL per entry of image_urls; empty for images outside our bucket
+    image_variants: List[Dict[str, str]] = [] 
\ No newline at end of file
@@ -6,3 +6,5 @@ from . import subscriptions
 from . import training
 from . import canvas_inference
 from . import credits
+from . import jobs
+from . import events
@@ -23,8 +23,6 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 
-# Set up logging with a higher level for production
-logging.basicConfig(level=logging.WARNING if settings.ENVIRONMENT == "production" else logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create a singleton Fernet key instance
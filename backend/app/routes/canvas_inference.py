@@ -1,32 +1,33 @@
-from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import RedirectResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ReturnDocument
 from bson import ObjectId
-import replicate
-import os
 import logging
-import boto3
-import requests
-from io import BytesIO
 from ..utils.auth import get_current_user
-from ..dependencies import get_db
 from ..config import settings
+from ..config.inference_config import ASYNC_INFERENCE_CONFIG, IMAGE_VARIANT_CONFIG
+from ..dependencies import get_db
 from ..utils.credits import check_sufficient_credits, deduct_credits, add_credits
 from ..utils.credit_constants import calculate_inference_cost
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name='us-east-1'
+from ..utils.image_variants import (
+    INFERENCE_OUTPUT_KEY,
+    enqueue_run_variants,
+    ensure_variants,
+    variant_key,
+    variants_exist,
+    variant_urls
 )
+from ..utils.s3_transfer import s3_url_for_key, store_images_to_s3
+from ..utils.url_signing import sign_url, sign_url_map, sign_urls
+from ..utils.replicate_gateway import TokenBucket, get_replicate_gateway
+from ..utils.pagination import fetch_page, cached_count
+from ..utils.run_events import user_id_variants
+from ..utils.feed_cache import FEED_PROJECTION, format_feed_example, get_feed_page, record_not_modified
 
-BUCKET_NAME = 'whatif-genai'
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -59,48 +60,6 @@ def calculate_inference_cost(params: dict) -> int:
     
     return total_cost
 
-def download_image(url: str) -> BytesIO:
-    """Download image from URL to memory buffer"""
-    try:
-        response = requests.get(url, stream=True, verify=True)
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4xx, 5xx)
-        return BytesIO(response.content)
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error downloading image: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to download image: {str(e)}")
-
-async def store_images_to_s3(urls: list, user_id: str, inference_id: str) -> list:
-    """Store multiple images to S3 and return their URLs"""
-    s3_urls = []
-    for i, url in enumerate(urls):
-        try:
-            # Download image from Replicate
-            image_data = download_image(url)
-            
-            # Reset buffer position
-            image_data.seek(0)
-            
-            # Generate S3 key with partitioning
-            key = f"inference_data/{user_id}/{inference_id}/image_{i}.png"
-            
-            # Upload to S3 with public-read access
-            s3_client.upload_fileobj(
-                image_data,
-                BUCKET_NAME,
-                key,
-                ExtraArgs={'ContentType': 'image/png'}
-            )
-            
-            # Generate S3 URL
-            s3_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{key}"
-            logger.info(f"Uploaded image to S3: {s3_url}")
-            s3_urls.append(s3_url)
-            
-        except Exception as e:
-            logger.error(f"Error processing image {i}: {str(e)}")
-            continue
-    return s3_urls
-
 def serialize_prediction(prediction):
     """Helper function to serialize Replicate prediction output
     
@@ -155,18 +114,11 @@ async def create_inference(
         user_id = str(current_user.get('_id'))
         prompt = data.get('prompt', '')
         
-        # Detailed logging of frontend request
-        logger.info("\n=== Frontend Request Data ===")
-        logger.info(f"User ID: {user_id}")
-        logger.info(f"Prompt: {prompt}")
-        logger.info(f"Raw Request Data:")
-        for key, value in data.items():
-            logger.info(f"  {key}: {value}")
-        logger.info("===========================\n")
+        # Request bodies are only logged at debug level
+        logger.debug(f"Inference request data: {data}")
         
         # Calculate credit cost
         credit_cost = calculate_inference_cost(data)
-        logger.info(f"Calculated credit cost: {credit_cost}")
         
         # Check if user has sufficient credits
         if not await check_sufficient_credits(db, user_id, credit_cost):
@@ -177,11 +129,7 @@ async def create_inference(
         
         # Get model_id from request
         model_id = data.get('model_id', "black-forest-labs/flux-1.1-pro")
-        logger.info(f"Selected model: {model_id}")
-
-        # Initialize Replicate client
-        logger.info("Initializing Replicate client")
-        replicate_client = replicate.Client(api_token=settings.REPLICATE_API_TOKEN)
+        logger.info(f"Inference requested by user {user_id} with model {model_id}, cost {credit_cost}")
 
         # Prepare inference parameters
         inference_params = {
@@ -205,15 +153,15 @@ async def create_inference(
         # Ensure aspect_ratio is always included
         inference_params['aspect_ratio'] = data.get('aspect_ratio', '1:1')
 
-        # Log parameters being sent to model
-        logger.info("\n=== Parameters Being Sent to Model ===")
-        for key, value in inference_params.items():
-            logger.info(f"  {key}: {value}")
-        logger.info("===================================\n")
+        logger.debug(f"Parameters being sent to model: {inference_params}")
+
+        # "async" returns immediately and finishes in the prediction webhook
+        mode = "async" if data.get('mode') == "async" else "sync"
 
         # Create initial inference record
         inference_record = {
             "user_id": user_id,
+            "mode": mode,
             "model_id": model_id,
             "parameters": inference_params,
             "status": "processing",
@@ -240,18 +188,35 @@ async def create_inference(
                 run_id=inference_id
             )
             
+            if mode == "async":
+                webhook_url = f"{settings.FRONTEND_URL}/api/canvasinference/webhook/prediction?inference_id={inference_id}"
+                prediction = await get_replicate_gateway().create_prediction(
+                    model_id,
+                    inference_params,
+                    webhook=webhook_url,
+                    webhook_events_filter=["completed"]
+                )
+                await db["inference_runs"].update_one(
+                    {"_id": ObjectId(inference_id)},
+                    {"$set": {"prediction_id": prediction.id}}
+                )
+                logger.info(f"Submitted prediction {prediction.id} for inference {inference_id}")
+                return {
+                    "status": "processing",
+                    "inference_id": inference_id,
+                    "credit_cost": credit_cost,
+                    "status_url": f"/canvasinference/inference/{inference_id}/status"
+                }
+
             # Run inference asynchronously using the selected model
             logger.info(f"Starting async inference with model: {model_id}")
-            prediction = await replicate_client.async_run(
-                model_id,
-                input=inference_params
-            )
+            prediction = await get_replicate_gateway().run(model_id, inference_params)
             
             # Process results
             output_urls = serialize_prediction(prediction)
-            logger.info(f"Received prediction output: {output_urls}")
+            logger.debug(f"Received prediction output: {output_urls}")
 
-            # Upload to S3
+            # Upload to S3; gallery variants are rendered by a job after the response
             s3_urls = await store_images_to_s3(output_urls, user_id, inference_id)
 
             # Calculate processing time
@@ -271,11 +236,12 @@ async def create_inference(
                     "processing_stats.total_time_seconds": total_time
                 }}
             )
+            await enqueue_run_variants(db, inference_id)
 
             return {
                 "status": "success",
                 "inference_id": inference_id,
-                "output_urls": s3_urls,
+                "output_urls": sign_urls(s3_urls),
                 "credit_cost": credit_cost
             }
 
@@ -310,26 +276,162 @@ async def create_inference(
         logger.error(f"Error in create_inference: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def finish_async_inference(db: AsyncIOMotorClient, inference_id: str) -> Optional[dict]:
+    """
+    Complete a submitted inference from its Replicate prediction: store the images and
+    mark it completed, or mark it failed and refund it. Safe to call repeatedly; only one
+    caller claims the run, and a run whose prediction is still going is left untouched.
+    A claim that outlives ASYNC_INFERENCE_CONFIG["finalizing_lease_seconds"] is taken over.
+    Returns the updated run, or None if there was nothing to do.
+    """
+    claimed_at = datetime.utcnow()
+    stale_before = claimed_at - timedelta(seconds=ASYNC_INFERENCE_CONFIG["finalizing_lease_seconds"])
+    run = await db["inference_runs"].find_one_and_update(
+        {
+            "_id": ObjectId(inference_id),
+            "mode": "async",
+            "$or": [
+                {"status": "processing"},
+                # Also matches claims made before finalizing_at was recorded
+                {"status": "finalizing", "finalizing_at": {"$not": {"$gt": stale_before}}}
+            ]
+        },
+        {"$set": {"status": "finalizing", "finalizing_at": claimed_at}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not run:
+        return None
+    claim = {"_id": ObjectId(inference_id), "status": "finalizing", "finalizing_at": claimed_at}
+
+    try:
+        prediction = await get_replicate_gateway().get_prediction(run["prediction_id"])
+        end_time = datetime.utcnow()
+        total_time = (end_time - datetime.fromisoformat(run["processing_stats"]["start_time"])).total_seconds()
+
+        if prediction.status == "succeeded":
+            output_urls = serialize_prediction(prediction.output)
+            s3_urls = await store_images_to_s3(output_urls, str(run["user_id"]), inference_id)
+            update = {
+                "status": "completed",
+                "replicate_urls": output_urls,
+                "output_urls": s3_urls,
+                "completed_at": end_time,
+                "processing_stats.end_time": end_time.isoformat(),
+                "processing_stats.total_time_seconds": total_time
+            }
+        elif prediction.status in ["failed", "canceled"]:
+            # Refunded below, once this claim has marked the run failed
+            update = {
+                "status": "failed",
+                "error": prediction.error or f"Prediction {prediction.status}",
+                "processing_stats.end_time": end_time.isoformat()
+            }
+        else:
+            update = {"status": "processing"}
+    except Exception:
+        # Release the claim so a webhook retry or status check can try again
+        await db["inference_runs"].update_one(
+            claim,
+            {"$set": {"status": "processing"}, "$unset": {"finalizing_at": ""}}
+        )
+        raise
+
+    result = await db["inference_runs"].update_one(claim, {"$set": update, "$unset": {"finalizing_at": ""}})
+    if result.modified_count == 0:
+        logger.warning(f"Finalizing claim on inference {inference_id} expired before it finished")
+        return None
+    if update["status"] == "failed":
+        # The run can no longer be claimed, so this is the only refund for it
+        try:
+            await add_credits(
+                db=db,
+                user_id=str(run["user_id"]),
+                amount=run["credit_cost"],
+                transaction_type="refund",
+                description=f"Refund for failed inference - {str(prediction.error or prediction.status)[:100]}"
+            )
+        except Exception as e:
+            logger.error(f"Failed to refund inference {inference_id}: {str(e)}", exc_info=True)
+    if update["status"] == "completed":
+        await enqueue_run_variants(db, inference_id)
+    logger.info(f"Inference {inference_id} finished with status {update['status']}")
+    return {**run, **update}
+
+@router.post("/webhook/prediction")
+async def prediction_webhook(
+    request: Request,
+    inference_id: str,
+    db: AsyncIOMotorClient = Depends(get_db)
+):
+    """Handle Replicate's completion webhook for predictions submitted in async mode"""
+    try:
+        payload = await request.json()
+        run = await db["inference_runs"].find_one(
+            {"_id": ObjectId(inference_id)},
+            {"prediction_id": 1}
+        )
+        if not run or run.get("prediction_id") != payload.get("id"):
+            raise HTTPException(status_code=404, detail="Inference not found")
+
+        # The outcome is read back from Replicate rather than trusted from the payload
+        await finish_async_inference(db, inference_id)
+        return {"status": "success"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error handling prediction webhook: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/inference/{inference_id}/status")
+async def get_inference_status(
+    inference_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorClient = Depends(get_db)
+):
+    """Lightweight status of an inference, for clients of async mode"""
+    try:
+        projection = {"user_id": 1, "mode": 1, "status": 1, "created_at": 1, "output_urls": 1, "error": 1}
+        run = await db["inference_runs"].find_one({"_id": ObjectId(inference_id)}, projection)
+        if not run:
+            raise HTTPException(status_code=404, detail="Inference not found")
+        if str(run["user_id"]) != str(current_user["_id"]):
+            raise HTTPException(status_code=403, detail="Not authorized to access this inference")
+
+        # Fall back to asking Replicate if the webhook looks overdue
+        overdue = datetime.utcnow() - run["created_at"] > timedelta(seconds=ASYNC_INFERENCE_CONFIG["webhook_grace_seconds"])
+        # finish_async_inference only takes over a finalizing run once its claim has gone stale
+        if run.get("mode") == "async" and run["status"] in ["processing", "finalizing"] and overdue:
+            run = await finish_async_inference(db, inference_id) or run
+
+        return {
+            "inference_id": inference_id,
+            "status": run["status"],
+            "output_urls": sign_urls(run.get("output_urls", [])),
+            "error": run.get("error")
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching inference status: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/inferences")
 async def get_inferences(
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorClient = Depends(get_db),
-    page: int = 0,
-    limit: int = 20
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ):
     try:
-        user_id = current_user.get('_id')
-        logger.info(f"Fetching inferences for user: {user_id}, page: {page}, limit: {limit}")
-        
-        # Calculate skip for pagination
-        skip = page * limit
-        
-        # Get inferences sorted by creation date
-        cursor = db["inference_runs"].find({"user_id": user_id}).sort("created_at", -1).skip(skip).limit(limit)
-        inference_runs = await cursor.to_list(length=None)
+        user_id = str(current_user.get('_id'))
+        logger.info(f"Fetching inferences for user: {user_id}, limit: {limit}")
         
-        # Get total count for pagination
-        total_count = await db["inference_runs"].count_documents({"user_id": user_id})
+        # Manual runs store user_id as a string, automated runs as an ObjectId
+        query = {"user_id": {"$in": user_id_variants(user_id)}}
+        inference_runs, next_cursor = await fetch_page(db["inference_runs"], query, limit, cursor)
         
         # Convert ObjectId to string for JSON serialization
         formatted_inferences = []
@@ -341,18 +443,26 @@ async def get_inferences(
                 "status": run.get("status"),
                 "prompt": run.get("prompt", ""),
                 "parameters": run.get("parameters", {}),
-                "output_urls": run.get("output_urls", []),
+                "output_urls": sign_urls(run.get("output_urls", [])),
+                "output_variants": [
+                    sign_url_map(variant_urls(url, run.get("variants_ready", False)))
+                    for url in run.get("output_urls", [])
+                ],
                 "created_at": run.get("created_at", "")
             })
             
         logger.info(f"Found {len(formatted_inferences)} inference runs")
-        return {
+        response = {
             "inferences": formatted_inferences,
-            "total": total_count,
-            "page": page,
-            "has_more": (skip + limit) < total_count
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
+        if include_total:
+            response["total"] = await cached_count(db["inference_runs"], query, user_id)
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching inferences: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -374,6 +484,7 @@ async def get_inference(
         # Convert ObjectId to string for JSON serialization
         inference["_id"] = str(inference["_id"])
         inference["user_id"] = str(inference["user_id"])
+        inference["output_urls"] = sign_urls(inference.get("output_urls", []))
         
         return inference
         
@@ -381,52 +492,97 @@ async def get_inference(
         logger.error(f"Error fetching inference: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Bounds the rendering work anonymous /variant requests can cause in one process
+_lazy_render_bucket = TokenBucket(
+    IMAGE_VARIANT_CONFIG["lazy_renders_per_second"],
+    IMAGE_VARIANT_CONFIG["lazy_render_burst"]
+)
+
+@router.get("/variant")
+async def get_image_variant(
+    key: str,
+    width: int,
+    db: AsyncIOMotorClient = Depends(get_db)
+):
+    """
+    Redirect to a resized variant of a stored inference image, generating it on first request.
+    Unauthenticated so gallery <img> tags can use it, so it only renders outputs recorded on
+    an inference run, and renders are rate limited; over the limit the original is served.
+    """
+    match = INFERENCE_OUTPUT_KEY.match(key)
+    if not match:
+        raise HTTPException(status_code=400, detail="Invalid image key")
+    if width not in IMAGE_VARIANT_CONFIG["widths"]:
+        raise HTTPException(status_code=400, detail=f"Width must be one of {IMAGE_VARIANT_CONFIG['widths']}")
+    run = await db["inference_runs"].find_one(
+        {"_id": ObjectId(match.group(1)), "output_urls": s3_url_for_key(key)},
+        {"_id": 1}
+    )
+    if not run:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        if await variants_exist(key) or (_lazy_render_bucket.try_acquire() and await ensure_variants(key)):
+            # A cached redirect must not outlive the signature it points to
+            max_age = 86400 if settings.URL_SIGNING_MODE == "public" else settings.URL_SIGNING_REFRESH_MARGIN_SECONDS // 2
+            return RedirectResponse(
+                sign_url(s3_url_for_key(variant_key(key, width))),
+                headers={"Cache-Control": f"private, max-age={max_age}"}
+            )
+    except Exception as e:
+        logger.error(f"Error generating variants for {key}: {str(e)}")
+    # Fall back to the original rather than a broken tile; not cached, so a later load gets the variant
+    return RedirectResponse(sign_url(s3_url_for_key(key)), headers={"Cache-Control": "no-store"})
+
 @router.get("/feed")
 async def get_feed_examples(
+    request: Request,
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorClient = Depends(get_db),
-    page: int = 0,
-    limit: int = 20
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ):
     try:
-        logger.info(f"Fetching feed examples, page: {page}, limit: {limit}")
-        
-        # Calculate skip for pagination
-        skip = page * limit
-        
+        logger.info(f"Fetching feed examples, limit: {limit}")
+
+        # The first pages are materialised in memory and served pre-compressed
+        page = None if include_total else await get_feed_page(db, limit, cursor)
+        if page is not None:
+            headers = {"ETag": page.etag, "Cache-Control": "private, max-age=30", "Vary": "Accept-Encoding"}
+            if request.headers.get("if-none-match") == page.etag:
+                record_not_modified()
+                return Response(status_code=304, headers=headers)
+            if "gzip" in request.headers.get("accept-encoding", ""):
+                return Response(
+                    content=page.gzipped,
+                    media_type="application/json",
+                    headers={**headers, "Content-Encoding": "gzip"}
+                )
+            return Response(content=page.body, media_type="application/json", headers=headers)
+
         # Get feed examples sorted by creation date with specific fields
-        cursor = db["feed"].find(
+        feed_examples, next_cursor = await fetch_page(
+            db["feed"],
             {},
-            {
-                "_id": 1,
-                "prompt": 1,
-                "created_at": 1,
-                "s3_url": 1  # Make sure this matches your field name in MongoDB
-            }
-        ).sort("created_at", -1).skip(skip).limit(limit)
-        feed_examples = await cursor.to_list(length=None)
-        
-        # Get total count for pagination
-        total_count = await db["feed"].count_documents({})
-        
-        # Convert ObjectId to string and format response
-        formatted_examples = []
-        for example in feed_examples:
-            formatted_examples.append({
-                "_id": str(example["_id"]),
-                "prompt": example.get("prompt", ""),
-                "created_at": example.get("created_at", ""),
-                "output_urls": [example.get("s3_url")] if example.get("s3_url") else []
-            })
-            
+            limit,
+            cursor,
+            projection=FEED_PROJECTION
+        )
+        formatted_examples = [format_feed_example(example) for example in feed_examples]
+
         logger.info(f"Found {len(formatted_examples)} feed examples")
-        return {
+        response = {
             "examples": formatted_examples,
-            "total": total_count,
-            "page": page,
-            "has_more": (skip + limit) < total_count
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
+        if include_total:
+            response["total"] = await cached_count(db["feed"], {}, "all")
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching feed examples: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -5,8 +5,8 @@ from pydantic import BaseModel
 import razorpay
 import logging
 from ..dependencies import get_db
-from ..utils.auth import get_current_user
-from ..utils.credits import get_user_credit_balance, add_credits, deduct_credits
+from ..utils.auth import get_current_user, require_cron_secret
+from ..utils.credits import get_user_credit_balance, add_credits, deduct_credits, reconcile_all_credit_balances
 from ..utils.credit_constants import CREDIT_PACKAGES
 from ..config import settings
 from ..models.payment import (
@@ -16,9 +16,7 @@ from ..models.payment import (
     CreditTransactionResponse
 )
 
-# Configure logging
-logger = logging.getLogger("uvicorn")
-logger.setLevel(logging.DEBUG)
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -44,6 +42,16 @@ async def get_credits_balance(
     balance = await get_user_credit_balance(db, str(current_user["_id"]))
     return {"balance": balance}
 
+# GET is what Vercel Cron sends; POST stays for manual runs
+@router.api_route("/reconcile", methods=["GET", "POST"], response_model=dict, dependencies=[Depends(require_cron_secret)])
+async def reconcile_credit_balances(
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Periodic job: reconcile stored balances against the transaction ledger"""
+    stats = await reconcile_all_credit_balances(db)
+    logger.info(f"Credit reconciliation finished: {stats}")
+    return {"status": "success", **stats}
+
 @router.get("/transactions", response_model=List[CreditTransactionResponse])
 async def get_credit_transactions(
     limit: int = 50,
@@ -156,10 +164,8 @@ async def verify_payment(
 ):
     """Verify a payment and add credits"""
     try:
-        logger.info("=== Starting Payment Verification ===")
-        logger.info(f"Payment ID: {request.payment_id}")
-        logger.info(f"Order ID: {request.order_id}")
-        logger.info(f"User ID: {current_user.get('_id')}")
+        logger.info(f"Verifying payment for order {request.order_id}, user {current_user.get('_id')}")
+        logger.debug(f"Payment ID: {request.payment_id}")
         
         # Find the payment
         payment = await db.payments.find_one({"transaction_id": request.order_id})
@@ -167,13 +173,13 @@ async def verify_payment(
             logger.error(f"Payment record not found in database for order_id: {request.order_id}")
             # Let's check what payments exist for this user
             all_payments = await db.payments.find({"user_id": str(current_user["_id"])}).to_list(length=10)
-            logger.info(f"Recent payments for user: {all_payments}")
+            logger.debug(f"Recent payments for user: {all_payments}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Payment not found"
             )
         
-        logger.info(f"Found payment record: {payment}")
+        logger.debug(f"Found payment record: {payment}")
         
         # Check if payment is already processed
         if payment.get("status") == "completed":
@@ -189,16 +195,16 @@ async def verify_payment(
             'razorpay_payment_id': request.payment_id,
             'razorpay_signature': request.signature
         }
-        logger.info(f"Attempting signature verification with params: {params_dict}")
+        logger.debug(f"Attempting signature verification with params: {params_dict}")
         
         try:
             # Fetch order from Razorpay to verify it exists
             order = client.order.fetch(request.order_id)
-            logger.info(f"Razorpay order details: {order}")
+            logger.debug(f"Razorpay order details: {order}")
             
             # Verify signature
             client.utility.verify_payment_signature(params_dict)
-            logger.info("Signature verification successful")
+            logger.debug("Signature verification successful")
         except razorpay.errors.SignatureVerificationError as sve:
             logger.error(f"Signature verification failed: {str(sve)}")
             raise HTTPException(
@@ -213,7 +219,7 @@ async def verify_payment(
                 detail=f"Payment verification failed: {str(e)}"
             )
         
-        logger.info("Updating payment status in database...")
+        logger.debug("Updating payment status in database...")
         # Update payment status and add payment_id
         update_result = await db.payments.update_one(
             {"transaction_id": request.order_id},
@@ -224,7 +230,7 @@ async def verify_payment(
                 }
             }
         )
-        logger.info(f"Update result: {update_result.modified_count} document(s) modified")
+        logger.debug(f"Update result: {update_result.modified_count} document(s) modified")
         
         if update_result.modified_count == 0:
             logger.error("Failed to update payment status in database")
@@ -246,7 +252,7 @@ async def verify_payment(
                 transaction_type="purchase",
                 description=f"Credits purchased - {credits_to_add} credits"
             )
-            logger.info("Credits added successfully")
+            logger.debug("Credits added successfully")
         except Exception as credit_error:
             logger.error(f"Failed to add credits: {str(credit_error)}")
             logger.error(f"Credit error type: {type(credit_error)}")
@@ -269,8 +275,8 @@ async def verify_payment(
                 detail="Failed to fetch updated payment record"
             )
             
-        logger.info(f"Payment verification completed successfully")
-        logger.info(f"Final payment record: {updated_payment}")
+        logger.info(f"Payment verification completed for order {request.order_id}")
+        logger.debug(f"Final payment record: {updated_payment}")
         return PaymentResponse(**updated_payment)
 
     except HTTPException as he:
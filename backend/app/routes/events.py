@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from ..dependencies import get_db
+from ..utils.auth import get_current_user, require_admin_token
+from ..utils.run_events import get_run_event_hub, active_runs_snapshot
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = 15
+# Streams end before the serverless time limit; EventSource reconnects on its own
+MAX_STREAM_SECONDS = 240
+RECONNECT_MILLISECONDS = 3000
+
+async def get_stream_user(
+    token: str = Query(...),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """EventSource cannot send headers, so the bearer token comes as a query parameter"""
+    return await get_current_user(token=token, db=db)
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/stream")
+async def stream_run_events(
+    request: Request,
+    current_user: dict = Depends(get_stream_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Server-sent events for status transitions of the user's inference and training runs"""
+    user_id = str(current_user["_id"])
+    hub = get_run_event_hub()
+    queue = hub.subscribe(user_id)
+
+    async def events():
+        started = time.monotonic()
+        try:
+            yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+            yield format_event("snapshot", {"runs": await active_runs_snapshot(db, user_id)})
+            while time.monotonic() - started < MAX_STREAM_SECONDS:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                    yield format_event(event["type"], event)
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+        finally:
+            hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/stats", dependencies=[Depends(require_admin_token)])
+async def get_event_stats():
+    """Open stream counts and whether change streams or polling are in use"""
+    return get_run_event_hub().stats()
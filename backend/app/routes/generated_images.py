@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from ..dependencies import get_db
 from ..utils.auth import get_current_user
+from ..utils.image_variants import variant_urls
+from ..utils.url_signing import sign_urls
 from ..models.user import User
 from ..models.user_image import UserImageInDB, UserImageResponse
 from typing import List
@@ -13,6 +15,14 @@ class GenerateImageRequest(BaseModel):
 
 router = APIRouter()
 
+def with_variants(image: dict) -> dict:
+    """Attach resized variant URLs for each stored image"""
+    return {
+        **image,
+        "image_urls": sign_urls(image.get("image_urls", [])),
+        "image_variants": [variant_urls(url) for url in image.get("image_urls", [])]
+    }
+
 @router.post("/", response_model=UserImageResponse)
 async def save_generated_images(
     request: GenerateImageRequest,
@@ -39,7 +49,7 @@ async def get_user_generated_images(
 ):
     """Get all generated images for a user"""
     images = await db["user_images"].find({"user_id": user_id}).to_list(length=None)
-    return images
+    return [with_variants(image) for image in images]
 
 @router.get("/{image_id}", response_model=UserImageResponse)
 async def get_generated_image(
@@ -48,5 +58,5 @@ async def get_generated_image(
 ):
     """Get a specific generated image"""
     if (image := await db["user_images"].find_one({"_id": ObjectId(image_id)})) is not None:
-        return image
+        return with_variants(image)
     raise HTTPException(status_code=404, detail="Generated image not found") 
\ No newline at end of file
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from ..dependencies import get_db
+from ..utils.auth import require_cron_secret
+from ..utils.job_queue import drain_jobs, get_queue_stats
+from ..utils import prompt_inferences  # noqa: F401 - registers job handlers
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/stats", dependencies=[Depends(require_cron_secret)])
+async def get_job_queue_stats(
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Queue depth and recent job latency"""
+    return await get_queue_stats(db)
+
+# GET is what Vercel Cron sends (see vercel.json); POST stays for other schedulers
+@router.api_route("/drain", methods=["GET", "POST"], dependencies=[Depends(require_cron_secret)])
+async def drain_job_queue(
+    max_jobs: int = Query(10, ge=1, le=50),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Process queued jobs in this invocation; triggered every minute by Vercel Cron"""
+    processed = await drain_jobs(db, max_jobs=max_jobs)
+    logger.info(f"Drained {processed} job(s)")
+    return {"status": "success", "processed": processed}
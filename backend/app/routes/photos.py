@@ -1,49 +1,78 @@
-import io
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
 from ..dependencies import get_db
 from ..utils.auth import get_current_user
+from ..utils.image_variants import get_photo_variant, photo_variant_id, variants_available
+from ..utils.replicate_gateway import TokenBucket
+from ..config import settings
+from ..config.inference_config import IMAGE_VARIANT_CONFIG
+from ..utils.gridfs_stream import etag_matches, gridfs_etag, if_range_allows, iter_grid_out, parse_range, upload_to_gridfs
 from ..models.user import User
 from ..models.photo import PhotoInDB, PhotoResponse
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from bson import ObjectId
+from typing import Dict, Optional
+import logging
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Bounds the rendering work anonymous ?width= requests can cause in one process
+_photo_render_bucket = TokenBucket(
+    IMAGE_VARIANT_CONFIG["lazy_renders_per_second"],
+    IMAGE_VARIANT_CONFIG["lazy_render_burst"]
+)
+
+def photo_variant_urls(photo: dict) -> Dict[str, str]:
+    if not variants_available():
+        return {}
+    return {
+        str(width): f"{settings.FRONTEND_URL}/api/photos/{photo['_id']}?width={width}"
+        for width in IMAGE_VARIANT_CONFIG["widths"]
+    }
+
+def serialize_photo(photo: dict) -> dict:
+    """Stored photos keep native ObjectIds; responses carry them as strings"""
+    return {
+        **photo,
+        "_id": str(photo["_id"]),
+        "file_id": str(photo["file_id"]),
+        "variant_urls": photo_variant_urls(photo)
+    }
+
 @router.post("/upload", response_model=PhotoResponse)
 async def upload_photo(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user),
     db = Depends(get_db)
 ):
     """Upload a new photo"""
-    contents = await file.read()
+    user_id = str(current_user["_id"])
     
     # Create GridFS bucket
     fs = AsyncIOMotorGridFSBucket(db)
     
-    # Upload file to GridFS
-    file_id = await fs.upload_from_stream(
-        file.filename,
-        contents,
-        metadata={"content_type": file.content_type, "user_id": current_user.id}
+    # Pipe the upload into GridFS without holding the whole file in memory
+    file_id, sha256 = await upload_to_gridfs(
+        fs,
+        file,
+        metadata={"content_type": file.content_type, "user_id": user_id}
     )
     
     # Create photo document
     photo_data = PhotoInDB(
         filename=file.filename,
         content_type=file.content_type,
-        user_id=current_user.id,
-        file_id=file_id
+        user_id=user_id,
+        file_id=file_id,
+        sha256=sha256
     )
     
-    # Save photo metadata
-    result = await db["photos"].insert_one(photo_data.dict(by_alias=True))
-    
-    # Fetch the created photo
-    created_photo = await db["photos"].find_one({"_id": result.inserted_id})
-    return created_photo
+    # Save photo metadata with native ObjectIds; the serialized model is the response
+    photo = photo_data.dict(by_alias=True)
+    await db["photos"].insert_one({**photo, "_id": photo_data.id, "file_id": file_id})
+    return serialize_photo(photo)
 
 @router.get("/user/{user_id}", response_model=list[PhotoResponse])
 async def get_user_photos(
@@ -52,14 +81,16 @@ async def get_user_photos(
 ):
     """Get all photos for a specific user"""
     photos = await db["photos"].find({"user_id": user_id}).to_list(length=None)
-    return photos
+    return [serialize_photo(photo) for photo in photos]
 
 @router.get("/{photo_id}")
 async def get_photo(
     photo_id: str,
+    request: Request,
+    width: Optional[int] = None,
     db = Depends(get_db)
 ):
-    """Get a specific photo"""
+    """Get a specific photo, or one of its resized variants, streamed from GridFS with Range and ETag support"""
     # Find photo metadata
     photo = await db["photos"].find_one({"_id": ObjectId(photo_id)})
     if not photo:
@@ -67,15 +98,60 @@ async def get_photo(
     
     # Create GridFS bucket
     fs = AsyncIOMotorGridFSBucket(db)
+
+    file_id = ObjectId(photo["file_id"])
+    content_type = photo["content_type"]
+    cache_control = "private, max-age=86400"
+    if width is not None and variants_available():
+        if width not in IMAGE_VARIANT_CONFIG["widths"]:
+            raise HTTPException(status_code=400, detail=f"Width must be one of {IMAGE_VARIANT_CONFIG['widths']}")
+        variant_id = photo_variant_id(photo, width)
+        if variant_id is None and _photo_render_bucket.try_acquire():
+            try:
+                variant_id = await get_photo_variant(db, fs, photo, width)
+            except Exception as e:
+                logger.error(f"Failed to generate variant {width} for photo {photo_id}: {str(e)}")
+        if variant_id is not None:
+            file_id = variant_id
+            content_type = IMAGE_VARIANT_CONFIG["content_type"]
+        else:
+            # Throttled, being rendered elsewhere, or failed: serve the original, uncached,
+            # so a later load gets the variant
+            cache_control = "no-store"
     
     try:
-        # Get file from GridFS
-        grid_out = await fs.open_download_stream(photo["file_id"])
-        contents = await grid_out.read()
-        
+        # Open the file; chunks are only read as the response is sent
+        grid_out = await fs.open_download_stream(file_id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail="Photo file not found")
+
+    etag = gridfs_etag(grid_out)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if grid_out.length and if_range_allows(request.headers.get("if-range"), etag):
+        byte_range = parse_range(request.headers.get("range"), grid_out.length)
+    if byte_range is None:
         return StreamingResponse(
-            io.BytesIO(contents),
-            media_type=photo["content_type"]
+            iter_grid_out(grid_out),
+            media_type=content_type,
+            headers={**headers, "Content-Length": str(grid_out.length)}
         )
-    except Exception as e:
-        raise HTTPException(status_code=404, detail="Photo file not found") 
\ No newline at end of file
+
+    start, end = byte_range
+    return StreamingResponse(
+        iter_grid_out(grid_out, start, end),
+        status_code=206,
+        media_type=content_type,
+        headers={
+            **headers,
+            "Content-Length": str(end - start + 1),
+            "Content-Range": f"bytes {start}-{end}/{grid_out.length}"
+        }
+    )
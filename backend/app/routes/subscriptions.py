@@ -12,6 +12,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from ..dependencies import get_db
 import asyncio
 from ..utils.credits import add_credits
+from ..utils.user_cache import invalidate_cached_user
 from ..utils.credit_constants import CREDIT_PACKAGES
 
 router = APIRouter()
@@ -207,6 +208,7 @@ async def verify_subscription(
         if result.matched_count == 0:
             print(f"User not found in database: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
+        await invalidate_cached_user(user_id)
 
         # Add subscription credits
         if plan_name and billing_type:
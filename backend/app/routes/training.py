@@ -5,27 +5,27 @@ import os
 import replicate
 from ..utils.auth import get_current_user
 from ..utils.db import get_background_db_client
-import zipfile
-import io
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
 from ..dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorClient
 from botocore.config import Config
 import logging
 import tempfile
-import shutil
-from pathlib import Path
-import json
 from ..config.config import settings
 from bson.objectid import ObjectId
-from ..utils.prompt_inferences import run_model_inferences
+from pymongo import ReturnDocument, UpdateOne
+from ..utils.prompt_inferences import enqueue_model_inferences
 from ..utils.credits import check_sufficient_credits, deduct_credits, add_credits
 from ..utils.credit_constants import calculate_training_cost
+from ..utils.user_cache import invalidate_cached_user
+from ..utils.s3_transfer import put_s3_object, iter_s3_object, delete_s3_prefix
+from ..utils.url_signing import sign_url
+from ..utils.replicate_gateway import get_replicate_gateway
+from ..utils.image_processing import preprocess_dataset_files
+from ..utils.training_data import DatasetFile, get_or_create_dataset, dataset_files_from_uploads
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -61,14 +61,23 @@ s3_client = boto3.client(
 BUCKET_NAME = 'whatif-genai'
 REPLICATE_USERNAME = "i-aayush"  # Replace with your Replicate username
 
-def create_replicate_model(client, model_name: str) -> str:
+# Chunked upload sessions
+UPLOAD_SESSIONS_COLLECTION = "upload_sessions"
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+UPLOAD_ACCEPTING_STATUSES = ["initialized", "uploading"]
+
+# Batched training status sync
+POLL_CHECKPOINT_ID = "poll_training_runs"
+POLL_CONCURRENCY = 16  # Concurrent Replicate status fetches
+
+async def create_replicate_model(model_name: str) -> str:
     """Creates a new model on Replicate if it doesn't exist."""
     try:
         # Format the full model name
         full_model_name = f"{REPLICATE_USERNAME}/{model_name}"
         
         # Create the model
-        model = client.models.create(
+        model = await get_replicate_gateway().create_model(
             owner=REPLICATE_USERNAME,
             name=model_name,
             visibility="private",
@@ -103,17 +112,18 @@ async def update_error_status(db_client, training_id: str, user_id: str, error_m
                 "last_error": error_message
             }}
         )
+        await invalidate_cached_user(user_id)
     except Exception as e:
         logger.error(f"Failed to update error status in database: {str(e)}")
 
-async def poll_training_status(training_id: str, user_id: str, replicate_client: replicate.Client, db_client: AsyncIOMotorClient):
+async def poll_training_status(training_id: str, user_id: str, db_client: AsyncIOMotorClient):
     """Poll training status and update database"""
     try:
-        training = replicate_client.trainings.get(training_id)
+        training = await get_replicate_gateway().get_training(training_id)
         
         while training.status not in ["succeeded", "failed", "canceled"]:
             await asyncio.sleep(60)  # Check every minute
-            training = replicate_client.trainings.get(training_id)
+            training = await get_replicate_gateway().get_training(training_id)
             logger.info(f"Training status for {training_id}: {training.status}")
 
         logger.info(f"Training completed with status: {training.status}")
@@ -140,24 +150,16 @@ async def poll_training_status(training_id: str, user_id: str, replicate_client:
                     "current_training_id": None
                 }}
             )
+            await invalidate_cached_user(user_id)
             
-            # Run automated inferences if training succeeded
+            # Queue automated inferences if training succeeded
             try:
-                logger.info(f"Starting automated inferences for model {model_version.id}")
-                inference_ids = await run_model_inferences(
+                logger.info(f"Queueing automated inferences for model {model_version.id}")
+                await enqueue_model_inferences(
+                    db_client,
                     model_id=model_version.id,
                     user_id=user_id,
-                    db=db_client
-                )
-                logger.info(f"Completed automated inferences, count: {len(inference_ids)}")
-                
-                # Update training run with inference IDs
-                await db_client["training_runs"].update_one(
-                    {"training_id": training_id},
-                    {"$set": {
-                        "automated_inference_ids": inference_ids,
-                        "automated_inference_count": len(inference_ids)
-                    }}
+                    training_id=training_id
                 )
             except Exception as e:
                 logger.error(f"Error running automated inferences: {str(e)}")
@@ -182,6 +184,7 @@ async def poll_training_status(training_id: str, user_id: str, replicate_client:
                     "current_training_id": None
                 }}
             )
+            await invalidate_cached_user(user_id)
             
     except Exception as e:
         logger.error(f"Error in poll_training_status: {str(e)}")
@@ -203,6 +206,7 @@ async def poll_training_status(training_id: str, user_id: str, replicate_client:
                 "current_training_id": None
             }}
         )
+        await invalidate_cached_user(user_id)
 
 async def save_upload_file_tmp(upload_file: UploadFile) -> str:
     """Saves an upload file temporarily and returns the path"""
@@ -223,14 +227,32 @@ async def upload_and_train(
     files: List[UploadFile],
     model_name: str,
     high_quality: bool = False,
+    preprocess: bool = True,
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorClient = Depends(get_db),
     background_tasks: BackgroundTasks = BackgroundTasks(),
     request: Request = None
 ):
     """Handle file upload and start training process"""
+    return await train_from_dataset(
+        dataset_files_from_uploads(files),
+        model_name=model_name,
+        high_quality=high_quality,
+        current_user=current_user,
+        db=db,
+        preprocess=preprocess
+    )
+
+async def train_from_dataset(
+    dataset_files: List[DatasetFile],
+    model_name: str,
+    high_quality: bool,
+    current_user: dict,
+    db: AsyncIOMotorClient,
+    preprocess: bool = True
+):
+    """Zip a dataset into S3 and start a Replicate training on it"""
     logger.info(f"Starting upload and train process for user {current_user['_id']} with model name {model_name}")
-    temp_files = []
     training_id = None
     
     try:
@@ -238,7 +260,7 @@ async def upload_and_train(
         
         # Calculate credit cost
         credit_cost = calculate_training_cost(
-            num_images=len(files),
+            num_images=len(dataset_files),
             high_quality=high_quality
         )
         logger.info(f"Calculated credit cost: {credit_cost}")
@@ -250,53 +272,24 @@ async def upload_and_train(
                 detail=f"Insufficient credits. Required: {credit_cost}"
             )
         
-        # Create zip file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Process each file
-            for file in files:
-                # Create a temporary file with the original filename
-                temp_path = os.path.join(tempfile.gettempdir(), file.filename)
-                temp_files.append(temp_path)
-                
-                # Read content and save to temp file
-                content = await file.read()
-                with open(temp_path, "wb") as f:
-                    f.write(content)
-                logger.info(f"Saved temporary file: {temp_path} with original name: {file.filename}")
-                
-                # Add to zip with original filename
-                zip_file.write(temp_path, file.filename)
-                logger.info(f"Added to zip: {file.filename}")
-
-        # Get zip file size and log contents
-        zip_size = zip_buffer.tell()
-        zip_buffer.seek(0)
-        logger.info(f"Compressed zip size: {zip_size / (1024*1024):.2f} MB")
-        
-        # Generate unique filename for S3
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        s3_key = f"training_data/{user_id}_{timestamp}.zip"
-        logger.info(f"Generated zip filename: {s3_key}")
-
-        # Upload to S3
-        zip_buffer.seek(0)
-        s3_client.upload_fileobj(
-            zip_buffer,
-            BUCKET_NAME,
-            s3_key
-        )
-        logger.info(f"Successfully uploaded zip file to S3: {s3_key}")
+        # Downsize images to the trainer's maximum resolution before packaging
+        preprocessing_stats = None
+        if preprocess:
+            dataset_files, preprocessing_stats = await preprocess_dataset_files(dataset_files)
 
-        # Generate S3 URL
-        s3_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
-        logger.info(f"Generated S3 URL: {s3_url}")
+        # Reuse an identical stored dataset, otherwise stream the files into a new zip in S3
+        dataset = await get_or_create_dataset(db, user_id, dataset_files)
+        s3_url = dataset["s3_url"]
+        logger.info(f"Using dataset zip: {s3_url}")
+        if preprocessing_stats and preprocessing_stats["images"]:
+            logger.info(
+                f"Preprocessed {preprocessing_stats['images']} images: "
+                f"{preprocessing_stats['bytes_in'] / (1024*1024):.2f} MB -> {preprocessing_stats['bytes_out'] / (1024*1024):.2f} MB, "
+                f"avg {preprocessing_stats['avg_latency_ms']} ms/image"
+            )
 
-        # Initialize Replicate client
-        replicate_client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-        
         # Create or get the model first
-        full_model_name = create_replicate_model(replicate_client, model_name)
+        full_model_name = await create_replicate_model(model_name)
         logger.info(f"Created/Retrieved model: {full_model_name}")
         
         try:
@@ -317,10 +310,10 @@ async def upload_and_train(
             logger.info(f"Generated webhook URL: {webhook_url}")
             
             # Create training with webhook
-            training = replicate_client.trainings.create(
+            training = await get_replicate_gateway().create_training(
                 version="ostris/flux-dev-lora-trainer:e440909d3512c31646ee2e0c7d6f6f4923224863a6a10c494606e79fb5844497",
                 input={
-                    "input_images": s3_url,
+                    "input_images": sign_url(s3_url, ttl=settings.TRAINING_INPUT_URL_TTL_SECONDS),
                     "steps": 2000,
                     "lora_rank": 16,
                     "optimizer": "adamw8bit",
@@ -355,9 +348,13 @@ async def upload_and_train(
                 "created_at": datetime.utcnow(),
                 "credit_cost": credit_cost,
                 "high_quality": high_quality,
-                "num_images": len(files),
+                "num_images": len(dataset_files),
                 "replicate_model_id": full_model_name,
                 "s3_url": s3_url,
+                "dataset_id": dataset["dataset_id"],
+                "dataset_bytes": dataset["zip_bytes"],
+                "dataset_reused": dataset["reused"],
+                "preprocessing": preprocessing_stats,
                 "webhook_url": webhook_url
             }
 
@@ -383,6 +380,7 @@ async def upload_and_train(
                     }
                 }
             )
+            await invalidate_cached_user(user_id)
 
             # Return training information
             return {
@@ -423,14 +421,6 @@ async def upload_and_train(
     except Exception as e:
         logger.error(f"Error in upload-and-train: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Clean up temporary files
-        for temp_path in temp_files:
-            try:
-                os.unlink(temp_path)
-                logger.info(f"Cleaned up temporary file: {temp_path}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temp file {temp_path}: {str(e)}")
 
 @router.get("/check-training-status/{training_id}")
 async def check_training_status(
@@ -450,11 +440,8 @@ async def check_training_status(
         if str(training_run["user_id"]) != str(current_user["_id"]):
             raise HTTPException(status_code=403, detail="Not authorized to access this training run")
 
-        # Initialize Replicate client
-        replicate_client = replicate.Client(api_token=os.getenv('REPLICATE_API_TOKEN'))
-        
         # Get training status from Replicate
-        status_response = replicate_client.trainings.get(training_id)
+        status_response = await get_replicate_gateway().get_training(training_id)
         current_status = status_response.status
 
         # Get background client for database operations
@@ -487,21 +474,17 @@ async def check_training_status(
                     }
                 }
             )
+            await invalidate_cached_user(training_run["user_id"])
 
-            # Run automated inferences if training succeeded
+            # Queue automated inferences if training succeeded
             try:
-                logger.info(f"Starting automated inferences for model {model_version.id}")
-                inference_ids = await run_model_inferences(
+                logger.info(f"Queueing automated inferences for model {model_version.id}")
+                await enqueue_model_inferences(
+                    db_instance,
                     model_id=model_version.id,
                     user_id=str(training_run["user_id"]),
-                    db=db_instance
+                    training_id=training_id
                 )
-                logger.info(f"Completed automated inferences, count: {len(inference_ids)}")
-                
-                update_data.update({
-                    "automated_inference_ids": inference_ids,
-                    "automated_inference_count": len(inference_ids)
-                })
             except Exception as e:
                 logger.error(f"Error running automated inferences: {str(e)}")
                 # Don't raise the exception - we don't want to mark the training as failed
@@ -524,6 +507,7 @@ async def check_training_status(
                     }
                 }
             )
+            await invalidate_cached_user(training_run["user_id"])
 
         # Update training run with all accumulated changes
         await db_instance["training_runs"].update_one(
@@ -567,117 +551,223 @@ async def get_training_runs(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def sync_training_batch(db, runs: List[dict], semaphore: asyncio.Semaphore) -> List[dict]:
+    """Fetch Replicate statuses for a batch of runs concurrently and apply them with bulk writes"""
+    async def fetch_status(run):
+        async with semaphore:
+            try:
+                return run, await get_replicate_gateway().get_training(run["training_id"])
+            except Exception as e:
+                # Log the error but continue processing other runs
+                logger.error(f"Error processing training run {run['training_id']}: {str(e)}")
+                return run, None
+
+    results = await asyncio.gather(*(fetch_status(run) for run in runs))
+
+    training_ops = []
+    user_ops = []
+    updated_user_ids = []
+    updated_runs = []
+    for run, status_response in results:
+        if status_response is None:
+            continue
+        current_status = status_response.status
+        update_data = {"status": current_status}
+        version = weights = None
+
+        # If training is completed, update with output data
+        if current_status == "succeeded":
+            version = status_response.output.get("version")
+            weights = status_response.output.get("weights")
+            update_data.update({"version": version, "weights": weights})
+            user_status = "completed"
+        elif current_status in ["failed", "canceled"]:
+            user_status = "error"
+        else:
+            user_status = None
+
+        if user_status:
+            user_id = ObjectId(run["user_id"]) if ObjectId.is_valid(str(run["user_id"])) else run["user_id"]
+            user_ops.append(UpdateOne(
+                {"_id": user_id},
+                {"$set": {"model_status": user_status, "current_training_id": None}}
+            ))
+            updated_user_ids.append(run["user_id"])
+
+        training_ops.append(UpdateOne({"_id": run["_id"]}, {"$set": update_data}))
+        updated_runs.append({
+            "training_id": run["training_id"],
+            "status": current_status,
+            "version": version,
+            "weights": weights
+        })
+
+    if training_ops:
+        await db["training_runs"].bulk_write(training_ops, ordered=False)
+    if user_ops:
+        await db["users"].bulk_write(user_ops, ordered=False)
+        for user_id in updated_user_ids:
+            await invalidate_cached_user(user_id)
+    return updated_runs
+
 @router.post("/poll-training-runs")
 async def poll_training_runs(
+    batch_size: int = Query(100, ge=1, le=1000),
+    max_runs: int = Query(2000, ge=1),
     db: AsyncIOMotorClient = Depends(get_db)
 ):
+    """
+    Sweep in-progress training runs in _id order, resuming from the last checkpoint.
+    A sweep that hits max_runs stores its position so the next call continues from there.
+    """
     try:
-        # Find all training runs that are in progress
-        cursor = db["training_runs"].find({"status": "training"})
-        training_runs = await cursor.to_list(length=None)
-        
-        # Initialize Replicate client
-        replicate_client = replicate.Client(api_token=os.getenv('REPLICATE_API_TOKEN'))
-        
+        checkpoint = await db["sync_checkpoints"].find_one({"_id": POLL_CHECKPOINT_ID})
+        query = {"status": "training"}
+        if checkpoint and checkpoint.get("last_id"):
+            query["_id"] = {"$gt": checkpoint["last_id"]}
+
+        semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+
+        # Stream in-progress runs instead of materialising them all
+        cursor = db["training_runs"].find(
+            query,
+            {"training_id": 1, "user_id": 1}
+        ).sort("_id", 1).batch_size(batch_size)
+
         updated_runs = []
-        for run in training_runs:
-            try:
-                # Get training status from Replicate
-                status_response = replicate_client.trainings.get(run["training_id"])
-                current_status = status_response.status
-                
-                # Update training run with current status
-                update_data = {
-                    "status": current_status
-                }
-                
-                # If training is completed, update with output data
-                if current_status == "succeeded":
-                    update_data.update({
-                        "version": status_response.output.get("version"),
-                        "weights": status_response.output.get("weights")
-                    })
-                    
-                    # Update user's model status
-                    await db["users"].update_one(
-                        {"_id": run["user_id"]},
-                        {"$set": {
-                            "model_status": "completed",
-                            "current_training_id": None
-                        }}
-                    )
-                elif current_status in ["failed", "canceled"]:
-                    # Update user's model status for failed cases
-                    await db["users"].update_one(
-                        {"_id": run["user_id"]},
-                        {"$set": {
-                            "model_status": "error",
-                            "current_training_id": None
-                        }}
-                    )
-
-                await db["training_runs"].update_one(
-                    {"training_id": run["training_id"]},
-                    {"$set": update_data}
-                )
-                
-                updated_runs.append({
-                    "training_id": run["training_id"],
-                    "status": current_status,
-                    "version": status_response.output.get("version") if current_status == "succeeded" else None,
-                    "weights": status_response.output.get("weights") if current_status == "succeeded" else None
-                })
-                
-            except Exception as e:
-                # Log the error but continue processing other runs
-                print(f"Error processing training run {run['training_id']}: {str(e)}")
-                continue
+        processed = 0
+        batch = []
+        is_complete = True
+
+        async def flush(batch: List[dict]):
+            updated_runs.extend(await sync_training_batch(db, batch, semaphore))
+            await db["sync_checkpoints"].update_one(
+                {"_id": POLL_CHECKPOINT_ID},
+                {"$set": {"last_id": batch[-1]["_id"], "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+
+        async for run in cursor:
+            batch.append(run)
+            processed += 1
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+            if processed >= max_runs:
+                is_complete = False
+                break
+        if batch:
+            await flush(batch)
+        await cursor.close()
+
+        # A finished sweep starts from the beginning next time
+        if is_complete:
+            await db["sync_checkpoints"].delete_one({"_id": POLL_CHECKPOINT_ID})
 
         return {
             "status": "success",
+            "processed": processed,
+            "complete": is_complete,
             "updated_runs": updated_runs
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def upload_chunk_prefix(upload_id: str) -> str:
+    return f"training_uploads/{upload_id}/"
+
+def upload_chunk_key(upload_id: str, file_index: int, chunk_index: int) -> str:
+    return f"{upload_chunk_prefix(upload_id)}{file_index}/{chunk_index}"
+
+def upload_session_progress(session: dict) -> dict:
+    """Summarise received chunks per file and whether every file is complete"""
+    files = session.get("files", {})
+    received = 0
+    expected = 0
+    complete = len(files) == session["file_count"]
+    for file_state in files.values():
+        received += len(file_state["received_chunks"])
+        expected += file_state["total_chunks"]
+        if len(file_state["received_chunks"]) < file_state["total_chunks"]:
+            complete = False
+    return {"chunks_received": received, "total_expected": expected, "complete": complete}
+
 @router.post("/init-upload")
 async def init_upload(
     file_count: int,
     total_size: int,
     model_name: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorClient = Depends(get_db)
 ):
     """Initialize a new upload session"""
     try:
         upload_id = str(uuid.uuid4())
-        # Use system's temp directory instead of a fixed directory
-        base_upload_dir = Path(tempfile.gettempdir()) / "whatif_uploads"
-        base_upload_dir.mkdir(exist_ok=True, parents=True)
-        
-        upload_dir = base_upload_dir / upload_id
-        upload_dir.mkdir(exist_ok=True)
-        
-        # Store session info in a metadata file
-        session_metadata = {
-            "upload_id": upload_id,
+        now = datetime.utcnow()
+
+        # Session state lives in Mongo so any instance can accept the next chunk
+        await db[UPLOAD_SESSIONS_COLLECTION].insert_one({
+            "_id": upload_id,
             "user_id": str(current_user["_id"]),
             "model_name": model_name,
             "file_count": file_count,
             "total_size": total_size,
-            "uploaded_chunks": 0,
+            "uploaded_bytes": 0,
+            "files": {},
             "status": "initialized",
-            "created_at": datetime.utcnow().isoformat()
-        }
-        
-        with open(upload_dir / "session.json", "w") as f:
-            json.dump(session_metadata, f)
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + UPLOAD_SESSION_TTL
+        })
         
         return {"upload_id": upload_id}
     except Exception as e:
         logger.error(f"Error initializing upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_owned_upload_session(db: AsyncIOMotorClient, upload_id: str, current_user: dict) -> dict:
+    session = await db[UPLOAD_SESSIONS_COLLECTION].find_one({"_id": upload_id})
+    if not session:
+        logger.error(f"Upload session not found: {upload_id}")
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    # Verify user ownership
+    if session["user_id"] != str(current_user["_id"]):
+        logger.error(f"Unauthorized access to upload session: {upload_id}")
+        raise HTTPException(status_code=403, detail="Not authorized to access this upload session")
+    return session
+
+@router.get("/upload-status/{upload_id}")
+async def get_upload_status(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorClient = Depends(get_db)
+):
+    """Report received chunks per file so an interrupted upload can resume"""
+    try:
+        session = await get_owned_upload_session(db, upload_id, current_user)
+        return {
+            "upload_id": upload_id,
+            "status": session["status"],
+            "files": {
+                file_index: {
+                    "filename": file_state["filename"],
+                    "total_chunks": file_state["total_chunks"],
+                    "received_chunks": sorted(file_state["received_chunks"])
+                }
+                for file_index, file_state in session.get("files", {}).items()
+            },
+            **upload_session_progress(session),
+            "training_id": session.get("training_id"),
+            "error": session.get("error")
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting upload status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/upload-chunk/{upload_id}")
 async def upload_chunk(
     background_tasks: BackgroundTasks,
@@ -692,22 +782,7 @@ async def upload_chunk(
 ):
     """Handle individual chunk uploads"""
     try:
-        # Use system's temp directory
-        base_upload_dir = Path(tempfile.gettempdir()) / "whatif_uploads"
-        upload_dir = base_upload_dir / upload_id
-        session_file = upload_dir / "session.json"
-        
-        if not session_file.exists():
-            logger.error(f"Upload session not found: {upload_id}")
-            raise HTTPException(status_code=404, detail="Upload session not found")
-            
-        with open(session_file, 'r') as f:
-            session = json.load(f)
-            
-        # Verify user ownership
-        if session["user_id"] != str(current_user["_id"]):
-            logger.error(f"Unauthorized access to upload session: {upload_id}")
-            raise HTTPException(status_code=403, detail="Not authorized to access this upload session")
+        session = await get_owned_upload_session(db, upload_id, current_user)
 
         # Validate chunk parameters
         if chunk_index < 0 or chunk_index >= total_chunks:
@@ -716,80 +791,74 @@ async def upload_chunk(
         if file_index < 0 or file_index >= session["file_count"]:
             logger.error(f"Invalid file index: {file_index} for file count: {session['file_count']}")
             raise HTTPException(status_code=400, detail="Invalid file index")
+        if session["status"] == "failed":
+            raise HTTPException(status_code=409, detail=f"Upload session failed: {session.get('error')}")
+        if session["status"] not in UPLOAD_ACCEPTING_STATUSES:
+            return {"status": "completed", "processing": True}
 
-        # Create directories if they don't exist
-        file_dir = upload_dir / str(file_index)
-        file_dir.mkdir(parents=True, exist_ok=True)
-
-        # Store filename metadata
-        metadata_file = file_dir / "metadata.json"
-        if not metadata_file.exists():
-            metadata = {
-                "original_filename": filename,
-                "total_chunks": total_chunks,
-                "received_chunks": []
-            }
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f)
-        
-        # Save chunk with proper error handling
-        chunk_path = file_dir / f"chunk_{chunk_index}"
+        # Chunks are below the S3 multipart minimum part size, so each one is stored
+        # as its own object and streamed into the dataset zip on completion
+        chunk_data = await file.read()
         try:
-            # Read chunk in binary mode
-            chunk_data = await file.read()
-            # Write chunk in binary mode
-            with open(chunk_path, "wb") as f:
-                f.write(chunk_data)
+            await put_s3_object(upload_chunk_key(upload_id, file_index, chunk_index), chunk_data)
         except Exception as e:
             logger.error(f"Error saving chunk {chunk_index} for file {filename}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to save chunk: {str(e)}")
 
-        # Update metadata with received chunk
-        with open(metadata_file, 'r') as f:
-            metadata = json.load(f)
-        
-        if chunk_index not in metadata["received_chunks"]:
-            metadata["received_chunks"].append(chunk_index)
-            metadata["received_chunks"].sort()
-            
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f)
-
-        # Update session status
-        session["uploaded_chunks"] += 1
-        with open(session_file, 'w') as f:
-            json.dump(session, f)
+        # Record the chunk atomically; a retried chunk matches nothing and changes nothing
+        file_path = f"files.{file_index}"
+        sessions = db[UPLOAD_SESSIONS_COLLECTION]
+        session = await sessions.find_one_and_update(
+            {
+                "_id": upload_id,
+                "status": {"$in": UPLOAD_ACCEPTING_STATUSES},
+                f"{file_path}.received_chunks": {"$ne": chunk_index}
+            },
+            {
+                "$set": {
+                    f"{file_path}.filename": filename,
+                    f"{file_path}.total_chunks": total_chunks,
+                    "status": "uploading",
+                    "updated_at": datetime.utcnow()
+                },
+                "$addToSet": {f"{file_path}.received_chunks": chunk_index},
+                "$inc": {"uploaded_bytes": len(chunk_data)}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if session is None:
+            session = await sessions.find_one({"_id": upload_id})
+        progress = upload_session_progress(session)
 
         # Check if all chunks are uploaded
-        expected_chunks = session["file_count"] * total_chunks
-        if session["uploaded_chunks"] >= expected_chunks:
-            logger.info(f"All chunks received for upload session {upload_id}. Starting processing...")
-            # Process upload in the background
-            process_task = asyncio.create_task(process_completed_upload(
-                upload_id,
-                session["model_name"],
-                current_user,
-                db,
-                background_tasks
-            ))
+        if progress["complete"]:
+            # Only the request that moves the session out of the accepting states starts processing
+            claimed = await sessions.update_one(
+                {"_id": upload_id, "status": {"$in": UPLOAD_ACCEPTING_STATUSES}},
+                {"$set": {"status": "processing", "updated_at": datetime.utcnow()}}
+            )
+            if claimed.modified_count:
+                logger.info(f"All chunks received for upload session {upload_id}. Starting processing...")
+                # Process upload in the background
+                process_task = asyncio.create_task(process_completed_upload(
+                    upload_id,
+                    session["model_name"],
+                    current_user,
+                    db,
+                    background_tasks
+                ))
             return {"status": "completed", "processing": True}
             
         return {
             "status": "chunk_uploaded",
-            "chunks_received": session["uploaded_chunks"],
-            "total_expected": expected_chunks
+            "chunks_received": progress["chunks_received"],
+            "total_expected": progress["total_expected"]
         }
 
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error uploading chunk: {str(e)}")
-        # Clean up temporary files in case of error
-        try:
-            if 'chunk_path' in locals():
-                chunk_path.unlink(missing_ok=True)
-        except Exception as cleanup_error:
-            logger.error(f"Error cleaning up after failed upload: {str(cleanup_error)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/check-training-status/{model_name}")
@@ -826,102 +895,71 @@ async def check_training_status(
         logger.error(f"Error checking training status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def upload_session_dataset(session: dict) -> List[DatasetFile]:
+    """Dataset files that stream each uploaded file's chunks back out of S3 in order"""
+    async def iter_chunks(file_index: str, total_chunks: int):
+        for chunk_index in range(total_chunks):
+            async for data in iter_s3_object(upload_chunk_key(session["_id"], file_index, chunk_index)):
+                yield data
+
+    dataset_files = []
+    for file_index in sorted(session.get("files", {}), key=int):
+        file_state = session["files"][file_index]
+        dataset_files.append(DatasetFile(
+            filename=file_state["filename"],
+            content_type=None,
+            chunks=lambda file_index=file_index, total_chunks=file_state["total_chunks"]: iter_chunks(file_index, total_chunks)
+        ))
+    return dataset_files
+
 async def process_completed_upload(upload_id: str, model_name: str, current_user: dict, db: AsyncIOMotorClient, background_tasks: BackgroundTasks):
-    """Process a completed upload by assembling chunks and starting training"""
-    base_upload_dir = Path(tempfile.gettempdir()) / "whatif_uploads"
-    upload_dir = base_upload_dir / upload_id
-    temp_files = []
-    upload_files = []
-    
+    """Process a completed upload by streaming its chunks into the dataset zip and starting training"""
+    sessions = db[UPLOAD_SESSIONS_COLLECTION]
     try:
-        # Update session status
-        session_file = upload_dir / "session.json"
-        with open(session_file, 'r') as f:
-            session = json.load(f)
-        
-        session["status"] = "processing"
-        with open(session_file, 'w') as f:
-            json.dump(session, f)
-
-        # Assemble chunks for each file
-        for file_dir in upload_dir.iterdir():
-            if file_dir.is_dir() and file_dir.name.isdigit():  # Only process numbered directories
-                # Get metadata for original filename
-                metadata_file = file_dir / "metadata.json"
-                if not metadata_file.exists():
-                    logger.warning(f"No metadata found for directory {file_dir}")
-                    continue
-
-                with open(metadata_file, 'r') as f:
-                    metadata = json.load(f)
-                
-                original_filename = metadata.get("original_filename")
-                if not original_filename:
-                    logger.warning(f"No original filename found in metadata for directory {file_dir}")
-                    continue
-
-                # Get file extension from original filename
-                file_extension = os.path.splitext(original_filename)[1]
-                if not file_extension:
-                    file_extension = '.jpg'  # Fallback to .jpg if no extension found
-                
-                # Get chunks
-                chunks = sorted(file_dir.glob('chunk_*'), key=lambda x: int(x.name.split('_')[1]))
-                if not chunks:
-                    logger.warning(f"No chunks found for file {original_filename}")
-                    continue
-
-                # Create a temporary file with the correct extension
-                with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                    temp_path = temp_file.name
-                    temp_files.append(temp_path)
-                    
-                    # Assemble chunks directly into the temporary file
-                    for chunk in chunks:
-                        with open(chunk, 'rb') as chunk_file:
-                            shutil.copyfileobj(chunk_file, temp_file)
-                    
-                    logger.info(f"Assembled chunks into {temp_path} for {original_filename}")
-
-                # Create UploadFile object with the original filename
-                upload_file = UploadFile(
-                    filename=original_filename,
-                    file=open(temp_path, 'rb')
-                )
-                upload_files.append(upload_file)
-                logger.info(f"Created UploadFile for {original_filename}")
+        # upload_chunk has already moved the session to "processing"
+        session = await sessions.find_one({"_id": upload_id})
 
-        if not upload_files:
+        dataset_files = upload_session_dataset(session)
+        if not dataset_files:
             raise HTTPException(status_code=400, detail="No valid files were assembled")
 
-        # Start the training process with assembled files
-        return await upload_and_train(
-            files=upload_files,
+        # Start the training process with the uploaded files
+        result = await train_from_dataset(
+            dataset_files,
             model_name=model_name,
+            high_quality=False,
             current_user=current_user,
-            db=db,
-            background_tasks=background_tasks
+            db=db
+        )
+        await sessions.update_one(
+            {"_id": upload_id},
+            {"$set": {
+                "status": "completed",
+                "training_id": result["training_id"],
+                "updated_at": datetime.utcnow()
+            }}
         )
+        return result
 
     except Exception as e:
         logger.error(f"Error processing completed upload: {str(e)}")
         # Update session status to failed
         try:
-            session["status"] = "failed"
-            session["error"] = str(e)
-            with open(session_file, 'w') as f:
-                json.dump(session, f)
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            await sessions.update_one(
+                {"_id": upload_id},
+                {"$set": {"status": "failed", "error": error, "updated_at": datetime.utcnow()}}
+            )
         except Exception as update_error:
             logger.error(f"Error updating session status: {str(update_error)}")
         raise  # Re-raise the exception after logging
     finally:
-        # Clean up upload directory after processing is complete
+        # Chunks are no longer needed once they are in the dataset zip (or the upload failed)
         try:
-            if upload_dir.exists():
-                shutil.rmtree(upload_dir)
-                logger.info(f"Cleaned up upload directory: {upload_dir}")
+            deleted = await delete_s3_prefix(upload_chunk_prefix(upload_id))
+            logger.info(f"Cleaned up {deleted} uploaded chunks for session {upload_id}")
         except Exception as e:
-            logger.error(f"Error cleaning up upload directory {upload_dir}: {str(e)}")
+            logger.error(f"Error cleaning up chunks for upload {upload_id}: {str(e)}")
 
 @router.post("/webhook/training")
 async def training_webhook(
@@ -932,7 +970,7 @@ async def training_webhook(
     try:
         # Get the raw payload
         payload = await request.json()
-        logger.info(f"Received webhook payload: {payload}")
+        logger.debug(f"Received webhook payload: {payload}")
         
         # Extract relevant information
         training_id = payload.get("id")
@@ -977,21 +1015,18 @@ async def training_webhook(
                     }
                 }
             )
+            await invalidate_cached_user(training_run["user_id"])
             
-            # Run automated inferences if training succeeded
+            # Queue automated inferences so the webhook is acknowledged immediately;
+            # Replicate retries of this webhook are deduplicated by training_id
             try:
-                logger.info(f"Starting automated inferences for model {model_version}")
-                inference_ids = await run_model_inferences(
+                logger.info(f"Queueing automated inferences for model {model_version}")
+                await enqueue_model_inferences(
+                    db_instance,
                     model_id=model_version,
                     user_id=str(training_run["user_id"]),
-                    db=db_instance
+                    training_id=training_id
                 )
-                logger.info(f"Completed automated inferences, count: {len(inference_ids)}")
-                
-                update_data.update({
-                    "automated_inference_ids": inference_ids,
-                    "automated_inference_count": len(inference_ids)
-                })
             except Exception as e:
                 logger.error(f"Error running automated inferences: {str(e)}")
                 
@@ -1014,6 +1049,7 @@ async def training_webhook(
                     }
                 }
             )
+            await invalidate_cached_user(training_run["user_id"])
         
         # Update training run with all accumulated changes
         await db_instance["training_runs"].update_one(
@@ -0,0 +1,38 @@
+"""Feed a raw HTTP request into an ASGI app in chunks and hand back response messages as they are produced"""
+import asyncio
+
+# Request bodies are fed to the app in chunks of this size
+REQUEST_CHUNK_SIZE = 64 * 1024
+
+async def bridge_asgi_request(app, scope: dict, read_chunk, content_length: int, emit, disconnected: asyncio.Event = None):
+    """
+    Stream a request body into the ASGI app and emit response messages as they are produced.
+    The caller sets `disconnected` when the client goes away; it is also set once the
+    response is complete. Either way the app's next receive() gets http.disconnect.
+    """
+    loop = asyncio.get_running_loop()
+    disconnected = disconnected or asyncio.Event()
+    remaining = content_length
+    body_done = False
+
+    async def receive():
+        nonlocal remaining, body_done
+        if not body_done:
+            size = min(remaining, REQUEST_CHUNK_SIZE)
+            chunk = await loop.run_in_executor(None, read_chunk, size) if size > 0 else b""
+            remaining -= len(chunk)
+            # A short read means the client stopped sending
+            body_done = remaining <= 0 or not chunk
+            return {"type": "http.request", "body": chunk, "more_body": not body_done}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            disconnected.set()
+        await emit(message)
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
@@ -2,12 +2,14 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from ..config import settings
 from bson import ObjectId
 from ..dependencies import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from .user_cache import get_cached_token_subject, cache_token_subject, get_cached_user, cache_user
+import hmac
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -43,20 +45,47 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.JWT_ALGORITHM]
-        )
-        email: str = payload.get("sub")
-        if email is None:
+    email = get_cached_token_subject(token)
+    if email is None:
+        try:
+            payload = jwt.decode(
+                token,
+                settings.JWT_SECRET,
+                algorithms=[settings.JWT_ALGORITHM]
+            )
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        cache_token_subject(token, email, payload.get("exp"))
     
-    user = await db["users"].find_one({"email": email})
+    user = await get_cached_user(email)
     if user is None:
-        raise credentials_exception
+        user = await db["users"].find_one({"email": email})
+        if user is None:
+            raise credentials_exception
+        await cache_user(email, user)
     
-    return user 
\ No newline at end of file
+    return user
+
+def _secret_matches(provided: Optional[str], expected: str) -> bool:
+    return bool(expected) and provided is not None and hmac.compare_digest(provided.encode(), expected.encode())
+
+async def require_cron_secret(authorization: Optional[str] = Header(None)):
+    """
+    Guard for scheduled maintenance endpoints. Vercel Cron sends
+    `Authorization: Bearer $CRON_SECRET`; other schedulers must do the same.
+    """
+    if not settings.CRON_SECRET:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="CRON_SECRET is not configured")
+    if not _secret_matches(authorization, f"Bearer {settings.CRON_SECRET}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid cron secret")
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """
+    Guard for operational endpoints (stats, debug). They answer 404 unless
+    ADMIN_API_TOKEN is set and sent in the X-Admin-Token header.
+    """
+    if not _secret_matches(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
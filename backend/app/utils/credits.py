@@ -1,14 +1,25 @@
-from typing import Optional, Literal, Tuple
+from typing import Optional, Literal, Tuple, Union
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from ..models.payment import CreditTransactionInDB
 from fastapi import HTTPException, status
 from bson import ObjectId
+from pymongo import UpdateOne
 from pymongo.errors import PyMongoError
-from datetime import datetime
+from datetime import datetime, timedelta
+from .user_cache import invalidate_cached_user
 
 # Define valid transaction types
 TransactionType = Literal["purchase", "usage", "refund", "bonus", "expiry"]
 
+# Users whose balance changed more recently than this are skipped by the
+# background reconciliation, so in-flight ledger writes are not "corrected"
+RECONCILIATION_GRACE_PERIOD = timedelta(minutes=5)
+RECONCILIATION_BATCH_SIZE = 500
+
+def _user_id_filter(user_id: str) -> Union[ObjectId, str]:
+    """User ids are stored as ObjectId but passed around as strings"""
+    return ObjectId(user_id) if ObjectId.is_valid(str(user_id)) else user_id
+
 async def calculate_balance_from_transactions(db: AsyncIOMotorDatabase, user_id: str) -> int:
     """Calculate user's credit balance from transactions collection"""
     try:
@@ -30,10 +41,10 @@ async def calculate_balance_from_transactions(db: AsyncIOMotorDatabase, user_id:
 async def get_user_credit_balance(db: AsyncIOMotorDatabase, user_id: str) -> int:
     """Get user's current credit balance from users collection"""
     try:
-        user = await db.users.find_one({"_id": user_id}, {"credits_balance": 1})
+        user = await db.users.find_one({"_id": _user_id_filter(user_id)}, {"credits_balance": 1})
         if user is None or "credits_balance" not in user:
             # Initialize credits only if user exists but credits aren't initialized
-            if await db.users.find_one({"_id": user_id}):
+            if user is not None:
                 await initialize_user_credits(db, user_id)
                 return 0
             return 0
@@ -64,6 +75,7 @@ async def reconcile_credit_balance(db: AsyncIOMotorDatabase, user_id: str) -> Tu
                     }
                 }
             )
+            await invalidate_cached_user(user_id)
             return calculated_balance, True
         return stored_balance, False
     except PyMongoError as e:
@@ -76,15 +88,15 @@ async def initialize_user_credits(db: AsyncIOMotorDatabase, user_id: str, initia
     """Initialize credits_balance for a new user"""
     try:
         await db.users.update_one(
-            {"_id": user_id},
+            {"_id": _user_id_filter(user_id), "credits_balance": {"$exists": False}},
             {
-                "$setOnInsert": {
+                "$set": {
                     "credits_balance": initial_credits,
                     "last_balance_reconciliation": datetime.utcnow()
                 }
-            },
-            upsert=True
+            }
         )
+        await invalidate_cached_user(user_id)
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -126,48 +138,45 @@ async def create_credit_transaction(
         run_id=run_id
     )
     
+    user_id_filter = _user_id_filter(user_id)
+    balance_filter = {"_id": user_id_filter}
+    if amount < 0:
+        # Debits only apply while the materialised balance covers them
+        balance_filter["credits_balance"] = {"$gte": -amount}
+    
     try:
-        # Start a transaction to ensure atomicity
-        async with await db.client.start_session() as session:
-            async with session.start_transaction():
-                # Verify user exists and get current balance
-                user = await db.users.find_one(
-                    {"_id": ObjectId(user_id)},
-                    {"credits_balance": 1},
-                    session=session
-                )
-                
-                if not user:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="User not found"
-                    )
-                
-                # Insert the transaction
-                await db.credit_transactions.insert_one(
-                    transaction.dict(by_alias=True),
-                    session=session
-                )
-                
-                # Update user's balance
-                new_balance = user.get("credits_balance", 0) + amount
-                result = await db.users.update_one(
-                    {"_id": ObjectId(user_id)},
-                    {
-                        "$set": {
-                            "credits_balance": new_balance,
-                            "last_balance_update": datetime.utcnow()
-                        }
-                    },
-                    session=session
+        # Apply the balance change atomically; no read-modify-write or session needed
+        result = await db.users.update_one(
+            balance_filter,
+            {
+                "$inc": {"credits_balance": amount},
+                "$set": {"last_balance_update": datetime.utcnow()}
+            }
+        )
+        
+        if result.matched_count == 0:
+            if amount < 0 and await db.users.count_documents({"_id": user_id_filter}, limit=1):
+                raise HTTPException(
+                    status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                    detail="Insufficient credits"
                 )
-                
-                if result.matched_count == 0:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="User not found"
-                    )
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        
+        # Record the ledger entry
+        try:
+            await db.credit_transactions.insert_one(transaction.dict(by_alias=True))
+        except PyMongoError:
+            # Undo the balance change so the balance never drifts from the ledger
+            await db.users.update_one(
+                {"_id": user_id_filter},
+                {"$inc": {"credits_balance": -amount}}
+            )
+            raise
         
+        await invalidate_cached_user(user_id)
         return transaction
     except PyMongoError as e:
         raise HTTPException(
@@ -185,15 +194,8 @@ async def deduct_credits(
     """Deduct credits from user's balance"""
     if amount <= 0:
         raise ValueError("Deduction amount must be positive")
-        
-    # Reconcile balance before checking if sufficient credits
-    balance, was_reconciled = await reconcile_credit_balance(db, user_id)
-    if not balance >= amount:
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail="Insufficient credits"
-        )
     
+    # The conditional $inc rejects the deduction with 402 if the balance is too low
     return await create_credit_transaction(
         db=db,
         user_id=user_id,
@@ -223,4 +225,63 @@ async def add_credits(
         amount=amount,
         transaction_type=transaction_type,
         description=description
-    ) 
\ No newline at end of file
+    )
+
+async def reconcile_all_credit_balances(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = RECONCILIATION_BATCH_SIZE
+) -> dict:
+    """
+    Background reconciliation of materialised balances against the ledger.
+    Streams per-user ledger totals and corrects mismatched balances in bulk.
+    """
+    stats = {"users_checked": 0, "users_reconciled": 0}
+    cutoff = datetime.utcnow() - RECONCILIATION_GRACE_PERIOD
+
+    async def reconcile_batch(totals: dict):
+        users = db.users.find(
+            {"_id": {"$in": list(totals.keys())}},
+            {"credits_balance": 1, "last_balance_update": 1}
+        )
+        operations = []
+        reconciled_ids = []
+        async for user in users:
+            stats["users_checked"] += 1
+            stored_balance = user.get("credits_balance", 0)
+            calculated_balance = totals[user["_id"]]
+            last_update = user.get("last_balance_update")
+            if stored_balance == calculated_balance or (last_update and last_update > cutoff):
+                continue
+            # Only overwrite the balance we compared against
+            operations.append(UpdateOne(
+                {"_id": user["_id"], "credits_balance": user.get("credits_balance")},
+                {"$set": {
+                    "credits_balance": calculated_balance,
+                    "last_balance_reconciliation": datetime.utcnow()
+                }}
+            ))
+            reconciled_ids.append(user["_id"])
+        if operations:
+            result = await db.users.bulk_write(operations, ordered=False)
+            stats["users_reconciled"] += result.modified_count
+            for user_id in reconciled_ids:
+                await invalidate_cached_user(user_id)
+
+    try:
+        pipeline = [
+            {"$group": {"_id": "$user_id", "total": {"$sum": "$amount"}}}
+        ]
+        totals = {}
+        async for row in db.credit_transactions.aggregate(pipeline, allowDiskUse=True):
+            totals[_user_id_filter(row["_id"])] = row["total"]
+            if len(totals) >= batch_size:
+                await reconcile_batch(totals)
+                totals = {}
+        if totals:
+            await reconcile_batch(totals)
+        return stats
+    except PyMongoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error during reconciliation: {str(e)}"
+        )
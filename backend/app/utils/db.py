@@ -1,50 +1,149 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.server_api import ServerApi
-from functools import lru_cache
+from pymongo import monitoring
 from ..config.config import settings
+from collections import defaultdict
 import logging
-import asyncio
+import threading
 
 logger = logging.getLogger(__name__)
 
-# Global client for background tasks
-_background_client = None
+# Process-wide client shared by request handlers and background tasks
+_client = None
+_client_lock = threading.Lock()
 
-def get_background_db_client():
-    """Get a persistent database client for background tasks"""
-    global _background_client
-    if _background_client is None:
-        _background_client = AsyncIOMotorClient(
-            settings.MONGODB_URI,
-            server_api=ServerApi('1'),
-            tlsAllowInvalidCertificates=True,
-            serverSelectionTimeoutMS=50000,
-            connectTimeoutMS=50000,
-            socketTimeoutMS=50000,
-            maxPoolSize=10
-        )
-        # Mark this client as a background client
-        setattr(_background_client, '_is_background', True)
-    return _background_client
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Collects per-pool connection metrics from pymongo's CMAP events"""
 
-async def get_db():
-    """Get a database instance for request-scoped operations"""
-    client = AsyncIOMotorClient(
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = defaultdict(lambda: {
+            "checked_out": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "connections_created": 0,
+            "handshakes": 0,
+            "connections_closed": 0,
+            "pool_clears": 0
+        })
+
+    def _pool(self, event):
+        return self._pools["%s:%s" % event.address]
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event)["pool_clears"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event)["connections_created"] += 1
+
+    def connection_ready(self, event):
+        # Emitted once the connection handshake (and TLS/auth) has completed
+        with self._lock:
+            self._pool(event)["handshakes"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event)["connections_closed"] += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._pool(event)["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        wait_ms = getattr(event, "duration", 0.0) * 1000
+        with self._lock:
+            pool = self._pool(event)
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            pool["total_wait_ms"] += wait_ms
+            pool["max_wait_ms"] = max(pool["max_wait_ms"], wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event)["checked_out"] -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pools = {}
+            for address, stats in self._pools.items():
+                avg_wait = stats["total_wait_ms"] / stats["checkouts"] if stats["checkouts"] else 0.0
+                pools[address] = {**stats, "avg_wait_ms": round(avg_wait, 3)}
+            return pools
+
+pool_metrics = PoolMetricsListener()
+
+def _create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
         settings.MONGODB_URI,
         server_api=ServerApi('1'),
         tlsAllowInvalidCertificates=True,
         serverSelectionTimeoutMS=50000,
         connectTimeoutMS=50000,
-        socketTimeoutMS=50000
+        socketTimeoutMS=50000,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[pool_metrics]
     )
-    try:
-        yield client[settings.DB_NAME]
-    finally:
-        client.close()
+
+def get_db_client() -> AsyncIOMotorClient:
+    """Get the shared database client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+                logger.info("Created shared MongoDB client")
+    return _client
+
+def init_db_client() -> AsyncIOMotorClient:
+    """Create the shared client at application startup"""
+    return get_db_client()
+
+def close_db_client():
+    """Close the shared client - should only be called on application shutdown"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("Closed shared MongoDB client")
+
+def get_db_pool_stats() -> dict:
+    """Return connection pool metrics for the shared client"""
+    return {
+        "client_initialized": _client is not None,
+        "max_pool_size": settings.MONGODB_MAX_POOL_SIZE,
+        "min_pool_size": settings.MONGODB_MIN_POOL_SIZE,
+        "pools": pool_metrics.snapshot()
+    }
+
+def get_background_db_client():
+    """Get a persistent database client for background tasks"""
+    return get_db_client()
+
+async def get_db():
+    """Get a database instance for request-scoped operations"""
+    yield get_db_client()[settings.DB_NAME]
 
 def close_background_client():
     """Close the background client - should only be called on application shutdown"""
-    global _background_client
-    if _background_client:
-        _background_client.close()
-        _background_client = None 
\ No newline at end of file
+    close_db_client()
@@ -0,0 +1,235 @@
+"""Precomputed, compressed pages of the public feed served from memory"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import OperationFailure
+from .pagination import SORT_ORDER, UNDATED_START_CURSOR, fetch_page, paginate
+from .db import get_db_client
+from .url_signing import sign_url
+from ..config import settings
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Redis is an optional shared backend
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+if settings.FEED_CACHE_BACKEND == "redis" and redis_asyncio is None:
+    raise RuntimeError("FEED_CACHE_BACKEND is redis but the redis package is not installed")
+
+FEED_PROJECTION = {
+    "_id": 1,
+    "prompt": 1,
+    "created_at": 1,
+    "s3_url": 1
+}
+REDIS_KEY_PREFIX = "whatif:feed_cache"
+# Backoff between change stream reconnects after a transient error
+WATCH_RETRY_BASE_SECONDS = 1
+WATCH_RETRY_MAX_SECONDS = 60
+
+@dataclass
+class FeedPage:
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+# (limit, cursor) -> FeedPage for the first FEED_CACHE_PAGES pages
+_pages: Dict[tuple, FeedPage] = {}
+_expires_at = 0.0
+_refresh_lock = None
+_refresh_lock_loop = None
+_watch_task = None
+_change_streams_unsupported = False
+_redis = None
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "refreshes": 0,
+    "invalidations": 0,
+    "not_modified": 0,
+    "watch_restarts": 0
+}
+
+def format_feed_example(example: dict) -> dict:
+    return {
+        "_id": str(example["_id"]),
+        "prompt": example.get("prompt", ""),
+        "created_at": example.get("created_at", ""),
+        "output_urls": [sign_url(example.get("s3_url"))] if example.get("s3_url") else []
+    }
+
+def _use_redis() -> bool:
+    return settings.FEED_CACHE_BACKEND == "redis"
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis_asyncio.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD or None
+        )
+    return _redis
+
+def _page_from_body(body: bytes) -> FeedPage:
+    return FeedPage(
+        body=body,
+        gzipped=gzip.compress(body, compresslevel=6),
+        etag=f'"{hashlib.sha1(body).hexdigest()}"'
+    )
+
+def _build_page(examples: list, next_cursor: Optional[str]) -> FeedPage:
+    body = json.dumps(jsonable_encoder({
+        "examples": examples,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })).encode()
+    return _page_from_body(body)
+
+async def _materialise(db, limit: int) -> Dict[tuple, FeedPage]:
+    """Build the first FEED_CACHE_PAGES pages from a single query"""
+    page_count = settings.FEED_CACHE_PAGES
+    documents = await db["feed"].find({}, FEED_PROJECTION).sort(SORT_ORDER).limit(
+        page_count * limit + 1
+    ).to_list(length=page_count * limit + 1)
+
+    pages = {}
+    cursor = None
+    for start in range(0, page_count * limit, limit):
+        chunk, next_cursor = paginate(documents[start:start + limit + 1], limit)
+        if not chunk and start == 0:
+            # Only undated examples; fetch_page reads those in _id order
+            chunk, next_cursor = await fetch_page(db["feed"], {}, limit, projection=FEED_PROJECTION)
+            pages[(limit, cursor)] = _build_page([format_feed_example(doc) for doc in chunk], next_cursor)
+            break
+        pages[(limit, cursor)] = _build_page([format_feed_example(doc) for doc in chunk], next_cursor)
+        # Pages from the undated boundary on are not materialised; they are read from Mongo
+        if next_cursor is None or next_cursor == UNDATED_START_CURSOR:
+            break
+        cursor = next_cursor
+    return pages
+
+def _get_refresh_lock() -> asyncio.Lock:
+    global _refresh_lock, _refresh_lock_loop
+    loop = asyncio.get_running_loop()
+    if _refresh_lock is None or _refresh_lock_loop is not loop:
+        _refresh_lock = asyncio.Lock()
+        _refresh_lock_loop = loop
+    return _refresh_lock
+
+async def _load_from_redis(limit: int) -> Optional[Dict[tuple, FeedPage]]:
+    try:
+        raw = await _get_redis().get(f"{REDIS_KEY_PREFIX}:{limit}")
+    except Exception as e:
+        logger.warning(f"Feed cache backend error: {str(e)}")
+        return None
+    if not raw:
+        return None
+    # Only the JSON bodies are shared; compression and ETags are recomputed locally
+    return {(limit, cursor): _page_from_body(body.encode()) for cursor, body in json.loads(raw)}
+
+async def _store_in_redis(limit: int, pages: Dict[tuple, FeedPage]):
+    try:
+        payload = json.dumps([[cursor, page.body.decode()] for (_, cursor), page in pages.items()])
+        await _get_redis().set(f"{REDIS_KEY_PREFIX}:{limit}", payload, ex=settings.FEED_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Feed cache backend error: {str(e)}")
+
+async def _refresh(db, limit: int):
+    global _pages, _expires_at
+    pages = await _load_from_redis(limit) if _use_redis() else None
+    if pages is None:
+        pages = await _materialise(db, limit)
+        _stats["refreshes"] += 1
+        if _use_redis():
+            await _store_in_redis(limit, pages)
+    _pages = {key: page for key, page in _pages.items() if key[0] != limit}
+    _pages.update(pages)
+    _expires_at = time.monotonic() + settings.FEED_CACHE_TTL_SECONDS
+
+async def get_feed_page(db, limit: int, cursor: Optional[str]) -> Optional[FeedPage]:
+    """
+    Serve a page from the materialised feed. Returns None for pages beyond the
+    cached range, which the caller reads from Mongo directly.
+    """
+    _ensure_watcher()
+    if limit != settings.FEED_CACHE_PAGE_SIZE:
+        _stats["misses"] += 1
+        return None
+    if time.monotonic() >= _expires_at or (limit, None) not in _pages:
+        async with _get_refresh_lock():
+            if time.monotonic() >= _expires_at or (limit, None) not in _pages:
+                await _refresh(db, limit)
+    page = _pages.get((limit, cursor))
+    _stats["hits" if page else "misses"] += 1
+    return page
+
+async def invalidate_feed_cache():
+    """Drop materialised pages so the next request rebuilds them"""
+    global _expires_at
+    _expires_at = 0.0
+    _stats["invalidations"] += 1
+    if _use_redis():
+        try:
+            await _get_redis().delete(f"{REDIS_KEY_PREFIX}:{settings.FEED_CACHE_PAGE_SIZE}")
+        except Exception as e:
+            logger.warning(f"Feed cache backend error: {str(e)}")
+
+async def _watch_feed():
+    """
+    Invalidate on any write to the feed collection. Transient errors (elections, network
+    blips) reopen the stream with backoff; only a server without change streams leaves
+    the cache on TTL refresh for good.
+    """
+    global _change_streams_unsupported
+    db = get_db_client()[settings.DB_NAME]
+    delay = WATCH_RETRY_BASE_SECONDS
+    while True:
+        try:
+            async with db["feed"].watch() as stream:
+                delay = WATCH_RETRY_BASE_SECONDS
+                async for _ in stream:
+                    await invalidate_feed_cache()
+        except OperationFailure as e:
+            _change_streams_unsupported = True
+            logger.warning(f"Feed change stream unavailable, relying on TTL refresh: {str(e)}")
+            return
+        except Exception as e:
+            logger.warning(f"Feed change stream error, reconnecting in {delay}s: {str(e)}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WATCH_RETRY_MAX_SECONDS)
+            _stats["watch_restarts"] += 1
+            # Writes made while the stream was down were missed
+            await invalidate_feed_cache()
+
+def _ensure_watcher():
+    global _watch_task
+    if _change_streams_unsupported:
+        return
+    loop = asyncio.get_running_loop()
+    if _watch_task is None or _watch_task.done() or _watch_task.get_loop() is not loop:
+        _watch_task = loop.create_task(_watch_feed())
+
+def record_not_modified():
+    _stats["not_modified"] += 1
+
+def get_feed_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "backend": "redis" if _use_redis() else "memory",
+        "watching": _watch_task is not None and not _watch_task.done(),
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "pages_cached": len(_pages),
+        "bytes_cached": sum(len(page.gzipped) for page in _pages.values()),
+        "ttl_seconds": settings.FEED_CACHE_TTL_SECONDS
+    }
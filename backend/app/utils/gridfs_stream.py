@@ -0,0 +1,95 @@
+"""Chunked GridFS ingest and streaming with HTTP range and conditional request support"""
+from typing import AsyncIterator, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket, AsyncIOMotorGridOut
+from ..config import settings
+import hashlib
+
+def gridfs_etag(grid_out: AsyncIOMotorGridOut) -> str:
+    """Strong ETag from the stored checksum, falling back to the immutable file id"""
+    metadata = grid_out.metadata or {}
+    digest = metadata.get("sha256") or getattr(grid_out, "md5", None) or f"{grid_out._id}-{grid_out.length}"
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+def if_range_allows(if_range: Optional[str], etag: str) -> bool:
+    """
+    Whether a Range request may be honoured under If-Range. RFC 9110 requires a strong
+    comparison: the validator must equal our (strong) ETag exactly. Weak tags, and
+    dates, since no Last-Modified is sent, fall back to the full body.
+    """
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    return not if_range.startswith("W/") and not etag.startswith("W/") and if_range == etag
+
+def parse_range(range_header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end).
+    Returns None when the whole file should be sent; multi-range requests
+    are answered with the full body, which RFC 9110 allows.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else length - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(length - int(end_text), 0)
+            end = length - 1
+    except ValueError:
+        return None
+    end = min(end, length - 1)
+    if start > end or start >= length:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, end
+
+async def iter_grid_out(grid_out: AsyncIOMotorGridOut, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield the inclusive byte range one GridFS chunk at a time"""
+    end = grid_out.length - 1 if end is None else end
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+async def upload_to_gridfs(fs: AsyncIOMotorGridFSBucket, file: UploadFile, metadata: dict) -> Tuple[ObjectId, str]:
+    """
+    Copy an upload into GridFS chunk by chunk, hashing as it goes.
+    Returns the file id and the hex sha256, which is stored in the file metadata.
+    """
+    grid_in = fs.open_upload_stream(
+        file.filename,
+        chunk_size_bytes=settings.GRIDFS_CHUNK_SIZE_BYTES,
+        metadata=metadata
+    )
+    digest = hashlib.sha256()
+    try:
+        while chunk := await file.read(settings.GRIDFS_CHUNK_SIZE_BYTES):
+            digest.update(chunk)
+            await grid_in.write(chunk)
+        # Metadata set before close() is written with the files document
+        await grid_in.set("metadata", {**metadata, "sha256": digest.hexdigest()})
+        await grid_in.close()
+    except Exception:
+        await grid_in.abort()
+        raise
+    return grid_in._id, digest.hexdigest()
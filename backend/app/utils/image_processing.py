@@ -0,0 +1,217 @@
+"""Training image preprocessing, run in a process pool off the event loop"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
+from .training_data import DatasetFile
+from ..config.inference_config import TRAINING_PREPROCESS_CONFIG
+import asyncio
+import io
+import logging
+import mimetypes
+import multiprocessing
+import os
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are used as uploaded
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Set when worker processes cannot be started here (no /dev/shm on Lambda/Vercel)
+_process_pool_unavailable = False
+
+def preprocessing_available() -> bool:
+    return Image is not None and TRAINING_PREPROCESS_CONFIG["enabled"]
+
+def _process_context():
+    """
+    Prefer forkserver: a plain fork copies locks held by this process's other threads
+    (event loop, log listener, a previous pool's feeder) and the worker can hang on them.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Get the shared preprocessing pool, creating it on first use. None if processes are unavailable"""
+    global _executor, _process_pool_unavailable
+    if _executor is None and not _process_pool_unavailable:
+        with _executor_lock:
+            if _executor is None and not _process_pool_unavailable:
+                try:
+                    _executor = ProcessPoolExecutor(
+                        max_workers=TRAINING_PREPROCESS_CONFIG["workers"],
+                        mp_context=_process_context()
+                    )
+                except (OSError, NotImplementedError) as e:
+                    # multiprocessing needs POSIX semaphores, which live in /dev/shm
+                    logger.warning(f"Process pool unavailable, processing images in threads: {str(e)}")
+                    _process_pool_unavailable = True
+    return _executor
+
+def _discard_process_pool(executor: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+async def run_in_process_pool(func, *args):
+    """
+    Run CPU-bound image work in the process pool, or in a thread where there is none.
+    A pool broken by a dead worker is discarded so the next call starts a fresh one.
+    """
+    executor = get_process_pool()
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        logger.error("Image process pool is broken; replacing it")
+        _discard_process_pool(executor)
+        raise
+
+def shutdown_process_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def _preprocess_image_bytes(data: bytes, max_resolution: int, jpeg_quality: int, keep_original: bool = True) -> Tuple[bytes, bool]:
+    """
+    Decode, apply EXIF orientation, downsize and re-encode as JPEG.
+    Returns (image bytes, changed); with keep_original the input is returned if re-encoding would not help.
+    Runs in a worker process.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        oriented = ImageOps.exif_transpose(image)
+        needs_resize = max(oriented.size) > max_resolution
+        needs_rotate = oriented is not image
+        if oriented.mode != "RGB":
+            oriented = oriented.convert("RGB")
+        if needs_resize:
+            oriented.thumbnail((max_resolution, max_resolution), Image.LANCZOS)
+        output = io.BytesIO()
+        oriented.save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+    processed = output.getvalue()
+    if keep_original and not needs_resize and not needs_rotate and len(processed) >= len(data):
+        return data, False
+    return processed, True
+
+async def preprocess_image(data: bytes, keep_original: bool = True) -> Tuple[bytes, bool]:
+    return await run_in_process_pool(
+        _preprocess_image_bytes,
+        data,
+        TRAINING_PREPROCESS_CONFIG["max_resolution"],
+        TRAINING_PREPROCESS_CONFIG["jpeg_quality"],
+        keep_original
+    )
+
+async def _read_all(dataset_file: DatasetFile) -> bytes:
+    buffer = bytearray()
+    async for chunk in dataset_file.chunks():
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+def _is_image(dataset_file: DatasetFile) -> bool:
+    content_type = dataset_file.content_type or mimetypes.guess_type(dataset_file.filename)[0]
+    return bool(content_type) and content_type.startswith("image/")
+
+def _unique_filename(filename: str, taken: set) -> str:
+    """filename, or filename with a _1, _2... suffix if an earlier file already uses it"""
+    stem, extension = os.path.splitext(filename)
+    candidate = filename
+    suffix = 1
+    while candidate.lower() in taken:
+        candidate = f"{stem}_{suffix}{extension}"
+        suffix += 1
+    taken.add(candidate.lower())
+    return candidate
+
+async def preprocess_dataset_files(files: List[DatasetFile]) -> Tuple[List[DatasetFile], Optional[dict]]:
+    """
+    Wrap every image in a dataset so it is preprocessed when its bytes are read, one file
+    at a time, instead of holding the whole processed dataset in memory.
+    Non-JPEG images become .jpg, with zip entry names de-duplicated across the dataset.
+    Files are identified for dataset reuse by their original bytes plus the preprocessing
+    settings, so a reused dataset is never processed.
+    Returns the wrapped files and stats (bytes saved, per-image latency) that fill in as
+    they are read, or the input unchanged when Pillow is unavailable.
+    JPEGs that fail to decode are passed through as uploaded; any other image that fails
+    rejects the dataset with a 400, since it would otherwise be stored under a .jpg name.
+    """
+    if not preprocessing_available():
+        return files, None
+
+    settings_tag = (
+        f"preprocess:{TRAINING_PREPROCESS_CONFIG['max_resolution']}:{TRAINING_PREPROCESS_CONFIG['jpeg_quality']}\n"
+    ).encode()
+    stats = {
+        "images": 0,
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "bytes_saved": 0,
+        "avg_latency_ms": 0.0,
+        "max_latency_ms": 0.0
+    }
+    total_latency_ms = 0.0
+
+    async def processed_chunks(dataset_file: DatasetFile, keep_original: bool):
+        nonlocal total_latency_ms
+        data = await _read_all(dataset_file)
+        started = time.monotonic()
+        try:
+            processed, _ = await preprocess_image(data, keep_original)
+        except Exception as e:
+            if not keep_original:
+                logger.warning(f"Could not convert {dataset_file.filename} to JPEG: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Could not read image {dataset_file.filename}; upload it as JPEG or PNG"
+                )
+            logger.warning(f"Could not preprocess {dataset_file.filename}, using it as uploaded: {str(e)}")
+            processed = data
+        latency_ms = (time.monotonic() - started) * 1000
+        total_latency_ms += latency_ms
+        stats["images"] += 1
+        stats["bytes_in"] += len(data)
+        stats["bytes_out"] += len(processed)
+        stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+        stats["avg_latency_ms"] = round(total_latency_ms / stats["images"], 1)
+        stats["max_latency_ms"] = round(max(stats["max_latency_ms"], latency_ms), 1)
+        yield processed
+
+    async def identity_chunks(dataset_file: DatasetFile):
+        yield settings_tag
+        async for chunk in dataset_file.chunks():
+            yield chunk
+
+    taken = set()
+    wrapped = []
+    for dataset_file in files:
+        if not _is_image(dataset_file):
+            wrapped.append(DatasetFile(
+                filename=_unique_filename(dataset_file.filename, taken),
+                content_type=dataset_file.content_type,
+                chunks=dataset_file.chunks,
+                hash_chunks=dataset_file.hash_chunks
+            ))
+            continue
+        stem, extension = os.path.splitext(dataset_file.filename)
+        is_jpeg = extension.lower() in (".jpg", ".jpeg")
+        wrapped.append(DatasetFile(
+            # The name is fixed before processing; other formats are re-encoded to match it or rejected
+            filename=_unique_filename(dataset_file.filename if is_jpeg else f"{stem}.jpg", taken),
+            content_type="image/jpeg",
+            chunks=lambda dataset_file=dataset_file, is_jpeg=is_jpeg: processed_chunks(dataset_file, keep_original=is_jpeg),
+            hash_chunks=lambda dataset_file=dataset_file: identity_chunks(dataset_file)
+        ))
+    return wrapped, stats
@@ -0,0 +1,214 @@
+"""Gallery thumbnails and responsive widths, rendered in the image process pool"""
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from .image_processing import Image, ImageOps, run_in_process_pool
+from .job_queue import enqueue_job, kick_drain, register_job_handler
+from .s3_transfer import (
+    iter_s3_object,
+    put_s3_object,
+    s3_key_for_url,
+    s3_object_exists,
+    s3_url_for_key
+)
+from ..config import settings
+from ..config.inference_config import IMAGE_VARIANT_CONFIG, S3_TRANSFER_CONFIG
+import asyncio
+import hashlib
+import io
+import logging
+import posixpath
+import re
+
+logger = logging.getLogger(__name__)
+
+# Variants are only derived from stored inference outputs:
+# inference_data/{user_id}/{inference_id}/image_{index}.png, as written by store_images_to_s3
+INFERENCE_OUTPUT_KEY = re.compile(r"^inference_data/[^/]+/([0-9a-f]{24})/image_\d+\.png$")
+
+def variants_available() -> bool:
+    return Image is not None and IMAGE_VARIANT_CONFIG["enabled"]
+
+def _render_variants(data: bytes, widths: List[int], image_format: str, quality: int) -> Dict[int, bytes]:
+    """
+    Decode once and encode one image per width, keeping the aspect ratio.
+    Originals narrower than a width are re-encoded at their own size, never upscaled.
+    Runs in a worker process.
+    """
+    variants = {}
+    with Image.open(io.BytesIO(data)) as image:
+        oriented = ImageOps.exif_transpose(image)
+        if oriented.mode not in ("RGB", "RGBA"):
+            oriented = oriented.convert("RGBA" if "A" in oriented.getbands() else "RGB")
+        for width in widths:
+            target = min(width, oriented.width)
+            resized = oriented
+            if target < oriented.width:
+                height = max(1, round(oriented.height * target / oriented.width))
+                resized = oriented.resize((target, height), Image.LANCZOS)
+            output = io.BytesIO()
+            resized.save(output, format=image_format, quality=quality)
+            variants[width] = output.getvalue()
+    return variants
+
+async def render_variants(data: bytes, widths: Optional[List[int]] = None) -> Dict[int, bytes]:
+    return await run_in_process_pool(
+        _render_variants,
+        data,
+        widths or IMAGE_VARIANT_CONFIG["widths"],
+        IMAGE_VARIANT_CONFIG["format"],
+        IMAGE_VARIANT_CONFIG["quality"]
+    )
+
+def variant_key(key: str, width: int) -> str:
+    """inference_data/{user_id}/{inference_id}/image_0.png -> .../variants/image_0_w320.webp"""
+    directory, filename = posixpath.split(key)
+    stem = posixpath.splitext(filename)[0]
+    return f"{directory}/variants/{stem}_w{width}.{IMAGE_VARIANT_CONFIG['extension']}"
+
+async def store_variants(key: str, data: bytes) -> bool:
+    """Render and upload every width for a stored original. Failures are logged, not raised"""
+    try:
+        variants = await render_variants(data)
+
+        def put(width: int):
+            return put_s3_object(
+                variant_key(key, width),
+                variants[width],
+                IMAGE_VARIANT_CONFIG["content_type"],
+                cache_control=S3_TRANSFER_CONFIG["immutable_cache_control"]
+            )
+
+        # The widest variant goes last; its existence marks the set complete
+        widest = max(variants)
+        await asyncio.gather(*(put(width) for width in variants if width != widest))
+        await put(widest)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to generate variants for {key}: {str(e)}")
+        return False
+
+async def variants_exist(key: str) -> bool:
+    return await s3_object_exists(variant_key(key, max(IMAGE_VARIANT_CONFIG["widths"])))
+
+async def ensure_variants(key: str) -> bool:
+    """Generate variants for an original already in S3 unless they exist"""
+    if not variants_available():
+        return False
+    if await variants_exist(key):
+        return True
+    buffer = bytearray()
+    async for chunk in iter_s3_object(key):
+        buffer.extend(chunk)
+    return await store_variants(key, bytes(buffer))
+
+JOB_TYPE_IMAGE_VARIANTS = "image_variants"
+
+async def enqueue_run_variants(db, inference_id: str) -> bool:
+    """
+    Queue variant rendering for a run whose output_urls are stored, so it happens
+    after the response instead of in the request path. The run gets variants_ready
+    once every variant is written; until then the lazy endpoint serves them.
+    """
+    if not variants_available():
+        return False
+    created = await enqueue_job(
+        db,
+        JOB_TYPE_IMAGE_VARIANTS,
+        {"inference_id": inference_id},
+        idempotency_key=f"{JOB_TYPE_IMAGE_VARIANTS}:{inference_id}"
+    )
+    if created and settings.JOB_DRAIN_ON_ENQUEUE and not settings.JOB_WORKER_IN_PROCESS:
+        kick_drain(db)
+    return created
+
+async def handle_image_variants_job(db, payload: dict) -> dict:
+    run = await db["inference_runs"].find_one({"_id": ObjectId(payload["inference_id"])}, {"output_urls": 1})
+    if not run:
+        return {"images": 0}
+    keys = [key for key in map(s3_key_for_url, run.get("output_urls", [])) if key]
+    # One original in memory at a time
+    failed = [key for key in keys if not await ensure_variants(key)]
+    if failed:
+        raise RuntimeError(f"Variants failed for {len(failed)} of {len(keys)} images")
+    await db["inference_runs"].update_one({"_id": run["_id"]}, {"$set": {"variants_ready": True}})
+    return {"images": len(keys)}
+
+register_job_handler(JOB_TYPE_IMAGE_VARIANTS, handle_image_variants_job)
+
+def variant_urls(url: str, ready: bool = False) -> Dict[str, str]:
+    """
+    Width -> URL for one stored original. Ready variants are linked directly;
+    otherwise the links go through the lazy endpoint, which generates them on first request.
+    """
+    key = s3_key_for_url(url)
+    if not variants_available() or key is None or not INFERENCE_OUTPUT_KEY.match(key):
+        return {}
+    if ready:
+        return {str(width): s3_url_for_key(variant_key(key, width)) for width in IMAGE_VARIANT_CONFIG["widths"]}
+    return {
+        str(width): f"{settings.FRONTEND_URL}/api/canvasinference/variant?key={key}&width={width}"
+        for width in IMAGE_VARIANT_CONFIG["widths"]
+    }
+
+def photo_variant_id(photo: dict, width: int) -> Optional[ObjectId]:
+    existing = (photo.get("variants") or {}).get(str(width))
+    return ObjectId(existing) if existing else None
+
+async def get_photo_variant(db, fs: AsyncIOMotorGridFSBucket, photo: dict, width: int) -> Optional[ObjectId]:
+    """
+    GridFS file id of a photo variant, rendering and storing it on first request.
+    Only the request that claims the width renders it; concurrent requests get None
+    and serve the original until the variant is recorded.
+    """
+    existing = photo_variant_id(photo, width)
+    if existing:
+        return existing
+
+    claimed_at = datetime.utcnow()
+    stale_before = claimed_at - timedelta(seconds=IMAGE_VARIANT_CONFIG["render_claim_seconds"])
+    claim_field = f"variant_renders.{width}"
+    claimed = await db["photos"].update_one(
+        {
+            "_id": photo["_id"],
+            f"variants.{width}": {"$exists": False},
+            claim_field: {"$not": {"$gt": stale_before}}
+        },
+        {"$set": {claim_field: claimed_at}}
+    )
+    if claimed.modified_count == 0:
+        return None
+    claim = {"_id": photo["_id"], claim_field: claimed_at}
+
+    try:
+        grid_out = await fs.open_download_stream(ObjectId(photo["file_id"]))
+        data = await grid_out.read()
+        body = (await render_variants(data, [width]))[width]
+        metadata = {
+            "content_type": IMAGE_VARIANT_CONFIG["content_type"],
+            "user_id": photo.get("user_id"),
+            "variant_of": ObjectId(photo["file_id"]),
+            "width": width,
+            "sha256": hashlib.sha256(body).hexdigest()
+        }
+        stem = posixpath.splitext(photo.get("filename") or "photo")[0]
+        file_id = await fs.upload_from_stream(
+            f"{stem}_w{width}.{IMAGE_VARIANT_CONFIG['extension']}",
+            body,
+            metadata=metadata
+        )
+    except Exception:
+        await db["photos"].update_one(claim, {"$unset": {claim_field: ""}})
+        raise
+
+    # Record the file only while the claim is still ours; a render that outlived it is discarded
+    result = await db["photos"].update_one(
+        claim,
+        {"$set": {f"variants.{width}": file_id}, "$unset": {claim_field: ""}}
+    )
+    if result.modified_count == 0:
+        await fs.delete(file_id)
+        winner = await db["photos"].find_one({"_id": photo["_id"]}, {"variants": 1})
+        return photo_variant_id(winner or {}, width)
+    return file_id
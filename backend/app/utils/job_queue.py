@@ -0,0 +1,257 @@
+"""Durable background job queue backed by the Mongo `jobs` collection"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ..models.indexes import INDEX_SPECS
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+
+JOB_LEASE_SECONDS = 600  # A worker must renew its lease within this window
+JOB_RETRY_BASE_SECONDS = 30
+JOB_POLL_INTERVAL_SECONDS = 5
+
+JobHandler = Callable[[AsyncIOMotorDatabase, dict], Awaitable[Any]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+# Strong references to in-flight kick_drain tasks so they are not garbage collected
+_drain_tasks = set()
+# Databases whose jobs indexes this process has already ensured
+_indexed_databases = set()
+
+def register_job_handler(job_type: str, handler: JobHandler):
+    """Register the coroutine that executes jobs of the given type"""
+    JOB_HANDLERS[job_type] = handler
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+async def ensure_job_indexes(db: AsyncIOMotorDatabase):
+    """
+    Create the jobs indexes before the first enqueue. The unique idempotency_key
+    index is what makes enqueue_job's upsert deduplicate, so it cannot wait for
+    the background index bootstrap at startup.
+    """
+    if db.name in _indexed_databases:
+        return
+    await db[JOBS_COLLECTION].create_indexes(INDEX_SPECS[JOBS_COLLECTION])
+    _indexed_databases.add(db.name)
+
+async def enqueue_job(
+    db: AsyncIOMotorDatabase,
+    job_type: str,
+    payload: dict,
+    idempotency_key: str,
+    max_attempts: int = 3
+) -> bool:
+    """
+    Enqueue a job once per idempotency key.
+    Returns True if the job was created, False if it already existed.
+    """
+    await ensure_job_indexes(db)
+    now = datetime.utcnow()
+    try:
+        result = await db[JOBS_COLLECTION].update_one(
+            {"idempotency_key": idempotency_key},
+            {"$setOnInsert": {
+                "idempotency_key": idempotency_key,
+                "type": job_type,
+                "payload": payload,
+                "status": "queued",
+                "attempts": 0,
+                "max_attempts": max_attempts,
+                "run_after": now,
+                "created_at": now
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Lost an upsert race on the unique index; the other enqueue created the job
+        return False
+    created = result.upserted_id is not None
+    if created:
+        logger.info(f"Enqueued {job_type} job {idempotency_key}")
+    return created
+
+async def claim_job(db: AsyncIOMotorDatabase, worker_id: str) -> Optional[dict]:
+    """Lease the next runnable job, including jobs whose previous lease expired"""
+    now = datetime.utcnow()
+    return await db[JOBS_COLLECTION].find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_after": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lte": now}}
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "started_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def _renew_lease(db: AsyncIOMotorDatabase, job_id, worker_id: str):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await db[JOBS_COLLECTION].update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+        )
+
+async def _finish_job(db: AsyncIOMotorDatabase, job: dict, worker_id: str, update: dict):
+    # Only the current lease holder may finish the job
+    await db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "worker_id": worker_id, "status": "running"},
+        {"$set": {**update, "finished_at": datetime.utcnow()}, "$unset": {"lease_expires_at": ""}}
+    )
+
+async def execute_job(db: AsyncIOMotorDatabase, job: dict, worker_id: str):
+    """Run a claimed job and record its outcome"""
+    handler = JOB_HANDLERS.get(job["type"])
+    if handler is None:
+        await _finish_job(db, job, worker_id, {"status": "failed", "error": f"No handler for job type {job['type']}"})
+        return
+    if job["attempts"] > job["max_attempts"]:
+        await _finish_job(db, job, worker_id, {"status": "failed", "error": "Maximum attempts exceeded"})
+        return
+
+    lease_task = asyncio.create_task(_renew_lease(db, job["_id"], worker_id))
+    started = time.monotonic()
+    try:
+        result = await handler(db, job["payload"])
+        await _finish_job(db, job, worker_id, {
+            "status": "succeeded",
+            "result": result,
+            "duration_seconds": round(time.monotonic() - started, 3)
+        })
+        logger.info(f"Job {job['idempotency_key']} succeeded")
+    except Exception as e:
+        logger.error(f"Job {job['idempotency_key']} failed on attempt {job['attempts']}: {str(e)}", exc_info=True)
+        if job["attempts"] < job["max_attempts"]:
+            backoff = JOB_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+            await db[JOBS_COLLECTION].update_one(
+                {"_id": job["_id"], "worker_id": worker_id, "status": "running"},
+                {
+                    "$set": {
+                        "status": "queued",
+                        "error": str(e),
+                        "run_after": datetime.utcnow() + timedelta(seconds=random.uniform(backoff / 2, backoff))
+                    },
+                    "$unset": {"lease_expires_at": ""}
+                }
+            )
+        else:
+            await _finish_job(db, job, worker_id, {"status": "failed", "error": str(e)})
+    finally:
+        lease_task.cancel()
+
+async def drain_jobs(
+    db: AsyncIOMotorDatabase,
+    worker_id: Optional[str] = None,
+    max_jobs: int = 10,
+    time_budget_seconds: float = 240
+) -> int:
+    """Process queued jobs until the queue is empty or a limit is hit. Returns jobs processed"""
+    worker_id = worker_id or default_worker_id()
+    deadline = time.monotonic() + time_budget_seconds
+    processed = 0
+    while processed < max_jobs and time.monotonic() < deadline:
+        job = await claim_job(db, worker_id)
+        if job is None:
+            break
+        await execute_job(db, job, worker_id)
+        processed += 1
+    return processed
+
+def kick_drain(db: AsyncIOMotorDatabase, max_jobs: int = 1):
+    """
+    Best-effort drain in this process right after enqueueing, so a job starts
+    without waiting for the next scheduled /jobs/drain. The scheduled drain
+    remains the backstop if this invocation is frozen or recycled.
+    """
+    async def drain():
+        try:
+            await drain_jobs(db, max_jobs=max_jobs)
+        except Exception as e:
+            logger.error(f"In-process drain failed: {str(e)}")
+
+    task = asyncio.create_task(drain())
+    _drain_tasks.add(task)
+    task.add_done_callback(_drain_tasks.discard)
+
+async def run_worker(
+    db: AsyncIOMotorDatabase,
+    concurrency: int = 1,
+    stop_event: Optional[asyncio.Event] = None,
+    poll_interval: float = JOB_POLL_INTERVAL_SECONDS
+):
+    """Long-running worker loop; runs `concurrency` jobs at a time until stop_event is set"""
+    stop_event = stop_event or asyncio.Event()
+    worker_id = default_worker_id()
+
+    async def worker_loop(slot: int):
+        slot_id = f"{worker_id}:{slot}"
+        while not stop_event.is_set():
+            try:
+                job = await claim_job(db, slot_id)
+                if job is not None:
+                    await execute_job(db, job, slot_id)
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker {slot_id} error: {str(e)}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    logger.info(f"Job worker {worker_id} started with concurrency {concurrency}")
+    await asyncio.gather(*(worker_loop(slot) for slot in range(concurrency)))
+
+async def get_queue_stats(db: AsyncIOMotorDatabase) -> dict:
+    """Queue depth by status plus latency of recently finished jobs"""
+    counts = {}
+    async for row in db[JOBS_COLLECTION].aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["count"]
+
+    oldest = await db[JOBS_COLLECTION].find_one(
+        {"status": "queued"},
+        {"created_at": 1},
+        sort=[("created_at", 1)]
+    )
+    oldest_age = (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0
+
+    latency = await db[JOBS_COLLECTION].aggregate([
+        {"$match": {"status": "succeeded"}},
+        {"$sort": {"finished_at": -1}},
+        {"$limit": 100},
+        {"$group": {
+            "_id": None,
+            "avg_queue_wait_ms": {"$avg": {"$subtract": ["$started_at", "$created_at"]}},
+            "avg_total_latency_ms": {"$avg": {"$subtract": ["$finished_at", "$created_at"]}},
+            "avg_run_seconds": {"$avg": "$duration_seconds"}
+        }}
+    ]).to_list(1)
+    latency = latency[0] if latency else {}
+    latency.pop("_id", None)
+
+    return {
+        "depth": counts.get("queued", 0),
+        "by_status": counts,
+        "oldest_queued_age_seconds": round(oldest_age, 3),
+        "recent_latency": latency
+    }
@@ -0,0 +1,172 @@
+"""
+Process-wide logging: records are queued by the calling thread and written by a
+QueueListener thread, so handlers never block the event loop. The queue is bounded;
+when the writer falls behind, new records are dropped and counted instead of
+growing memory.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from ..config import settings
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+def _parse_mapping(value: str) -> Dict[str, str]:
+    """Parse "a.b=DEBUG,c=0.1" into {"a.b": "DEBUG", "c": "0.1"}"""
+    mapping = {}
+    for item in value.split(","):
+        name, _, setting = item.strip().partition("=")
+        if name and setting:
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, origin and any `extra=` fields"""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep 1 in N records at INFO and below for configured logger prefixes.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first so the most specific rate wins
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if rate >= 1:
+                    return True
+                if rate <= 0:
+                    return False
+                every = round(1 / rate)
+                with self._lock:
+                    count = self._counters.get(prefix, 0)
+                    self._counters[prefix] = count + 1
+                return count % every == 0
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue the record with its message rendered, leaving formatting to the listener's handlers.
+    Never waits for space: a record that does not fit a bounded queue is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render arguments now, since they may be mutated after the call returns
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _build_handlers() -> list:
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(logging.FileHandler(settings.LOG_FILE, mode='a'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def configure_logging() -> QueueListener:
+    """Install the queue-based pipeline on the root logger. Safe to call more than once"""
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        rates = {name: float(rate) for name, rate in _parse_mapping(settings.LOG_SAMPLE_RATES).items()}
+        queue_handler.addFilter(SamplingFilter(rates))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        _queue_handler = queue_handler
+        root.setLevel(settings.LOG_LEVEL.upper())
+        for name, level in _parse_mapping(settings.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = QueueListener(log_queue, *_build_handlers(), respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+            _queue_handler = None
+
+def get_logging_stats() -> Optional[dict]:
+    if _listener is None:
+        return None
+    return {
+        "format": settings.LOG_FORMAT,
+        "level": settings.LOG_LEVEL,
+        "module_levels": _parse_mapping(settings.LOG_LEVELS),
+        "sample_rates": _parse_mapping(settings.LOG_SAMPLE_RATES),
+        "queued": _listener.queue.qsize(),
+        "queue_max_size": settings.LOG_QUEUE_MAX_SIZE,
+        "dropped": _queue_handler.dropped if _queue_handler is not None else 0
+    }
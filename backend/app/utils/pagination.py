@@ -0,0 +1,112 @@
+"""Keyset pagination on (created_at, _id) with opaque continuation tokens"""
+from typing import Any, List, Optional, Tuple
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorCollection
+import base64
+import json
+import threading
+import time
+
+SORT_ORDER = [("created_at", -1), ("_id", -1)]
+# Documents whose created_at is missing or not a date sort after every dated one;
+# they are paged by _id alone once the dated documents are exhausted
+UNDATED_SORT_ORDER = [("_id", -1)]
+UNDATED = {"created_at": {"$not": {"$type": "date"}}}
+COUNT_CACHE_TTL_SECONDS = 60
+COUNT_CACHE_MAX_SIZE = 10000
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+def _is_undated(document: dict) -> bool:
+    return not isinstance(document.get("created_at"), datetime)
+
+def _encode(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+# Continuation token for the first undated document
+UNDATED_START_CURSOR = _encode({})
+
+def encode_cursor(document: dict) -> str:
+    """Continuation token pointing just past the given document"""
+    if _is_undated(document):
+        return _encode({"id": str(document["_id"])})
+    return _encode({"t": document["created_at"].isoformat(), "id": str(document["_id"])})
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], Optional[ObjectId]]:
+    """(created_at, _id) of the cursor's document; created_at is None inside the undated tail"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        created_at = datetime.fromisoformat(data["t"]) if "t" in data else None
+        last_id = ObjectId(data["id"]) if "id" in data else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if created_at is not None and last_id is None:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return created_at, last_id
+
+def after_cursor(query: dict, cursor: Optional[str]) -> Tuple[dict, list]:
+    """Restrict a query to documents that sort after the cursor; returns the query and the sort to read it in"""
+    if not cursor:
+        return query, SORT_ORDER
+    created_at, last_id = decode_cursor(cursor)
+    if created_at is None:
+        undated = UNDATED if last_id is None else {**UNDATED, "_id": {"$lt": last_id}}
+        return {"$and": [query, undated]}, UNDATED_SORT_ORDER
+    return {"$and": [query, {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}},
+        UNDATED
+    ]}]}, SORT_ORDER
+
+def paginate(documents: List[dict], limit: int, sort: list = SORT_ORDER) -> Tuple[List[dict], Optional[str]]:
+    """
+    Cut one page from up to limit + 1 documents read in `sort` order; returns it and the next cursor.
+    A dated page ends where undated documents begin, and the cursor restarts at the undated tail.
+    """
+    page = documents[:limit]
+    if sort is SORT_ORDER:
+        for index, document in enumerate(page):
+            if _is_undated(document):
+                return page[:index], UNDATED_START_CURSOR
+        if len(documents) > limit and _is_undated(documents[limit]):
+            return page, UNDATED_START_CURSOR
+    next_cursor = encode_cursor(page[-1]) if len(documents) > limit and page else None
+    return page, next_cursor
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Return one page in (created_at, _id) descending order and the cursor for the next page.
+    Reads one extra document to know whether another page exists, so no count is needed.
+    """
+    filtered, sort = after_cursor(query, cursor)
+    documents = await collection.find(filtered, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+    page, next_cursor = paginate(documents, limit, sort)
+    if not page and next_cursor == UNDATED_START_CURSOR:
+        # Nothing dated is left; start on the undated tail
+        return await fetch_page(collection, query, limit, UNDATED_START_CURSOR, projection)
+    return page, next_cursor
+
+async def cached_count(collection: AsyncIOMotorCollection, query: dict, cache_key: Any) -> int:
+    """count_documents, cached for COUNT_CACHE_TTL_SECONDS; totals are display-only"""
+    key = (collection.name, cache_key)
+    now = time.monotonic()
+    with _count_cache_lock:
+        entry = _count_cache.get(key)
+        if entry and entry[1] > now:
+            return entry[0]
+    count = await collection.count_documents(query)
+    with _count_cache_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (count, now + COUNT_CACHE_TTL_SECONDS)
+    return count
@@ -2,32 +2,22 @@
 from datetime import datetime
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-import replicate
 import logging
-from typing import List, Dict, Any
-import boto3
-import os
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import random
+import time
 from ..config import settings
-from ..config.inference_config import (
-    S3_BUCKET_NAME,
-    S3_REGION,
-    DEFAULT_INFERENCE_PARAMS
-)
+from ..config.inference_config import DEFAULT_INFERENCE_PARAMS, AUTOMATED_INFERENCE_CONFIG
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=S3_REGION
-)
-
 # Import helper functions from canvas_inference
-from ..routes.canvas_inference import serialize_prediction, store_images_to_s3
+from ..routes.canvas_inference import serialize_prediction
+from .image_variants import enqueue_run_variants
+from .s3_transfer import store_images_to_s3
+from .replicate_gateway import get_replicate_gateway
+from .job_queue import enqueue_job, kick_drain, register_job_handler
 
 # Constants for prompts
 gender = "f"
@@ -50,12 +40,33 @@ prompt10 = "model wearing casual clothes in polaroid classic photograph posing f
 prompts = [prompt1, prompt2, prompt3, prompt4, prompt5, 
            prompt6, prompt7, prompt8, prompt9, prompt10]
 
+async def run_prediction_with_retry(
+    model_id: str,
+    inference_params: Dict[str, Any]
+) -> Tuple[Any, int]:
+    """Run a prediction, retrying with exponential backoff and full jitter. Returns (prediction, attempts)"""
+    max_attempts = AUTOMATED_INFERENCE_CONFIG["max_attempts"]
+    for attempt in range(1, max_attempts + 1):
+        try:
+            # The gateway handles rate limiting, throttling and the per-model concurrency cap
+            prediction = await get_replicate_gateway().run(model_id, inference_params)
+            return prediction, attempt
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            backoff = AUTOMATED_INFERENCE_CONFIG["base_backoff_seconds"] * (2 ** (attempt - 1))
+            delay = random.uniform(0, backoff)
+            logger.warning(f"Prediction attempt {attempt}/{max_attempts} failed for model {model_id}, retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+
 async def process_single_prompt(
     prompt: str,
     model_id: str,
     user_id: str,
     db: AsyncIOMotorClient,
-    replicate_client: replicate.Client
+    queue_wait_seconds: float = 0.0,
+    training_id: Optional[str] = None,
+    prompt_index: Optional[int] = None
 ) -> Dict[str, Any]:
     """Process a single prompt using the existing inference pipeline"""
     try:
@@ -75,9 +86,12 @@ async def process_single_prompt(
             "created_at": datetime.utcnow(),
             "prompt": prompt,
             "processing_stats": {
-                "start_time": datetime.utcnow().isoformat()
+                "start_time": datetime.utcnow().isoformat(),
+                "queue_wait_seconds": round(queue_wait_seconds, 3)
             },
-            "is_automated": True  # Flag to identify automated inferences
+            "is_automated": True,  # Flag to identify automated inferences
+            "training_id": training_id,
+            "prompt_index": prompt_index
         }
         
         # Insert record
@@ -85,16 +99,20 @@ async def process_single_prompt(
         inference_id = str(result.inserted_id)
         
         # Run inference
-        prediction = await replicate_client.async_run(
+        prediction_started = time.monotonic()
+        prediction, attempts = await run_prediction_with_retry(
             model_id,
-            input=inference_params
+            inference_params
         )
+        prediction_seconds = time.monotonic() - prediction_started
         
         # Process results
         output_urls = serialize_prediction(prediction)
         
         # Upload to S3
+        storage_started = time.monotonic()
         s3_urls = await store_images_to_s3(output_urls, user_id, inference_id)
+        storage_seconds = time.monotonic() - storage_started
         
         # Calculate processing time
         end_time = datetime.utcnow()
@@ -110,9 +128,13 @@ async def process_single_prompt(
                 "output_urls": s3_urls,
                 "completed_at": end_time,
                 "processing_stats.end_time": end_time.isoformat(),
-                "processing_stats.total_time_seconds": total_time
+                "processing_stats.total_time_seconds": total_time,
+                "processing_stats.prediction_seconds": round(prediction_seconds, 3),
+                "processing_stats.storage_seconds": round(storage_seconds, 3),
+                "processing_stats.attempts": attempts
             }}
         )
+        await enqueue_run_variants(db, inference_id)
         
         return inference_id
         
@@ -132,48 +154,124 @@ async def process_single_prompt(
 async def run_model_inferences(
     model_id: str,
     user_id: str,
-    db: AsyncIOMotorClient
+    db: AsyncIOMotorClient,
+    training_id: Optional[str] = None
 ) -> List[str]:
     """
-    Run a set of predefined inferences for a newly trained model using the existing inference pipeline
+    Run a set of predefined inferences for a newly trained model using the existing inference pipeline.
+    Prompts run concurrently, bounded by AUTOMATED_INFERENCE_CONFIG["concurrency"].
     Args:
         model_id: The Replicate model ID to use
         user_id: The user ID who owns the model
         db: Database connection
+        training_id: If given, each completed inference is recorded on the training run as it finishes
     Returns:
         List[str]: List of inference IDs for tracking
+    Raises:
+        RuntimeError: If any prompt failed, after the others finish, so the job is retried
     """
     try:
         logger.info(f"Starting automated inferences for model {model_id}")
         inference_ids = []
+        failed_indexes = []
+        semaphore = asyncio.Semaphore(AUTOMATED_INFERENCE_CONFIG["concurrency"])
+        started = time.monotonic()
         
-        # Initialize Replicate client
-        replicate_client = replicate.Client(api_token=settings.REPLICATE_API_TOKEN)
-        
-        # Process each prompt
-        for index, prompt in enumerate(prompts):
-            try:
-                inference_id = await process_single_prompt(
-                    prompt=prompt,
-                    model_id=model_id,
-                    user_id=user_id,
-                    db=db,
-                    replicate_client=replicate_client
+        # A retried run only redoes the prompts that have not completed yet
+        completed_indexes = set()
+        if training_id:
+            async for run in db["inference_runs"].find(
+                {"training_id": training_id, "status": "completed"},
+                {"prompt_index": 1}
+            ):
+                completed_indexes.add(run.get("prompt_index"))
+        
+        async def run_prompt(index: int, prompt: str):
+            queued_at = time.monotonic()
+            async with semaphore:
+                try:
+                    inference_id = await process_single_prompt(
+                        prompt=prompt,
+                        model_id=model_id,
+                        user_id=user_id,
+                        db=db,
+                        queue_wait_seconds=time.monotonic() - queued_at,
+                        training_id=training_id,
+                        prompt_index=index
+                    )
+                except Exception as e:
+                    logger.error(f"Error processing prompt {index}: {str(e)}")
+                    failed_indexes.append(index)
+                    return
+            inference_ids.append(inference_id)
+            logger.info(f"Completed inference {index + 1}/{len(prompts)} for model {model_id}")
+            # Record partial results so progress survives an interrupted fan-out
+            if training_id:
+                await db["training_runs"].update_one(
+                    {"training_id": training_id},
+                    {
+                        "$addToSet": {"automated_inference_ids": inference_id},
+                        "$inc": {"automated_inference_count": 1}
+                    }
                 )
-                inference_ids.append(inference_id)
-                logger.info(f"Completed inference {index + 1}/{len(prompts)} for model {model_id}")
-            except Exception as e:
-                logger.error(f"Error processing prompt {index}: {str(e)}")
-                continue
         
-        logger.info(f"Completed all automated inferences for model {model_id}")
+        await asyncio.gather(*(
+            run_prompt(index, prompt)
+            for index, prompt in enumerate(prompts)
+            if index not in completed_indexes
+        ))
+        
+        wall_time = time.monotonic() - started
+        if training_id:
+            await db["training_runs"].update_one(
+                {"training_id": training_id},
+                {"$set": {
+                    "automated_inference_stats": {
+                        "succeeded": len(inference_ids) + len(completed_indexes),
+                        "failed": len(failed_indexes),
+                        "concurrency": AUTOMATED_INFERENCE_CONFIG["concurrency"],
+                        "wall_time_seconds": round(wall_time, 3)
+                    }
+                }}
+            )
+        
+        if failed_indexes:
+            # Completed prompts are skipped on the retry, so only the failures are redone
+            raise RuntimeError(f"{len(failed_indexes)} of {len(prompts)} automated inferences failed: prompts {sorted(failed_indexes)}")
+        
+        logger.info(f"Completed all automated inferences for model {model_id} in {wall_time:.1f}s")
         return inference_ids
         
     except Exception as e:
         logger.error(f"Error in run_model_inferences: {str(e)}")
         raise
 
+JOB_TYPE_AUTOMATED_INFERENCES = "automated_inferences"
 
+async def enqueue_model_inferences(
+    db: AsyncIOMotorClient,
+    model_id: str,
+    user_id: str,
+    training_id: str
+) -> bool:
+    """Queue the automated inferences for a training run; at most once per training_id"""
+    created = await enqueue_job(
+        db,
+        JOB_TYPE_AUTOMATED_INFERENCES,
+        {"model_id": model_id, "user_id": user_id, "training_id": training_id},
+        idempotency_key=f"{JOB_TYPE_AUTOMATED_INFERENCES}:{training_id}"
+    )
+    if created and settings.JOB_DRAIN_ON_ENQUEUE and not settings.JOB_WORKER_IN_PROCESS:
+        kick_drain(db)
+    return created
 
+async def handle_automated_inferences_job(db: AsyncIOMotorClient, payload: dict) -> dict:
+    inference_ids = await run_model_inferences(
+        model_id=payload["model_id"],
+        user_id=payload["user_id"],
+        db=db,
+        training_id=payload["training_id"]
+    )
+    return {"inference_count": len(inference_ids)}
 
-
+register_job_handler(JOB_TYPE_AUTOMATED_INFERENCES, handle_automated_inferences_job)
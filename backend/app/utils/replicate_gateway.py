@@ -0,0 +1,216 @@
+"""Shared async gateway for Replicate API calls: pooled connections, rate limiting and back-off"""
+from typing import Any, Dict, Optional
+from ..config import settings
+from ..config.inference_config import REPLICATE_GATEWAY_CONFIG
+from replicate.exceptions import ModelError
+import asyncio
+import httpx
+import logging
+import random
+import replicate
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+# Handled here with async sleeps so the client's own (blocking) retry layer rarely sees them
+RETRY_STATUS_CODES = (429, 503, 504)
+
+_stats = {
+    "requests": 0,
+    "throttled": 0,
+    "throttle_retries_exhausted": 0,
+    "rate_limit_wait_seconds": 0.0
+}
+
+class TokenBucket:
+    """Thread-safe token bucket; acquiring reserves a token and returns how long to wait for it"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available now, without reserving a future one"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+_bucket = TokenBucket(
+    REPLICATE_GATEWAY_CONFIG["requests_per_second"],
+    REPLICATE_GATEWAY_CONFIG["burst"]
+)
+
+def _throttle_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After", "").strip()
+    # Retry-After may also be an HTTP date; those fall back to exponential backoff
+    if retry_after.replace(".", "", 1).isdigit():
+        return float(retry_after)
+    backoff = REPLICATE_GATEWAY_CONFIG["throttle_backoff_seconds"] * (2 ** attempt)
+    return random.uniform(0, min(backoff, REPLICATE_GATEWAY_CONFIG["max_throttle_backoff_seconds"]))
+
+class RateLimitedTransport(httpx.AsyncBaseTransport, httpx.BaseTransport):
+    """
+    Transport that takes a token from the shared bucket before every request and
+    retries 429/503/504 responses, honouring Retry-After. Rejected requests were
+    never processed, so POSTs are retried as well.
+    """
+
+    def __init__(self):
+        limits = httpx.Limits(
+            max_connections=REPLICATE_GATEWAY_CONFIG["max_connections"],
+            max_keepalive_connections=REPLICATE_GATEWAY_CONFIG["max_connections"]
+        )
+        self._async_transport = httpx.AsyncHTTPTransport(limits=limits)
+        self._sync_transport = httpx.HTTPTransport(limits=limits)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            wait = _bucket.reserve()
+            if wait:
+                _stats["rate_limit_wait_seconds"] += wait
+                await asyncio.sleep(wait)
+            _stats["requests"] += 1
+            response = await self._async_transport.handle_async_request(request)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            _stats["throttled"] += 1
+            if attempt >= REPLICATE_GATEWAY_CONFIG["max_throttle_retries"]:
+                _stats["throttle_retries_exhausted"] += 1
+                return response
+            delay = _throttle_delay(response, attempt)
+            await response.aclose()
+            logger.warning(f"Replicate throttled {request.method} {request.url.path}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            wait = _bucket.reserve()
+            if wait:
+                _stats["rate_limit_wait_seconds"] += wait
+                time.sleep(wait)
+            _stats["requests"] += 1
+            response = self._sync_transport.handle_request(request)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            _stats["throttled"] += 1
+            if attempt >= REPLICATE_GATEWAY_CONFIG["max_throttle_retries"]:
+                _stats["throttle_retries_exhausted"] += 1
+                return response
+            delay = _throttle_delay(response, attempt)
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._async_transport.aclose()
+
+    def close(self):
+        self._sync_transport.close()
+
+class ReplicateGateway:
+    """
+    Async facade over the Replicate client. Every call goes through the async HTTP
+    client, so nothing blocks the event loop, and predictions per model are capped.
+    Instances are bound to one event loop; use get_replicate_gateway().
+    """
+
+    def __init__(self):
+        self.client = replicate.Client(
+            api_token=settings.REPLICATE_API_TOKEN,
+            transport=RateLimitedTransport()
+        )
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _model_semaphore(self, model_id: str) -> asyncio.Semaphore:
+        model_key = model_id.split(":")[0]
+        if model_key not in self._model_semaphores:
+            self._model_semaphores[model_key] = asyncio.Semaphore(REPLICATE_GATEWAY_CONFIG["per_model_concurrency"])
+        return self._model_semaphores[model_key]
+
+    async def create_prediction(self, model_id: str, input: Dict[str, Any], **params):
+        """Start a prediction for "owner/name" or "owner/name:version" without waiting for it"""
+        model, _, version = model_id.partition(":")
+        if version:
+            return await self.client.predictions.async_create(version=version, input=input, **params)
+        owner, name = model.split("/", 1)
+        return await self.client.models.predictions.async_create(model=(owner, name), input=input, **params)
+
+    async def get_prediction(self, prediction_id: str):
+        return await self.client.predictions.async_get(prediction_id)
+
+    async def wait_for_prediction(self, prediction):
+        """Poll a prediction asynchronously until it reaches a terminal status"""
+        while prediction.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(REPLICATE_GATEWAY_CONFIG["poll_interval_seconds"])
+            prediction = await self.get_prediction(prediction.id)
+        return prediction
+
+    async def run(self, model_id: str, input: Dict[str, Any]) -> Any:
+        """Run a model and return its output, holding one of the model's concurrency slots"""
+        async with self._model_semaphore(model_id):
+            prediction = await self.create_prediction(model_id, input)
+            prediction = await self.wait_for_prediction(prediction)
+        if prediction.status == "failed":
+            raise ModelError(prediction.error)
+        if prediction.status == "canceled":
+            raise ModelError("Prediction was canceled")
+        return prediction.output
+
+    async def get_training(self, training_id: str):
+        return await self.client.trainings.async_get(training_id)
+
+    async def create_training(self, version: str, input: Dict[str, Any], destination: str, webhook: Optional[str] = None):
+        """Start a training from an "owner/name:version" trainer"""
+        model, _, version_id = version.partition(":")
+        return await self.client.trainings.async_create(
+            model=model,
+            version=version_id,
+            input=input,
+            destination=destination,
+            webhook=webhook
+        )
+
+    async def create_model(self, owner: str, name: str, **params):
+        return await self.client.models.async_create(owner=owner, name=name, **params)
+
+# One gateway per event loop, since the pooled async client is bound to its loop
+_gateway = None
+_gateway_loop = None
+
+def get_replicate_gateway() -> ReplicateGateway:
+    """Get the shared gateway for the running event loop"""
+    global _gateway, _gateway_loop
+    loop = asyncio.get_running_loop()
+    if _gateway is None or _gateway_loop is not loop:
+        _gateway = ReplicateGateway()
+        _gateway_loop = loop
+    return _gateway
+
+def get_replicate_gateway_stats() -> dict:
+    return {
+        **_stats,
+        "rate_limit_wait_seconds": round(_stats["rate_limit_wait_seconds"], 3),
+        "requests_per_second": REPLICATE_GATEWAY_CONFIG["requests_per_second"],
+        "per_model_concurrency": REPLICATE_GATEWAY_CONFIG["per_model_concurrency"]
+    }
@@ -0,0 +1,188 @@
+"""Fan-out of inference and training run status transitions to per-user subscribers"""
+from typing import Dict, List, Optional, Set
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from .db import get_db_client
+from .url_signing import sign_urls
+from ..config import settings
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+RUN_COLLECTIONS = {
+    "inference_runs": "inference",
+    "training_runs": "training"
+}
+TERMINAL_STATUSES = ["completed", "failed", "succeeded", "canceled", "error"]
+
+# Fields run_event reads; the change stream returns nothing else from the looked-up document
+RUN_EVENT_FIELDS = ["user_id", "training_id", "status", "error", "output_urls", "model_name", "version"]
+
+POLL_INTERVAL_SECONDS = 3  # Used when change streams are unavailable
+POLL_LOOKBACK = timedelta(hours=24)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def user_id_variants(user_id: str) -> list:
+    """inference_runs stores user_id as a string or an ObjectId depending on the writer"""
+    return [user_id, ObjectId(user_id)] if ObjectId.is_valid(user_id) else [user_id]
+
+def run_event(collection: str, run: dict) -> dict:
+    """Status payload sent to clients for one run"""
+    event = {
+        "type": RUN_COLLECTIONS[collection],
+        "id": run.get("training_id") if collection == "training_runs" else str(run["_id"]),
+        "status": run.get("status"),
+        "error": run.get("error")
+    }
+    if collection == "inference_runs":
+        event["output_urls"] = sign_urls(run.get("output_urls", []))
+    else:
+        event["model_name"] = run.get("model_name")
+        event["version"] = run.get("version")
+    return event
+
+async def active_runs_snapshot(db, user_id: str) -> List[dict]:
+    """Current status of a user's unfinished runs, sent when a stream opens"""
+    events = []
+    for collection in RUN_COLLECTIONS:
+        async for run in db[collection].find({
+            "user_id": {"$in": user_id_variants(user_id)},
+            "status": {"$nin": TERMINAL_STATUSES}
+        }).sort("created_at", -1).limit(50):
+            events.append(run_event(collection, run))
+    return events
+
+class RunEventHub:
+    """
+    One change stream (or poller) per process, shared by every open SSE connection.
+    Instances are bound to one event loop; use get_run_event_hub().
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._use_polling = False
+        self.mode = None
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _publish(self, user_id, event: dict):
+        for queue in self._subscribers.get(str(user_id), ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A stalled client misses intermediate states; it gets the latest on reconnect
+                logger.warning(f"Dropping run event for slow subscriber of user {user_id}")
+
+    async def _run(self):
+        db = get_db_client()[settings.DB_NAME]
+        # Keep going while anyone is listening, including subscribers that joined during shutdown
+        while self._subscribers:
+            try:
+                if self._use_polling:
+                    await self._poll(db)
+                else:
+                    await self._watch(db)
+            except OperationFailure as e:
+                # Change streams need a replica set; fall back to polling
+                logger.warning(f"Change streams unavailable, polling run statuses instead: {str(e)}")
+                self._use_polling = True
+            except Exception as e:
+                logger.error(f"Run event hub error, restarting: {str(e)}", exc_info=True)
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    def _watch_pipeline(self, user_ids: List[str]) -> list:
+        """Status transitions of the subscribed users' runs, projected to the fields clients receive"""
+        variants = [variant for user_id in user_ids for variant in user_id_variants(user_id)]
+        return [
+            {"$match": {
+                "ns.coll": {"$in": list(RUN_COLLECTIONS)},
+                "fullDocument.user_id": {"$in": variants},
+                "$or": [
+                    {"operationType": "insert"},
+                    {"updateDescription.updatedFields.status": {"$exists": True}}
+                ]
+            }},
+            {"$project": {
+                "ns": 1,
+                **{f"fullDocument.{field}": 1 for field in ["_id", *RUN_EVENT_FIELDS]}
+            }}
+        ]
+
+    async def _watch(self, db):
+        self.mode = "change_stream"
+        resume_token = None
+        # The pipeline names the subscribed users, so the stream is reopened when that set changes,
+        # resuming from the last seen event so nothing is missed in between
+        while self._subscribers:
+            user_ids = sorted(self._subscribers)
+            async with db.watch(
+                self._watch_pipeline(user_ids),
+                full_document="updateLookup",
+                resume_after=resume_token
+            ) as stream:
+                while self._subscribers and sorted(self._subscribers) == user_ids:
+                    change = await stream.try_next()
+                    resume_token = stream.resume_token
+                    if change is None:
+                        continue
+                    run = change.get("fullDocument")
+                    if run:
+                        self._publish(run.get("user_id"), run_event(change["ns"]["coll"], run))
+        self.mode = None
+
+    async def _poll(self, db):
+        self.mode = "polling"
+        last_status = {}
+        while self._subscribers:
+            user_ids = [variant for user_id in self._subscribers for variant in user_id_variants(user_id)]
+            since = datetime.utcnow() - POLL_LOOKBACK
+            try:
+                for collection in RUN_COLLECTIONS:
+                    async for run in db[collection].find(
+                        {"user_id": {"$in": user_ids}, "created_at": {"$gte": since}},
+                        {field: 1 for field in RUN_EVENT_FIELDS}
+                    ):
+                        key = (collection, run["_id"])
+                        previous = last_status.get(key)
+                        last_status[key] = run.get("status")
+                        # The first pass only records state; the open snapshot already covered it
+                        if previous is not None and previous != run.get("status"):
+                            self._publish(run["user_id"], run_event(collection, run))
+            except PyMongoError as e:
+                logger.error(f"Error polling run statuses: {str(e)}")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        self.mode = None
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "users": len(self._subscribers),
+            "connections": sum(len(queues) for queues in self._subscribers.values())
+        }
+
+_hub = None
+_hub_loop = None
+
+def get_run_event_hub() -> RunEventHub:
+    """Get the shared hub for the running event loop"""
+    global _hub, _hub_loop
+    loop = asyncio.get_running_loop()
+    if _hub is None or _hub_loop is not loop:
+        _hub = RunEventHub()
+        _hub_loop = loop
+    return _hub
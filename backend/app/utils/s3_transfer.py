@@ -0,0 +1,273 @@
+"""Async S3 transfer helpers: generated image persistence and streamed object I/O"""
+from typing import AsyncIterator, List, Optional
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from ..config.inference_config import (
+    S3_BUCKET_NAME,
+    S3_REGION,
+    S3_CONFIG,
+    S3_TRANSFER_CONFIG
+)
+import asyncio
+import boto3
+import httpx
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Shared S3 client; boto3 clients are thread-safe and pool their connections
+s3_client = boto3.client(
+    's3',
+    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    config=Config(region_name=S3_REGION, **S3_CONFIG)
+)
+
+# Shared HTTP client for downloads, bound to the event loop that created it
+_http_client = None
+_http_client_loop = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the pooled HTTP client for the running event loop"""
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        _close_replaced_client(_http_client, _http_client_loop)
+        _http_client = httpx.AsyncClient(
+            timeout=S3_TRANSFER_CONFIG["download_timeout"],
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=S3_TRANSFER_CONFIG["max_connections"],
+                max_keepalive_connections=S3_TRANSFER_CONFIG["max_connections"]
+            )
+        )
+        _http_client_loop = loop
+    return _http_client
+
+def _close_replaced_client(client: Optional[httpx.AsyncClient], loop: Optional[asyncio.AbstractEventLoop]):
+    """Close a client replaced by another loop's; it can only be closed on its own loop, while that loop runs"""
+    if client is None or loop is None or not loop.is_running():
+        return
+    asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+async def close_http_client():
+    """Close the running loop's client, if it has one; called at lifespan shutdown"""
+    global _http_client, _http_client_loop
+    if _http_client is not None and _http_client_loop is asyncio.get_running_loop():
+        client = _http_client
+        _http_client = None
+        _http_client_loop = None
+        await client.aclose()
+
+def s3_url_for_key(key: str) -> str:
+    return f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{key}"
+
+def s3_key_for_url(url: str) -> Optional[str]:
+    """Object key of a URL issued by s3_url_for_key, or None for other URLs"""
+    prefix = s3_url_for_key("")
+    return url[len(prefix):] if url and url.startswith(prefix) else None
+
+def object_headers(content_type: Optional[str], cache_control: Optional[str]) -> dict:
+    extra_args = {}
+    if content_type:
+        extra_args["ContentType"] = content_type
+    if cache_control:
+        extra_args["CacheControl"] = cache_control
+    return extra_args
+
+class S3MultipartWriter:
+    """
+    File-like sink that buffers writes into multipart-upload parts.
+    write() only buffers; drain() and complete() do the S3 calls off the event loop,
+    so memory stays bounded by the part size. Objects smaller than one part are
+    stored with a single put_object.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        part_size: Optional[int] = None,
+        cache_control: Optional[str] = None
+    ):
+        self.key = key
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.part_size = part_size or S3_TRANSFER_CONFIG["part_size"]
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def flush(self):
+        pass
+
+    def _extra_args(self) -> dict:
+        return object_headers(self.content_type, self.cache_control)
+
+    async def _upload_part(self, body: bytes):
+        if self.upload_id is None:
+            response = await asyncio.to_thread(
+                s3_client.create_multipart_upload,
+                Bucket=S3_BUCKET_NAME,
+                Key=self.key,
+                **self._extra_args()
+            )
+            self.upload_id = response["UploadId"]
+        part_number = len(self.parts) + 1
+        response = await asyncio.to_thread(
+            s3_client.upload_part,
+            Bucket=S3_BUCKET_NAME,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    async def drain(self):
+        """Upload every full part currently buffered"""
+        while len(self._buffer) >= self.part_size:
+            body = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._upload_part(body)
+
+    async def complete(self) -> str:
+        """Upload what is left and finish the object; returns the S3 URL"""
+        if self.upload_id is None:
+            await asyncio.to_thread(
+                s3_client.put_object,
+                Bucket=S3_BUCKET_NAME,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                **self._extra_args()
+            )
+        else:
+            await self.drain()
+            if self._buffer:
+                await self._upload_part(bytes(self._buffer))
+            await asyncio.to_thread(
+                s3_client.complete_multipart_upload,
+                Bucket=S3_BUCKET_NAME,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self.parts}
+            )
+        self._buffer = bytearray()
+        return s3_url_for_key(self.key)
+
+    async def abort(self):
+        """Discard a partially uploaded object"""
+        self._buffer = bytearray()
+        if self.upload_id is None:
+            return
+        try:
+            await asyncio.to_thread(
+                s3_client.abort_multipart_upload,
+                Bucket=S3_BUCKET_NAME,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload for {self.key}: {str(e)}")
+
+async def put_s3_object(
+    key: str,
+    body: bytes,
+    content_type: Optional[str] = None,
+    cache_control: Optional[str] = None
+) -> str:
+    """Store a small object in one request; returns the S3 URL"""
+    extra_args = object_headers(content_type, cache_control)
+    await asyncio.to_thread(
+        s3_client.put_object,
+        Bucket=S3_BUCKET_NAME,
+        Key=key,
+        Body=body,
+        **extra_args
+    )
+    return s3_url_for_key(key)
+
+async def s3_object_exists(key: str) -> bool:
+    try:
+        await asyncio.to_thread(s3_client.head_object, Bucket=S3_BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+async def iter_s3_object(key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """Stream an object's body without loading it whole"""
+    response = await asyncio.to_thread(s3_client.get_object, Bucket=S3_BUCKET_NAME, Key=key)
+    body = response["Body"]
+    try:
+        while chunk := await asyncio.to_thread(body.read, chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+async def delete_s3_prefix(prefix: str) -> int:
+    """Delete every object under a prefix; returns the number deleted"""
+    deleted = 0
+    continuation = {}
+    while True:
+        response = await asyncio.to_thread(
+            s3_client.list_objects_v2,
+            Bucket=S3_BUCKET_NAME,
+            Prefix=prefix,
+            **continuation
+        )
+        keys = [{"Key": obj["Key"]} for obj in response.get("Contents", [])]
+        if keys:
+            await asyncio.to_thread(
+                s3_client.delete_objects,
+                Bucket=S3_BUCKET_NAME,
+                Delete={"Objects": keys, "Quiet": True}
+            )
+            deleted += len(keys)
+        if not response.get("IsTruncated"):
+            return deleted
+        continuation = {"ContinuationToken": response["NextContinuationToken"]}
+
+async def transfer_url_to_s3(url: str, key: str, content_type: str = 'image/png') -> str:
+    """Stream a remote file into S3 without holding the whole body in memory"""
+    # Stored outputs are never overwritten, so caches may keep them indefinitely
+    writer = S3MultipartWriter(key, content_type=content_type, cache_control=S3_TRANSFER_CONFIG["immutable_cache_control"])
+    try:
+        async with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                writer.write(chunk)
+                await writer.drain()
+        return await writer.complete()
+    except Exception:
+        await writer.abort()
+        raise
+
+async def store_images_to_s3(urls: list, user_id: str, inference_id: str) -> List[str]:
+    """Store multiple images to S3 concurrently and return their URLs in input order"""
+    semaphore = asyncio.Semaphore(S3_TRANSFER_CONFIG["concurrency"])
+
+    async def store_image(index: int, url: str) -> Optional[str]:
+        key = f"inference_data/{user_id}/{inference_id}/image_{index}.png"
+        async with semaphore:
+            try:
+                s3_url = await transfer_url_to_s3(url, key)
+                logger.info(f"Uploaded image to S3: {s3_url}")
+                return s3_url
+            except Exception as e:
+                logger.error(f"Error processing image {index}: {str(e)}")
+                return None
+
+    results = await asyncio.gather(*(store_image(i, url) for i, url in enumerate(urls)))
+    return [s3_url for s3_url in results if s3_url]
@@ -0,0 +1,158 @@
+"""Streaming packaging of training datasets into S3, deduplicated by content hash"""
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+from datetime import datetime
+from fastapi import UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from .s3_transfer import S3MultipartWriter, s3_object_exists, s3_url_for_key
+from ..config.inference_config import TRAINING_ZIP_CONFIG
+import hashlib
+import mimetypes
+import logging
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+DATASETS_COLLECTION = "training_datasets"
+
+ZIP_COMPRESSION_METHODS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED
+}
+
+@dataclass
+class DatasetFile:
+    """A file to add to a training zip; `chunks` returns a fresh async iterator of its bytes"""
+    filename: str
+    content_type: Optional[str]
+    chunks: Callable[[], AsyncIterator[bytes]]
+    # Bytes identifying the file for dataset reuse, when hashing `chunks` would be costly
+    hash_chunks: Optional[Callable[[], AsyncIterator[bytes]]] = None
+
+def compression_for(filename: str, content_type: Optional[str] = None) -> int:
+    """Pick the zip compression method for a file from its MIME type"""
+    content_type = content_type or mimetypes.guess_type(filename)[0]
+    method = TRAINING_ZIP_CONFIG["compression"].get(content_type, TRAINING_ZIP_CONFIG["default_compression"])
+    return ZIP_COMPRESSION_METHODS[method]
+
+async def iter_upload_file(upload_file: UploadFile, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Read an UploadFile in bounded chunks"""
+    chunk_size = chunk_size or TRAINING_ZIP_CONFIG["read_chunk_size"]
+    await upload_file.seek(0)
+    while chunk := await upload_file.read(chunk_size):
+        yield chunk
+
+def dataset_files_from_uploads(files: Iterable[UploadFile]) -> list:
+    return [
+        DatasetFile(
+            filename=file.filename,
+            content_type=file.content_type,
+            chunks=lambda file=file: iter_upload_file(file)
+        )
+        for file in files
+    ]
+
+async def stream_zip_to_s3(files: Iterable[DatasetFile], key: str) -> dict:
+    """
+    Zip files straight into an S3 multipart upload.
+    The zip is written in streaming mode (data descriptors, no seeking), so memory
+    stays bounded by the multipart part size regardless of dataset size.
+    """
+    started = time.monotonic()
+    writer = S3MultipartWriter(key, content_type="application/zip")
+    num_files = 0
+    input_bytes = 0
+    try:
+        with zipfile.ZipFile(writer, 'w', compresslevel=TRAINING_ZIP_CONFIG["compresslevel"]) as zip_file:
+            for dataset_file in files:
+                info = zipfile.ZipInfo(dataset_file.filename, date_time=time.localtime()[:6])
+                info.compress_type = compression_for(dataset_file.filename, dataset_file.content_type)
+                with zip_file.open(info, 'w') as entry:
+                    async for chunk in dataset_file.chunks():
+                        entry.write(chunk)
+                        input_bytes += len(chunk)
+                        await writer.drain()
+                num_files += 1
+                logger.info(f"Added to zip: {dataset_file.filename}")
+        s3_url = await writer.complete()
+    except Exception:
+        await writer.abort()
+        raise
+
+    stats = {
+        "s3_key": key,
+        "s3_url": s3_url,
+        "num_files": num_files,
+        "input_bytes": input_bytes,
+        "zip_bytes": writer.bytes_written,
+        "seconds": round(time.monotonic() - started, 3)
+    }
+    logger.info(
+        f"Streamed {num_files} files into {key}: "
+        f"{writer.bytes_written / (1024*1024):.2f} MB in {stats['seconds']}s"
+    )
+    return stats
+
+async def hash_dataset_files(files: Iterable[DatasetFile]) -> List[str]:
+    """SHA-256 of each file's content (or its hash_chunks), computed by streaming its chunks"""
+    hashes = []
+    for dataset_file in files:
+        digest = hashlib.sha256()
+        async for chunk in (dataset_file.hash_chunks or dataset_file.chunks)():
+            digest.update(chunk)
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def manifest_hash(image_hashes: List[str]) -> str:
+    """Order-independent hash identifying a set of images"""
+    return hashlib.sha256("\n".join(sorted(image_hashes)).encode()).hexdigest()
+
+async def get_or_create_dataset(db: AsyncIOMotorDatabase, user_id: str, files: List[DatasetFile]) -> dict:
+    """
+    Return the user's stored dataset zip for these images, building it only if no
+    identical dataset exists. Datasets are keyed by the manifest of per-image hashes.
+    """
+    image_hashes = await hash_dataset_files(files)
+    manifest = manifest_hash(image_hashes)
+    dataset_id = f"{user_id}:{manifest}"
+    s3_key = f"training_data/datasets/{user_id}/{manifest}.zip"
+    datasets = db[DATASETS_COLLECTION]
+
+    existing = await datasets.find_one({"_id": dataset_id})
+    if existing and await s3_object_exists(existing["s3_key"]):
+        await datasets.update_one(
+            {"_id": dataset_id},
+            {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"use_count": 1}}
+        )
+        logger.info(f"Reusing stored dataset {s3_key} for user {user_id}")
+        return {**existing, "dataset_id": dataset_id, "reused": True, "overlap_images": len(image_hashes)}
+
+    # Report how much of this dataset the user has trained on before
+    unique_hashes = set(image_hashes)
+    overlap = 0
+    async for other in datasets.find(
+        {"user_id": user_id, "image_hashes": {"$in": list(unique_hashes)}},
+        {"image_hashes": 1}
+    ):
+        overlap = max(overlap, len(unique_hashes.intersection(other["image_hashes"])))
+
+    stats = await stream_zip_to_s3(files, s3_key)
+    now = datetime.utcnow()
+    dataset = {
+        "user_id": user_id,
+        "manifest_hash": manifest,
+        "image_hashes": image_hashes,
+        "num_files": stats["num_files"],
+        "s3_key": s3_key,
+        "s3_url": s3_url_for_key(s3_key),
+        "input_bytes": stats["input_bytes"],
+        "zip_bytes": stats["zip_bytes"],
+        "created_at": now,
+        "last_used_at": now,
+        "use_count": 1
+    }
+    await datasets.replace_one({"_id": dataset_id}, dataset, upsert=True)
+    if overlap:
+        logger.info(f"Dataset {manifest} shares {overlap} of {len(unique_hashes)} images with a previous dataset")
+    return {**dataset, "dataset_id": dataset_id, "reused": False, "overlap_images": overlap}
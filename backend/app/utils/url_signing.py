@@ -0,0 +1,108 @@
+"""Issue presigned S3 or CloudFront URLs for stored objects, caching signatures until shortly before expiry"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from .s3_transfer import s3_client, s3_key_for_url
+from ..config import settings
+from ..config.inference_config import S3_BUCKET_NAME
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# (key, ttl) -> (signed url, reuse_until)
+_signed_urls = OrderedDict()
+_lock = threading.Lock()
+_cloudfront_signer = None
+
+_stats = {
+    "hits": 0,
+    "signatures": 0,
+    "evictions": 0
+}
+
+def _get_cloudfront_signer():
+    global _cloudfront_signer
+    if _cloudfront_signer is None:
+        from botocore.signers import CloudFrontSigner
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        private_key = serialization.load_pem_private_key(
+            settings.CLOUDFRONT_PRIVATE_KEY.replace("\\n", "\n").encode(),
+            password=None
+        )
+        _cloudfront_signer = CloudFrontSigner(
+            settings.CLOUDFRONT_KEY_PAIR_ID,
+            lambda message: private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+        )
+    return _cloudfront_signer
+
+def _sign(key: str, ttl: int) -> str:
+    if settings.URL_SIGNING_MODE == "cloudfront":
+        return _get_cloudfront_signer().generate_presigned_url(
+            f"https://{settings.CLOUDFRONT_DOMAIN}/{key}",
+            date_less_than=datetime.utcnow() + timedelta(seconds=ttl)
+        )
+    # Presigning is a local HMAC computation; no request is made to S3
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": S3_BUCKET_NAME, "Key": key},
+        ExpiresIn=ttl
+    )
+
+def sign_key(key: str, ttl: Optional[int] = None) -> str:
+    """Signed GET URL for an object key, reused until URL_SIGNING_REFRESH_MARGIN_SECONDS before it expires"""
+    ttl = ttl or settings.URL_SIGNING_TTL_SECONDS
+    now = time.time()
+    with _lock:
+        entry = _signed_urls.get((key, ttl))
+        if entry is not None and entry[1] > now:
+            _signed_urls.move_to_end((key, ttl))
+            _stats["hits"] += 1
+            return entry[0]
+
+    url = _sign(key, ttl)
+    reuse_until = now + max(ttl - settings.URL_SIGNING_REFRESH_MARGIN_SECONDS, 0)
+    with _lock:
+        _stats["signatures"] += 1
+        _signed_urls[(key, ttl)] = (url, reuse_until)
+        _signed_urls.move_to_end((key, ttl))
+        while len(_signed_urls) > settings.URL_SIGNING_CACHE_MAX_SIZE:
+            _signed_urls.popitem(last=False)
+            _stats["evictions"] += 1
+    return url
+
+def sign_url(url: Optional[str], ttl: Optional[int] = None) -> Optional[str]:
+    """
+    Signed form of a stored bucket URL. Other URLs, and every URL when
+    URL_SIGNING_MODE is "public", are returned unchanged.
+    """
+    if settings.URL_SIGNING_MODE == "public" or not url:
+        return url
+    key = s3_key_for_url(url)
+    if key is None:
+        return url
+    try:
+        return sign_key(key, ttl)
+    except Exception as e:
+        logger.error(f"Failed to sign URL for {key}: {str(e)}")
+        return url
+
+def sign_urls(urls: List[str]) -> List[str]:
+    return [sign_url(url) for url in urls]
+
+def sign_url_map(urls: Dict[str, str]) -> Dict[str, str]:
+    return {name: sign_url(url) for name, url in urls.items()}
+
+def get_url_signing_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["signatures"]
+        return {
+            **_stats,
+            "mode": settings.URL_SIGNING_MODE,
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+            "cached": len(_signed_urls),
+            "ttl_seconds": settings.URL_SIGNING_TTL_SECONDS
+        }
@@ -0,0 +1,173 @@
+"""
+Cache of verified tokens and authenticated user documents.
+
+Token subjects are always cached in process memory. User documents are kept in
+Redis when USER_CACHE_BACKEND is "redis", otherwise in process memory; in that
+case invalidate_cached_user only clears this instance, and other instances may
+serve the old document for up to USER_CACHE_TTL_SECONDS.
+"""
+from collections import OrderedDict
+from typing import Optional
+from bson import json_util
+from ..config import settings
+import logging
+import threading
+import time
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Redis is an optional shared backend
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+if settings.USER_CACHE_BACKEND == "redis" and redis_asyncio is None:
+    # Falling back to memory would leave other instances serving stale users
+    raise RuntimeError("USER_CACHE_BACKEND is redis but the redis package is not installed")
+
+REDIS_KEY_PREFIX = "whatif:user_cache"
+
+# Verified token -> (email, expires_at)
+_token_subjects = OrderedDict()
+# Email -> (user document, expires_at), used when the memory backend is active
+_users = OrderedDict()
+# User id -> email, so writes that only know the id can invalidate
+_emails_by_user_id = {}
+_lock = threading.Lock()
+_redis = None
+
+_stats = {
+    "token_hits": 0,
+    "token_misses": 0,
+    "user_hits": 0,
+    "user_misses": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    "backend_errors": 0
+}
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+def _use_redis() -> bool:
+    return settings.USER_CACHE_BACKEND == "redis"
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis_asyncio.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD or None
+        )
+    return _redis
+
+def _put(cache: OrderedDict, key, value, expires_at: float):
+    cache[key] = (value, expires_at)
+    cache.move_to_end(key)
+    while len(cache) > settings.USER_CACHE_MAX_SIZE:
+        cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+def _get(cache: OrderedDict, key):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at <= time.time():
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return value
+
+def get_cached_token_subject(token: str) -> Optional[str]:
+    """Return the email of a previously verified, unexpired token"""
+    with _lock:
+        email = _get(_token_subjects, token)
+        _stats["token_hits" if email else "token_misses"] += 1
+    return email
+
+def cache_token_subject(token: str, email: str, expires_at: Optional[float]):
+    """Remember a verified token until it expires"""
+    if expires_at is None:
+        expires_at = time.time() + settings.USER_CACHE_TTL_SECONDS
+    with _lock:
+        _put(_token_subjects, token, email, float(expires_at))
+
+async def get_cached_user(email: str) -> Optional[dict]:
+    """Return a copy of the cached user document, or None on a miss"""
+    if _use_redis():
+        try:
+            raw = await _get_redis().get(f"{REDIS_KEY_PREFIX}:email:{email}")
+        except Exception as e:
+            logger.warning(f"User cache backend error: {str(e)}")
+            _count("backend_errors")
+            raw = None
+        user = json_util.loads(raw) if raw else None
+    else:
+        with _lock:
+            user = _get(_users, email)
+    _count("user_hits" if user else "user_misses")
+    return dict(user) if user else None
+
+async def cache_user(email: str, user: dict):
+    """Store a user document for USER_CACHE_TTL_SECONDS"""
+    user_id = str(user["_id"])
+    ttl = settings.USER_CACHE_TTL_SECONDS
+    if _use_redis():
+        try:
+            async with _get_redis().pipeline(transaction=False) as pipe:
+                pipe.set(f"{REDIS_KEY_PREFIX}:email:{email}", json_util.dumps(user), ex=ttl)
+                pipe.set(f"{REDIS_KEY_PREFIX}:id:{user_id}", email, ex=ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"User cache backend error: {str(e)}")
+            _count("backend_errors")
+        return
+    with _lock:
+        _put(_users, email, dict(user), time.time() + ttl)
+        _emails_by_user_id[user_id] = email
+
+async def invalidate_cached_user(user_id=None, email: Optional[str] = None):
+    """Drop a user's cached document after a write to the users collection"""
+    user_id = str(user_id) if user_id is not None else None
+    with _lock:
+        if email is None and user_id is not None:
+            email = _emails_by_user_id.get(user_id)
+        if user_id is not None:
+            _emails_by_user_id.pop(user_id, None)
+        if email is not None:
+            _users.pop(email, None)
+        _stats["invalidations"] += 1
+    if not _use_redis():
+        return
+    try:
+        client = _get_redis()
+        if email is None and user_id is not None:
+            raw_email = await client.get(f"{REDIS_KEY_PREFIX}:id:{user_id}")
+            email = raw_email.decode() if raw_email else None
+        keys = []
+        if user_id is not None:
+            keys.append(f"{REDIS_KEY_PREFIX}:id:{user_id}")
+        if email is not None:
+            keys.append(f"{REDIS_KEY_PREFIX}:email:{email}")
+        if keys:
+            await client.delete(*keys)
+    except Exception as e:
+        logger.warning(f"User cache backend error: {str(e)}")
+        _count("backend_errors")
+
+def get_user_cache_stats() -> dict:
+    """Return hit/miss counters and current sizes"""
+    with _lock:
+        lookups = _stats["user_hits"] + _stats["user_misses"]
+        return {
+            **_stats,
+            "backend": "redis" if _use_redis() else "memory",
+            "user_hit_rate": round(_stats["user_hits"] / lookups, 4) if lookups else 0.0,
+            "tokens_cached": len(_token_subjects),
+            "users_cached": len(_users),
+            "max_size": settings.USER_CACHE_MAX_SIZE,
+            "ttl_seconds": settings.USER_CACHE_TTL_SECONDS
+        }
@@ -0,0 +1,21 @@
+"""Standalone job queue worker: python -m backend.app.worker"""
+import asyncio
+import logging
+from .config import settings
+from .utils.db import get_db_client, close_db_client
+from .utils.job_queue import run_worker
+from .utils.logging_config import configure_logging
+from .utils import prompt_inferences  # noqa: F401 - registers job handlers
+
+logger = logging.getLogger(__name__)
+
+async def main():
+    db = get_db_client()[settings.DB_NAME]
+    try:
+        await run_worker(db, concurrency=settings.JOB_WORKER_CONCURRENCY)
+    finally:
+        close_db_client()
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
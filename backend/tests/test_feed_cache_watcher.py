@@ -0,0 +1,73 @@
+"""The feed change stream watcher must survive transient errors"""
+from pymongo.errors import AutoReconnect, OperationFailure
+from backend.app.utils import feed_cache
+import asyncio
+import pytest
+
+class FakeStream:
+    def __init__(self, events: list):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.events:
+            raise StopAsyncIteration
+        event = self.events.pop(0)
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+class FakeCollection:
+    def __init__(self, streams: list):
+        self.streams = streams
+
+    def watch(self):
+        return self.streams.pop(0)
+
+@pytest.fixture
+def feed(monkeypatch):
+    def use_streams(*streams):
+        collection = FakeCollection(list(streams))
+        monkeypatch.setattr(feed_cache, "get_db_client", lambda: {feed_cache.settings.DB_NAME: {"feed": collection}})
+    monkeypatch.setattr(feed_cache, "WATCH_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(feed_cache, "_change_streams_unsupported", False)
+    monkeypatch.setattr(feed_cache, "_watch_task", None)
+    monkeypatch.setitem(feed_cache._stats, "invalidations", 0)
+    monkeypatch.setitem(feed_cache._stats, "watch_restarts", 0)
+    return use_streams
+
+def test_watcher_reconnects_after_transient_error_and_stops_when_unsupported(feed):
+    feed(
+        FakeStream([{"op": "insert"}, AutoReconnect("primary stepped down")]),
+        FakeStream([{"op": "insert"}, OperationFailure("The $changeStream stage is only supported on replica sets")])
+    )
+
+    asyncio.run(asyncio.wait_for(feed_cache._watch_feed(), timeout=5))
+
+    assert feed_cache._stats["watch_restarts"] == 1
+    # One invalidation per event plus one for the writes missed while reconnecting
+    assert feed_cache._stats["invalidations"] == 3
+    assert feed_cache._change_streams_unsupported
+
+def test_finished_watcher_is_replaced(feed):
+    feed(FakeStream([]), FakeStream([OperationFailure("unsupported")]))
+
+    async def run():
+        feed_cache._ensure_watcher()
+        first = feed_cache._watch_task
+        first.cancel()
+        await asyncio.sleep(0)
+        feed_cache._ensure_watcher()
+        return first, feed_cache._watch_task
+
+    first, second = asyncio.run(run())
+
+    assert first is not second
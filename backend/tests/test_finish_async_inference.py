@@ -0,0 +1,119 @@
+"""finish_async_inference must refund a failed prediction exactly once, however often it is called"""
+from datetime import datetime
+from types import SimpleNamespace
+from bson import ObjectId
+from backend.app.routes import canvas_inference
+import asyncio
+import copy
+import pytest
+
+def _matches(document: dict, query: dict) -> bool:
+    """The subset of Mongo query semantics the finalizer's filters use"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(document, option) for option in condition):
+                return False
+            continue
+        value = document.get(key)
+        if isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator == "$gt" and not (value is not None and value > operand):
+                    return False
+                if operator == "$not" and _matches(document, {key: operand}):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+class FakeCollection:
+    def __init__(self, documents: list):
+        self.documents = documents
+
+    def _apply(self, document: dict, update: dict):
+        for key, value in update.get("$set", {}).items():
+            target = document
+            *parents, leaf = key.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = value
+        for key in update.get("$unset", {}):
+            document.pop(key, None)
+
+    async def find_one_and_update(self, query: dict, update: dict, return_document=None):
+        for document in self.documents:
+            if _matches(document, query):
+                self._apply(document, update)
+                return copy.deepcopy(document)
+        return None
+
+    async def update_one(self, query: dict, update: dict):
+        for document in self.documents:
+            if _matches(document, query):
+                self._apply(document, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+class FailedPredictionGateway:
+    def __init__(self, release: asyncio.Event = None):
+        self.release = release
+
+    async def get_prediction(self, prediction_id: str):
+        if self.release is not None:
+            await self.release.wait()
+        return SimpleNamespace(status="failed", error="NSFW content detected", output=None)
+
+@pytest.fixture
+def inference(monkeypatch):
+    inference_id = ObjectId()
+    runs = FakeCollection([{
+        "_id": inference_id,
+        "mode": "async",
+        "status": "processing",
+        "user_id": "user-1",
+        "prediction_id": "prediction-1",
+        "credit_cost": 4,
+        "processing_stats": {"start_time": datetime.utcnow().isoformat()}
+    }])
+    refunds = []
+
+    async def add_credits(**kwargs):
+        refunds.append(kwargs)
+
+    monkeypatch.setattr(canvas_inference, "add_credits", add_credits)
+    monkeypatch.setattr(canvas_inference, "get_replicate_gateway", lambda: FailedPredictionGateway())
+    return SimpleNamespace(id=str(inference_id), db={"inference_runs": runs}, runs=runs, refunds=refunds)
+
+def test_failed_prediction_is_refunded_once_when_finalized_twice(inference):
+    async def finalize_twice():
+        first = await canvas_inference.finish_async_inference(inference.db, inference.id)
+        second = await canvas_inference.finish_async_inference(inference.db, inference.id)
+        return first, second
+
+    first, second = asyncio.run(finalize_twice())
+
+    assert first["status"] == "failed"
+    assert second is None
+    assert len(inference.refunds) == 1
+    assert inference.refunds[0]["amount"] == 4
+    assert inference.refunds[0]["transaction_type"] == "refund"
+    assert inference.runs.documents[0]["status"] == "failed"
+
+def test_expired_claim_does_not_refund_again(inference, monkeypatch):
+    """A finalizer whose lease expired mid-flight must not refund after another one took over"""
+    monkeypatch.setitem(canvas_inference.ASYNC_INFERENCE_CONFIG, "finalizing_lease_seconds", 0)
+    release = asyncio.Event()
+    monkeypatch.setattr(canvas_inference, "get_replicate_gateway", lambda: FailedPredictionGateway(release))
+
+    async def finalize_concurrently():
+        slow = asyncio.create_task(canvas_inference.finish_async_inference(inference.db, inference.id))
+        await asyncio.sleep(0.01)  # The slow call holds the claim while it waits for Replicate
+        takeover = asyncio.create_task(canvas_inference.finish_async_inference(inference.db, inference.id))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(slow, takeover)
+
+    results = asyncio.run(finalize_concurrently())
+
+    assert sorted(result is None for result in results) == [False, True]
+    assert len(inference.refunds) == 1
+    assert inference.runs.documents[0]["status"] == "failed"
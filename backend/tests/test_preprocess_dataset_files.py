@@ -0,0 +1,55 @@
+"""preprocess_dataset_files must never store non-JPEG bytes under a .jpg name"""
+from fastapi import HTTPException
+from PIL import Image
+from backend.app.utils.image_processing import preprocess_dataset_files, shutdown_process_pool
+from backend.app.utils.training_data import DatasetFile
+import asyncio
+import io
+import pytest
+
+def dataset_file(filename: str, data: bytes) -> DatasetFile:
+    async def chunks():
+        yield data
+    return DatasetFile(filename=filename, content_type=None, chunks=chunks)
+
+async def read(dataset_file: DatasetFile) -> bytes:
+    return b"".join([chunk async for chunk in dataset_file.chunks()])
+
+def png_bytes() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(output, format="PNG")
+    return output.getvalue()
+
+@pytest.fixture(autouse=True)
+def process_pool():
+    yield
+    shutdown_process_pool()
+
+def test_png_is_stored_as_jpeg():
+    async def run():
+        wrapped, _ = await preprocess_dataset_files([dataset_file("photo.png", png_bytes())])
+        return wrapped[0], await read(wrapped[0])
+
+    wrapped, data = asyncio.run(run())
+
+    assert wrapped.filename == "photo.jpg"
+    assert data[:3] == b"\xff\xd8\xff"
+
+def test_undecodable_png_rejects_the_dataset():
+    async def run():
+        wrapped, _ = await preprocess_dataset_files([dataset_file("photo.png", b"\x89PNG\r\n\x1a\ncorrupt")])
+        return await read(wrapped[0])
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 400
+
+def test_undecodable_jpeg_is_passed_through():
+    async def run():
+        wrapped, _ = await preprocess_dataset_files([dataset_file("photo.jpg", b"\xff\xd8\xffcorrupt")])
+        return wrapped[0], await read(wrapped[0])
+
+    wrapped, data = asyncio.run(run())
+
+    assert wrapped.filename == "photo.jpg"
+    assert data == b"\xff\xd8\xffcorrupt"
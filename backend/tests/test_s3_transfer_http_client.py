@@ -0,0 +1,45 @@
+"""The pooled download client is per event loop; a replaced or shut down client must be closed"""
+from backend.app.utils import s3_transfer
+import asyncio
+import threading
+
+def test_lifespan_shutdown_closes_the_client():
+    async def run():
+        client = s3_transfer.get_http_client()
+        assert s3_transfer.get_http_client() is client
+        await s3_transfer.close_http_client()
+        replacement = s3_transfer.get_http_client()
+        await s3_transfer.close_http_client()
+        return client, replacement
+
+    client, replacement = asyncio.run(run())
+
+    assert client.is_closed
+    assert replacement is not client
+
+def test_client_replaced_by_another_loop_is_closed_on_its_own_loop():
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+
+    async def get_client():
+        return s3_transfer.get_http_client()
+
+    try:
+        replaced = asyncio.run_coroutine_threadsafe(get_client(), other_loop).result(timeout=5)
+
+        async def replace():
+            client = s3_transfer.get_http_client()
+            await s3_transfer.close_http_client()
+            return client
+
+        client = asyncio.run(replace())
+        # The close was scheduled on the other loop; wait for it to run there
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), other_loop).result(timeout=5)
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join(timeout=5)
+        other_loop.close()
+
+    assert client is not replaced
+    assert replaced.is_closed
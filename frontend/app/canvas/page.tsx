@@ -13,6 +13,8 @@ import ImageUploadInstructions from '../components/ImageUploadInstructions'
 import Pricing from '../pricing/page'
 import FeedExamples from '../components/FeedExamples'
 import { uploadInChunks } from '../utils/chunkUpload'
+import { variantSrcSet } from '../utils/imageVariants'
+import { subscribeToRunEvents, fetchInferenceStatus, TERMINAL_RUN_STATUSES, type RunEvent } from '../utils/runEvents'
 import { useInView } from 'react-intersection-observer'
 import { 
   API_URL, 
@@ -95,6 +97,11 @@ interface FavoriteImage {
 }
 
 // Add this helper function near the top of the file
+// Inference results arrive over the run event stream; the status endpoint is polled
+// only while the stream is unavailable, or once an event is overdue
+const STATUS_POLL_INTERVAL_MS = 5000
+const RUN_EVENT_GRACE_MS = 60000
+
 const highlightModelName = (text: string, modelName: string) => {
   if (!modelName || !text) return text;
   const regex = new RegExp(`(${modelName})`, 'gi');
@@ -389,7 +396,53 @@ export default function CanvasPage() {
     }
   }
 
+  const pendingInferences = useRef(new Map<string, (event: RunEvent) => void>())
+  const runEventsUnavailable = useRef(false)
+
+  useEffect(() => {
+    if (!user) return;
+    runEventsUnavailable.current = false;
+    return subscribeToRunEvents(
+      (event) => {
+        if (event.type === 'inference' && TERMINAL_RUN_STATUSES.includes(event.status)) {
+          pendingInferences.current.get(event.id)?.(event);
+        } else if (event.type === 'training' && event.status === 'succeeded') {
+          toast.success(`Your model ${event.model_name || ''} is ready!`);
+          fetchAvailableModels();
+        }
+      },
+      undefined,
+      () => {
+        runEventsUnavailable.current = true;
+      }
+    );
+  }, [user]);
+
+  const waitForInference = (inferenceId: string) => new Promise<RunEvent>((resolve) => {
+    const startedAt = Date.now();
+    let checking = false;
+    const finish = (event: RunEvent) => {
+      clearInterval(fallback);
+      pendingInferences.current.delete(inferenceId);
+      resolve(event);
+    };
+    const fallback = setInterval(async () => {
+      if (checking || (!runEventsUnavailable.current && Date.now() - startedAt < RUN_EVENT_GRACE_MS)) return;
+      checking = true;
+      try {
+        const event = await fetchInferenceStatus(inferenceId);
+        if (event && TERMINAL_RUN_STATUSES.includes(event.status)) {
+          finish(event);
+        }
+      } finally {
+        checking = false;
+      }
+    }, STATUS_POLL_INTERVAL_MS);
+    pendingInferences.current.set(inferenceId, finish);
+  });
+
   const [recentPage, setRecentPage] = useState(0)
+  const [recentCursor, setRecentCursor] = useState<string | null>(null)
   const [hasMoreRecent, setHasMoreRecent] = useState(true)
   const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [error, setError] = useState<string | null>(null)
@@ -404,7 +457,8 @@ export default function CanvasPage() {
       const token = localStorage.getItem('token');
       if (!token) throw new Error('No authentication token found');
 
-      const response = await fetch(`${ENDPOINTS.CANVAS_INFERENCE.LIST}?page=${recentPage}&limit=20`, {
+      const cursorParam = recentPage > 0 && recentCursor ? `&cursor=${encodeURIComponent(recentCursor)}` : '';
+      const response = await fetch(`${ENDPOINTS.CANVAS_INFERENCE.LIST}?limit=20${cursorParam}`, {
         headers: { 
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
@@ -446,6 +500,7 @@ export default function CanvasPage() {
 
       // Ensure has_more is a boolean
       setHasMoreRecent(!!data.has_more);
+      setRecentCursor(data.next_cursor ?? null);
       setRecentPage(prev => prev + 1);
     } catch (error) {
       console.error('Error fetching inference history:', error);
@@ -456,7 +511,7 @@ export default function CanvasPage() {
       setIsLoadingHistory(false);
       setInitialLoad(false);
     }
-  }, [recentPage, isLoadingMore, hasMoreRecent, isImageLiked]);
+  }, [recentPage, recentCursor, isLoadingMore, hasMoreRecent, isImageLiked]);
 
   // Modify the useEffect for initial load to be more robust
   useEffect(() => {
@@ -644,7 +699,8 @@ export default function CanvasPage() {
           'Authorization': `Bearer ${token}`,
           'Content-Type': 'application/json'
         },
-        body: JSON.stringify(params)
+        // Async mode returns at once; the result arrives as a run event
+        body: JSON.stringify({ ...params, mode: 'async' })
       });
 
       if (!response.ok) {
@@ -669,11 +725,20 @@ export default function CanvasPage() {
         throw new Error(errorData.message || errorData.detail || 'Failed to generate image');
       }
 
-      const result = await response.json();
+      let result = await response.json();
       
       if (!result || !result.inference_id) {
         throw new Error('Invalid response from server');
       }
+
+      if (result.status === 'processing') {
+        const event = await waitForInference(result.inference_id);
+        if (event.status !== 'completed') {
+          setInferenceResults(prev => prev.filter(inf => !inf.inference_id.startsWith(tempInferenceId)));
+          throw new Error(event.error || 'Failed to generate image');
+        }
+        result = { ...result, status: event.status, output_urls: event.output_urls };
+      }
       
       // Create separate entries for each output URL
       if (result.output_urls && result.output_urls.length > 0) {
@@ -1177,7 +1242,9 @@ export default function CanvasPage() {
                 {result.output_urls?.[0] ? (
                   <>
                     <img
-                      src={result.output_urls[0]}
+                      src={result.output_variants?.[0]?.['640'] || result.output_urls[0]}
+                      srcSet={variantSrcSet(result.output_variants?.[0])}
+                      sizes={galleryView === 'single' ? '(max-width: 768px) 100vw, 768px' : '(max-width: 640px) 100vw, 33vw'}
                       alt={result.parameters?.prompt}
                       className="w-full h-full object-cover rounded-lg"
                       loading="lazy"
@@ -26,7 +26,7 @@ interface FeedExamplesProps {
 
 export default function FeedExamples({ onSelectImage, galleryView, onLike, isLiked }: FeedExamplesProps) {
   const [examples, setExamples] = useState<FeedExample[]>([])
-  const [page, setPage] = useState(0)
+  const [cursor, setCursor] = useState<string | null>(null)
   const [hasMore, setHasMore] = useState(true)
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
@@ -49,7 +49,8 @@ export default function FeedExamples({ onSelectImage, galleryView, onLike, isLik
       const token = localStorage.getItem('token')
       if (!token) throw new Error('No authentication token found')
 
-      const response = await fetch(`${API_URL}/canvasinference/feed?page=${page}&limit=20`, {
+      const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''
+      const response = await fetch(`${API_URL}/canvasinference/feed?limit=20${cursorParam}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       })
 
@@ -64,7 +65,7 @@ export default function FeedExamples({ onSelectImage, galleryView, onLike, isLik
       
       setExamples(prev => [...prev, ...validExamples])
       setHasMore(data.has_more)
-      setPage(prev => prev + 1)
+      setCursor(data.next_cursor ?? null)
       setInitialLoadDone(true)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load examples')
@@ -72,7 +73,7 @@ export default function FeedExamples({ onSelectImage, galleryView, onLike, isLik
     } finally {
       setIsLoading(false)
     }
-  }, [page, isLoading, hasMore])
+  }, [cursor, isLoading, hasMore])
 
   // Load more when scrolling to bottom or on initial view
   useEffect(() => {
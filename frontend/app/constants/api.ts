@@ -13,6 +13,10 @@ export const ENDPOINTS = {
   CANVAS_INFERENCE: {
     CREATE: `${API_URL}/canvasinference/inference`,
     LIST: `${API_URL}/canvasinference/inferences`,
+    STATUS: (inferenceId: string) => `${API_URL}/canvasinference/inference/${inferenceId}/status`,
+  },
+  EVENTS: {
+    STREAM: `${API_URL}/events/stream`,
   },
   TRAINING: {
     POLL: `${API_URL}/training/poll-training-runs`,
@@ -20,6 +20,8 @@ export interface InferenceResult {
   inference_id: string;
   status: string;
   output_urls?: string[];
+  // Width -> resized WebP URL, one entry per output URL
+  output_variants?: Record<string, string>[];
   parameters?: {
     prompt: string;
     image_size: string;
@@ -1,11 +1,54 @@
 import { API_URL } from '../config/config';
 
 const CHUNK_SIZE = 2048 * 1024; // 2MB chunks
+const MAX_CHUNK_ATTEMPTS = 3;
+const UPLOAD_CONCURRENCY = 4; // Chunks in flight at once
 
 interface InitUploadResponse {
   upload_id: string;
 }
 
+interface UploadStatusResponse {
+  status: string;
+  files: Record<string, { received_chunks: number[] }>;
+}
+
+// Identifies a file selection so an interrupted upload can be resumed
+function uploadSessionKey(files: File[], modelName: string): string {
+  const signature = files.map(file => `${file.name}:${file.size}:${file.lastModified}`).join('|');
+  return `chunkUpload:${modelName}:${signature}`;
+}
+
+async function getResumableUpload(
+  sessionKey: string,
+  token: string
+): Promise<{ upload_id: string; received: Record<string, Set<number>> } | null> {
+  const upload_id = localStorage.getItem(sessionKey);
+  if (!upload_id) {
+    return null;
+  }
+  const response = await fetch(`${API_URL}/training/upload-status/${upload_id}`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+    credentials: 'include'
+  });
+  if (!response.ok) {
+    localStorage.removeItem(sessionKey);
+    return null;
+  }
+  const session = await response.json() as UploadStatusResponse;
+  if (session.status !== 'initialized' && session.status !== 'uploading') {
+    localStorage.removeItem(sessionKey);
+    return null;
+  }
+  const received: Record<string, Set<number>> = {};
+  for (const [fileIndex, file] of Object.entries(session.files)) {
+    received[fileIndex] = new Set(file.received_chunks);
+  }
+  return { upload_id, received };
+}
+
 export async function uploadInChunks(
   files: File[],
   modelName: string,
@@ -20,71 +63,110 @@ export async function uploadInChunks(
     // Calculate total size of all files
     const totalSize = files.reduce((sum, file) => sum + file.size, 0);
 
-    // Initialize upload with metadata
-    const initResponse = await fetch(
-      `${API_URL}/training/init-upload?file_count=${files.length}&total_size=${totalSize}&model_name=${encodeURIComponent(modelName)}`,
-      {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-        credentials: 'include'
+    // Resume a previous session for the same files, or initialize a new one
+    const sessionKey = uploadSessionKey(files, modelName);
+    const resumable = await getResumableUpload(sessionKey, token);
+    let upload_id: string;
+    let received: Record<string, Set<number>> = {};
+
+    if (resumable) {
+      upload_id = resumable.upload_id;
+      received = resumable.received;
+    } else {
+      const initResponse = await fetch(
+        `${API_URL}/training/init-upload?file_count=${files.length}&total_size=${totalSize}&model_name=${encodeURIComponent(modelName)}`,
+        {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${token}`,
+          },
+          credentials: 'include'
+        }
+      );
+
+      if (!initResponse.ok) {
+        const errorData = await initResponse.json();
+        throw new Error(errorData.detail || 'Failed to initialize upload');
       }
-    );
 
-    if (!initResponse.ok) {
-      const errorData = await initResponse.json();
-      throw new Error(errorData.detail || 'Failed to initialize upload');
+      upload_id = (await initResponse.json() as InitUploadResponse).upload_id;
+      localStorage.setItem(sessionKey, upload_id);
     }
 
-    const { upload_id } = await initResponse.json() as InitUploadResponse;
-
     // Calculate total size for progress tracking
     let totalUploaded = 0;
 
-    // Upload each file in chunks
+    // Collect every chunk the server does not have yet
+    const pending: { fileIndex: number; chunkIndex: number; totalChunks: number }[] = [];
     for (let fileIndex = 0; fileIndex < files.length; fileIndex++) {
-      const file = files[fileIndex];
-      let start = 0;
-      const totalChunks = Math.ceil(file.size / CHUNK_SIZE);
+      const totalChunks = Math.ceil(files[fileIndex].size / CHUNK_SIZE);
+      for (let chunkIndex = 0; chunkIndex < totalChunks; chunkIndex++) {
+        if (received[String(fileIndex)]?.has(chunkIndex)) {
+          totalUploaded += Math.min(CHUNK_SIZE, files[fileIndex].size - chunkIndex * CHUNK_SIZE);
+        } else {
+          pending.push({ fileIndex, chunkIndex, totalChunks });
+        }
+      }
+    }
+    onProgress((totalUploaded / totalSize) * 100);
 
-      while (start < file.size) {
-        const end = Math.min(start + CHUNK_SIZE, file.size);
-        const chunk = file.slice(start, end);
-        const chunkIndex = Math.floor(start / CHUNK_SIZE);
+    const uploadChunk = async ({ fileIndex, chunkIndex, totalChunks }: typeof pending[number]) => {
+      const file = files[fileIndex];
+      const start = chunkIndex * CHUNK_SIZE;
+      const chunk = file.slice(start, Math.min(start + CHUNK_SIZE, file.size));
 
+      let attempt = 0;
+      while (true) {
         const formData = new FormData();
         formData.append('file', chunk, file.name);
 
-        const uploadResponse = await fetch(
-          `${API_URL}/training/upload-chunk/${upload_id}?` +
-          `chunk_index=${chunkIndex}&` +
-          `file_index=${fileIndex}&` +
-          `total_chunks=${totalChunks}&` +
-          `filename=${encodeURIComponent(file.name)}`,
-          {
-            method: 'POST',
-            headers: {
-              'Authorization': `Bearer ${token}`,
-            },
-            body: formData,
-            credentials: 'include'
+        try {
+          const uploadResponse = await fetch(
+            `${API_URL}/training/upload-chunk/${upload_id}?` +
+            `chunk_index=${chunkIndex}&` +
+            `file_index=${fileIndex}&` +
+            `total_chunks=${totalChunks}&` +
+            `filename=${encodeURIComponent(file.name)}`,
+            {
+              method: 'POST',
+              headers: {
+                'Authorization': `Bearer ${token}`,
+              },
+              body: formData,
+              credentials: 'include'
+            }
+          );
+
+          if (!uploadResponse.ok) {
+            const errorData = await uploadResponse.json();
+            throw new Error(errorData.detail || `Failed to upload chunk ${chunkIndex} of file ${fileIndex}`);
           }
-        );
-
-        if (!uploadResponse.ok) {
-          const errorData = await uploadResponse.json();
-          throw new Error(errorData.detail || `Failed to upload chunk ${chunkIndex} of file ${fileIndex}`);
+          break;
+        } catch (error) {
+          // Retry dropped chunks; the session keeps what was already received
+          attempt += 1;
+          if (attempt >= MAX_CHUNK_ATTEMPTS) {
+            throw error;
+          }
+          await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
         }
+      }
 
-        // Update progress
-        totalUploaded += chunk.size;
-        const progress = (totalUploaded / totalSize) * 100;
-        onProgress(progress);
+      // Update progress
+      totalUploaded += chunk.size;
+      onProgress((totalUploaded / totalSize) * 100);
+    };
 
-        start += CHUNK_SIZE;
+    // Chunks are recorded atomically server-side, so they can be sent in parallel
+    let next = 0;
+    const workers = Array.from({ length: Math.min(UPLOAD_CONCURRENCY, pending.length) }, async () => {
+      while (next < pending.length) {
+        await uploadChunk(pending[next++]);
       }
-    }
+    });
+    await Promise.all(workers);
+
+    localStorage.removeItem(sessionKey);
 
     // The backend will automatically process the upload and start training
     // when all chunks are received, so we don't need to call upload-and-train
@@ -0,0 +1,7 @@
+// srcSet for a tile from its resized variants, or undefined to use the original
+export const variantSrcSet = (variants?: Record<string, string>): string | undefined => {
+  if (!variants || Object.keys(variants).length === 0) return undefined;
+  return Object.entries(variants)
+    .map(([width, url]) => `${url} ${width}w`)
+    .join(', ');
+};
@@ -0,0 +1,70 @@
+import { ENDPOINTS } from '../constants/api';
+
+export interface RunEvent {
+  type: 'inference' | 'training';
+  id: string;
+  status: string;
+  error?: string | null;
+  output_urls?: string[];
+  model_name?: string;
+  version?: string;
+}
+
+export const TERMINAL_RUN_STATUSES = ['completed', 'failed', 'succeeded', 'canceled', 'error'];
+
+// Subscribe to status transitions of the current user's inference and training runs.
+// The browser reconnects automatically when the server ends a stream; onUnavailable is
+// called if streaming is unsupported or the browser gives up, so callers can fall back to polling.
+// Returns a function that closes the stream.
+export function subscribeToRunEvents(
+  onEvent: (event: RunEvent) => void,
+  onSnapshot?: (runs: RunEvent[]) => void,
+  onUnavailable?: () => void
+): () => void {
+  const token = localStorage.getItem('token');
+  if (!token || typeof EventSource === 'undefined') {
+    onUnavailable?.();
+    return () => {};
+  }
+
+  const source = new EventSource(`${ENDPOINTS.EVENTS.STREAM}?token=${encodeURIComponent(token)}`);
+
+  source.addEventListener('snapshot', (message) => {
+    const { runs } = JSON.parse((message as MessageEvent).data) as { runs: RunEvent[] };
+    onSnapshot?.(runs);
+  });
+  const handleRunEvent = (message: Event) => {
+    onEvent(JSON.parse((message as MessageEvent).data) as RunEvent);
+  };
+  source.addEventListener('inference', handleRunEvent);
+  source.addEventListener('training', handleRunEvent);
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) {
+      onUnavailable?.();
+    }
+  };
+
+  return () => source.close();
+}
+
+// One status check of an inference; the polling fallback when no event arrives
+export async function fetchInferenceStatus(inferenceId: string): Promise<RunEvent | null> {
+  const token = localStorage.getItem('token');
+  if (!token) {
+    return null;
+  }
+  const response = await fetch(ENDPOINTS.CANVAS_INFERENCE.STATUS(inferenceId), {
+    headers: { 'Authorization': `Bearer ${token}` }
+  });
+  if (!response.ok) {
+    return null;
+  }
+  const data = await response.json();
+  return {
+    type: 'inference',
+    id: data.inference_id,
+    status: data.status,
+    error: data.error,
+    output_urls: data.output_urls
+  };
+}